@@ -0,0 +1,107 @@
+"""Compara o LRUFlows atual (OrderedDict) com a implementação antiga baseada em lista.
+
+Uso: python -m lokiproxy.benchmarks.flows [--sizes 2000,100000,1000000] [--ops 2000]
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from typing import Dict, List, Optional
+from ..core.flows import Flow, LRUFlows
+
+
+class ListLRUFlows:
+    """Implementação original (lista + pop(0)/remove), mantida só para comparação"""
+
+    def __init__(self, capacity: int = 2000):
+        self.capacity = capacity
+        self._flows: Dict[int, Flow] = {}
+        self._order: List[int] = []
+        self._id_counter = itertools.count(1)
+
+    def new_flow(self) -> Flow:
+        fid = next(self._id_counter)
+        flow = Flow(id=fid)
+        self._flows[fid] = flow
+        self._order.append(fid)
+        self._shrink_if_needed()
+        return flow
+
+    def _shrink_if_needed(self):
+        while len(self._order) > self.capacity:
+            old_id = self._order.pop(0)
+            self._flows.pop(old_id, None)
+
+    def get(self, fid: int) -> Optional[Flow]:
+        return self._flows.get(fid)
+
+    def all(self) -> List[Flow]:
+        return [self._flows[i] for i in self._order if i in self._flows]
+
+    def update(self, flow: Flow):
+        if flow.id in self._flows:
+            try:
+                self._order.remove(flow.id)
+            except ValueError:
+                pass
+            self._order.append(flow.id)
+            self._flows[flow.id] = flow
+
+
+def _time_per_op(fn, ops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def bench(store_cls, size: int, ops: int, seed: int = 0) -> Dict[str, float]:
+    rnd = random.Random(seed)
+    store = store_cls(size)
+    t0 = time.perf_counter()
+    for _ in range(size):
+        store.new_flow()
+    fill_s = time.perf_counter() - t0
+
+    next_id = [size]
+
+    def random_flow():
+        # ids vivos ficam sempre no intervalo (último - size, último]
+        last = next_id[0]
+        return store.get(rnd.randint(last - size + 1, last))
+
+    def do_new():
+        next_id[0] = store.new_flow().id
+
+    def do_update():
+        f = random_flow()
+        if f is not None:
+            store.update(f)
+
+    def do_get():
+        random_flow()
+
+    result = {
+        "fill_s": round(fill_s, 4),
+        "new_flow_us": _time_per_op(do_new, ops),
+        "update_us": _time_per_op(do_update, ops),
+        "get_us": _time_per_op(do_get, ops),
+        "all_ms": _time_per_op(store.all, 3) / 1000,
+    }
+    return {k: round(v, 3) for k, v in result.items()}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--sizes", default="2000,100000,1000000")
+    p.add_argument("--ops", default=2000, type=int)
+    args = p.parse_args()
+    for size in (int(s) for s in args.sizes.split(",")):
+        for name, cls in (("list", ListLRUFlows), ("ordereddict", LRUFlows)):
+            row = {"impl": name, "size": size, **bench(cls, size, args.ops)}
+            print(json.dumps(row), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Leitura das cabeças de requisição: readline por linha (antigo) contra readuntil + parse.
+
+Alimenta um StreamReader com N requisições pipelined típicas de navegador e mede o tempo
+para ler e interpretar todas, incluindo as buscas de host, framing e Connection que o
+proxy faz em seguida.
+
+Uso: python -m lokiproxy.benchmarks.headers [--requests 100000]
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List, Tuple
+from ..core.http1 import read_request_head
+from ..core.streaming import body_framing
+from .memory import UA
+
+
+def _request(i: int) -> bytes:
+    return (b"GET http://cdn%d.example.com/static/img/%d.png HTTP/1.1\r\nHost: cdn%d.example.com\r\n"
+            b"User-Agent: %s\r\nAccept: image/avif,image/webp,image/apng,image/*,*/*;q=0.8\r\n"
+            b"Accept-Language: en-US,en;q=0.9\r\nAccept-Encoding: gzip, deflate, br\r\n"
+            b"Connection: keep-alive\r\nReferer: https://www.example.com/page/%d\r\n"
+            b"Cookie: session=%08x; theme=dark\r\nSec-Fetch-Dest: image\r\n"
+            b"Sec-Fetch-Mode: no-cors\r\nSec-Fetch-Site: same-site\r\n\r\n"
+            % (i % 50, i, i % 50, UA.encode(), i % 200, i))
+
+
+async def legacy(reader: asyncio.StreamReader, n: int) -> None:
+    """O laço original do ProxyServer: readline por linha, split e buscas lineares"""
+    for _ in range(n):
+        line = await reader.readline()
+        parts = line.decode("iso-8859-1").strip().split(" ", 2)
+        headers: List[Tuple[str, str]] = []
+        while True:
+            h = await reader.readline()
+            if not h or h in (b"\r\n", b"\n"):
+                break
+            k, v = h.decode("iso-8859-1").split(":", 1)
+            headers.append((k.strip(), v.strip()))
+        next((v for (k, v) in headers if k.lower() == "host"), "")
+        body_framing(headers)
+        [v for k, v in headers if k.lower() in ("connection", "proxy-connection")]
+        assert parts[0] == "GET"
+
+
+async def readuntil(reader: asyncio.StreamReader, n: int) -> None:
+    for _ in range(n):
+        head = await read_request_head(reader)
+        head.get("host")
+        head.framing()
+        head.keep_alive
+        assert head.method == "GET"
+
+
+async def measure(impl, payload: bytes, n: int) -> float:
+    reader = asyncio.StreamReader(limit=len(payload) + 1)
+    reader.feed_data(payload)
+    reader.feed_eof()
+    t0 = time.perf_counter()
+    await impl(reader, n)
+    return time.perf_counter() - t0
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--requests", default=100000, type=int)
+    args = p.parse_args()
+    payload = b"".join(_request(i) for i in range(args.requests))
+    for name, impl in (("readline", legacy), ("readuntil", readuntil)):
+        elapsed = asyncio.run(measure(impl, payload, args.requests))
+        print(json.dumps({"impl": name, "requests": args.requests,
+                          "us_per_request": round(elapsed / args.requests * 1e6, 2)}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Carga no caminho de dados do ProxyServer com origens locais.
+
+O proxy roda neste processo (é dele a RSS e a profundidade do bus medidas); a origem e os
+clientes rodam num processo filho (spawn), para não disputar o mesmo loop. A origem serve:
+
+    /fixed    1 KiB com Content-Length
+    /chunked  64 KiB em 16 chunks
+    /large    1 MiB com Content-Length
+    /slow     1 KiB depois de --slow-ms
+
+Cada cenário combina modo (http: URL absoluta pelo proxy; connect: túnel CONNECT e
+requisições dentro dele), keep-alive (on/off) e resposta. Um consumidor faz o papel da GUI
+e esvazia a fila do bus (com --consumer-delay-ms por evento, simula uma GUI lenta).
+
+Cada cenário vira uma linha JSON: vazão, latências (p50/p90/p99/max e histograma em ms),
+RSS do proxy e profundidade do bus. --out grava as linhas num arquivo; --compare lê um
+arquivo anterior e acrescenta a variação de req/s e p99 por cenário.
+
+Uso: python -m lokiproxy.benchmarks.load [--modes http,connect] [--keepalive on,off]
+         [--responses fixed,chunked,large,slow] [--concurrency 50] [--duration 3]
+         [--out run.jsonl] [--compare base.jsonl]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import multiprocessing
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+from ..core.bus import EventBus
+from ..core.proxy import ProxyServer
+
+RESPONSES = ("fixed", "chunked", "large", "slow")
+# limites superiores dos baldes do histograma de latência, em ms (o último é +inf)
+BUCKETS_MS = (0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_FIXED = b"x" * 1024
+_CHUNK = b"c" * 4096
+_LARGE = b"L" * (1024 * 1024)
+
+
+# origem
+
+async def _origin(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, slow_ms: float) -> None:
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            path = head.split(b" ", 2)[1]
+            close = b"connection: close" in head.lower()
+            conn = b"Connection: close\r\n" if close else b""
+            if path == b"/chunked":
+                writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n%s\r\n" % conn)
+                for _ in range(16):
+                    writer.write(b"%x\r\n%s\r\n" % (len(_CHUNK), _CHUNK))
+                writer.write(b"0\r\n\r\n")
+            else:
+                if path == b"/slow":
+                    await asyncio.sleep(slow_ms / 1000)
+                body = _LARGE if path == b"/large" else _FIXED
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n" % (len(body), conn))
+                writer.write(body)
+            await writer.drain()
+            if close:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+# clientes
+
+async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, bool]:
+    """Lê uma resposta inteira; devolve (bytes do corpo, conexão fechada pelo servidor)"""
+    head = (await reader.readuntil(b"\r\n\r\n")).lower()
+    status = int(head.split(b" ", 2)[1])
+    if status != 200:
+        raise RuntimeError(f"status {status}")
+    close = b"connection: close" in head
+    if b"transfer-encoding: chunked" in head:
+        n = 0
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                return n, close
+            n += size
+    for line in head.split(b"\r\n"):
+        if line.startswith(b"content-length:"):
+            n = int(line.split(b":", 1)[1])
+            await reader.readexactly(n)
+            return n, close
+    return len(await reader.read()), True
+
+
+async def _open(proxy_port: int, origin_port: int, mode: str):
+    reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    if mode == "connect":
+        writer.write(b"CONNECT 127.0.0.1:%d HTTP/1.1\r\nHost: 127.0.0.1:%d\r\n\r\n" % (origin_port, origin_port))
+        status = (await reader.readuntil(b"\r\n\r\n")).split(b" ", 2)[1]
+        if status != b"200":
+            raise RuntimeError(f"CONNECT refused ({status.decode()})")
+    return reader, writer
+
+
+async def _client(proxy_port: int, origin_port: int, scenario: Dict[str, Any], deadline: float,
+                  latencies: List[float], counters: Dict[str, int]) -> None:
+    mode, keepalive = scenario["mode"], scenario["keepalive"]
+    target = b"/" + scenario["response"].encode()
+    if mode == "http":
+        target = b"http://127.0.0.1:%d%s" % (origin_port, target)
+    request = (b"GET %s HTTP/1.1\r\nHost: 127.0.0.1:%d\r\n%s\r\n"
+               % (target, origin_port, b"" if keepalive else b"Connection: close\r\n"))
+    conn = None
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        t0 = time.perf_counter()
+        try:
+            if conn is None:
+                conn = await _open(proxy_port, origin_port, mode)
+            reader, writer = conn
+            writer.write(request)
+            n, closed = await _read_response(reader)
+        except (OSError, RuntimeError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+            counters["errors"] += 1
+            counters.setdefault("first_error", repr(e))
+            if conn is not None:
+                conn[1].close()
+                conn = None
+            continue
+        latencies.append((time.perf_counter() - t0) * 1000)
+        counters["bytes"] += n
+        if closed or not keepalive:
+            writer.close()
+            conn = None
+    if conn is not None:
+        conn[1].close()
+
+
+def histogram(latencies: List[float]) -> List[List[Any]]:
+    """[[limite superior em ms ou "inf", contagem], ...] a partir de latências ordenadas"""
+    out, start = [], 0
+    for bound in BUCKETS_MS:
+        end = bisect_left(latencies, bound, lo=start)
+        out.append([bound, end - start])
+        start = end
+    out.append(["inf", len(latencies) - start])
+    return out
+
+
+def _pct(latencies: List[float], p: float) -> Optional[float]:
+    if not latencies:
+        return None
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 3)
+
+
+async def _load(proxy_port: int, scenario: Dict[str, Any], concurrency: int, duration: float,
+                slow_ms: float) -> Dict[str, Any]:
+    origin = await asyncio.start_server(lambda r, w: _origin(r, w, slow_ms), "127.0.0.1", 0)
+    origin_port = origin.sockets[0].getsockname()[1]
+    latencies: List[float] = []
+    counters = {"errors": 0, "bytes": 0}
+    try:
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        await asyncio.gather(*(_client(proxy_port, origin_port, scenario, t0 + duration, latencies, counters)
+                               for _ in range(concurrency)))
+        elapsed = loop.time() - t0
+    finally:
+        origin.close()
+    latencies.sort()
+    result = {"requests": len(latencies), "errors": counters["errors"], "seconds": round(elapsed, 3),
+              "req_per_s": round(len(latencies) / elapsed, 1),
+              "MB_per_s": round(counters["bytes"] / elapsed / 1e6, 2),
+              "latency_ms": {"p50": _pct(latencies, 0.50), "p90": _pct(latencies, 0.90),
+                             "p99": _pct(latencies, 0.99),
+                             "max": round(latencies[-1], 3) if latencies else None},
+              "histogram_ms": histogram(latencies)}
+    if "first_error" in counters:
+        result["first_error"] = counters["first_error"]
+    return result
+
+
+def _load_process(conn, *args) -> None:
+    """Ponto de entrada do processo de carga: devolve o resultado pelo Pipe"""
+    conn.send(asyncio.run(_load(*args)))
+    conn.close()
+
+
+# proxy
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # sem /proc: pico da RSS (KiB no Linux, bytes no macOS)
+        import resource, sys
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+async def bench(scenario: Dict[str, Any], concurrency: int, duration: float, slow_ms: float = 50,
+                consumer_delay_ms: float = 0, **proxy_opts) -> Dict[str, Any]:
+    bus = EventBus()
+    proxy = ProxyServer(port=0, bus=bus, stats_interval=3600, **proxy_opts)
+    bus.proxy = proxy
+    server = await proxy.start()
+
+    async def consume():
+        # o papel da GUI: esvazia a fila core→GUI
+        async for _ in bus.subscribe_gui():
+            if consumer_delay_ms:
+                await asyncio.sleep(consumer_delay_ms / 1000)
+
+    depths: List[int] = []
+    rss_peak = rss_before = rss_bytes()
+
+    async def sample():
+        nonlocal rss_peak
+        while True:
+            await asyncio.sleep(0.1)
+            depths.append(bus.depth)
+            rss_peak = max(rss_peak, rss_bytes())
+
+    tasks = [asyncio.create_task(consume()), asyncio.create_task(sample())]
+    parent, child = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.get_context("spawn").Process(
+        target=_load_process, args=(child, proxy.port, scenario, concurrency, duration, slow_ms))
+    try:
+        proc.start()
+        child.close()
+        result = await asyncio.to_thread(parent.recv)
+        await asyncio.to_thread(proc.join)
+    finally:
+        for t in tasks:
+            t.cancel()
+        server.close()
+        await proxy.close()
+    result["rss_mb"] = {"before": round(rss_before / 2**20, 1), "peak": round(rss_peak / 2**20, 1),
+                        "after": round(rss_bytes() / 2**20, 1)}
+    result["bus"] = {"depth_max": bus.stats.max_depth,
+                     "depth_mean": round(sum(depths) / len(depths), 1) if depths else 0,
+                     "dropped": bus.stats.dropped, "coalesced": bus.stats.coalesced}
+    result["flows"] = len(proxy.flows)
+    return result
+
+
+def scenario_name(s: Dict[str, Any]) -> str:
+    return f"{s['mode']}-{'ka' if s['keepalive'] else 'close'}-{s['response']}"
+
+
+def _compare(row: Dict[str, Any], base: Dict[str, Any]) -> Dict[str, Any]:
+    def delta(new, old):
+        return round((new - old) / old * 100, 1) if new is not None and old else None
+    return {"req_per_s_pct": delta(row["req_per_s"], base.get("req_per_s")),
+            "p99_pct": delta(row["latency_ms"]["p99"], (base.get("latency_ms") or {}).get("p99"))}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--modes", default="http,connect")
+    p.add_argument("--keepalive", default="on,off")
+    p.add_argument("--responses", default=",".join(RESPONSES))
+    p.add_argument("--concurrency", default=50, type=int, help="Concurrent client connections")
+    p.add_argument("--duration", default=3.0, type=float, help="Seconds per scenario")
+    p.add_argument("--slow-ms", default=50.0, type=float, help="Origin delay for /slow")
+    p.add_argument("--consumer-delay-ms", default=0.0, type=float,
+                   help="Per-event delay of the simulated GUI consumer")
+    p.add_argument("--no-stream", action="store_true", help="Buffer bodies instead of streaming them")
+    p.add_argument("--no-search-index", action="store_true")
+    p.add_argument("--out", default=None, help="Also write the JSON lines to this file")
+    p.add_argument("--compare", default=None, metavar="JSONL",
+                   help="Previous --out file; adds the change in req/s and p99 per scenario")
+    args = p.parse_args()
+
+    base = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fp:
+            rows = [json.loads(line) for line in fp if line.strip()]
+        base = {r["scenario"]: r for r in rows}
+    out = open(args.out, "w", encoding="utf-8") if args.out else None
+    try:
+        for mode, ka, resp in itertools.product(args.modes.split(","), args.keepalive.split(","),
+                                                args.responses.split(",")):
+            scenario = {"mode": mode, "keepalive": ka == "on", "response": resp}
+            row = {"scenario": scenario_name(scenario), **scenario, "concurrency": args.concurrency,
+                   **asyncio.run(bench(scenario, args.concurrency, args.duration, args.slow_ms,
+                                       args.consumer_delay_ms, stream_bodies=not args.no_stream,
+                                       search_index=not args.no_search_index))}
+            if row["scenario"] in base:
+                row["vs_base"] = _compare(row, base[row["scenario"]])
+            line = json.dumps(row)
+            print(line, flush=True)
+            if out is not None:
+                out.write(line + "\n")
+    finally:
+        if out is not None:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Mede bytes por flow (sem corpos) para N flows típicos de navegador.
+
+Compara a representação antiga (dataclasses com __dict__ e strings de header por flow)
+com Flow/Message atuais, com headers já parseados e como o ProxyServer guarda: o bloco bruto
+dos headers da requisição (RequestHead.raw) e os da resposta em tuplas.
+
+Uso: python -m lokiproxy.benchmarks.memory [--flows 100000]
+"""
+import argparse
+import gc
+import sys
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from ..core.flows import Flow
+
+
+@dataclass
+class LegacyMessage:
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    body: bytes = b""
+    http_version: str = "1.1"
+
+
+@dataclass
+class LegacyFlow:
+    id: int
+    method: str = ""
+    scheme: str = "http"
+    host: str = ""
+    port: int = 80
+    path: str = "/"
+    status_code: Optional[int] = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    request: LegacyMessage = field(default_factory=LegacyMessage)
+    response: LegacyMessage = field(default_factory=LegacyMessage)
+    error: Optional[str] = None
+    size: int = 0
+
+
+UA = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+      "Chrome/126.0.0.0 Safari/537.36")
+
+
+def _raw_request(i: int) -> Tuple[bytes, bytes]:
+    host = b"cdn%d.example.com" % (i % 50)
+    head = (b"Host: %s\r\nUser-Agent: %s\r\nAccept: text/html,application/xhtml+xml,*/*;q=0.8\r\n"
+            b"Accept-Language: en-US,en;q=0.9\r\nAccept-Encoding: gzip, deflate, br\r\n"
+            b"Connection: keep-alive\r\nReferer: https://www.example.com/page/%d\r\n"
+            b"Cookie: session=%08x; theme=dark\r\nSec-Fetch-Dest: image\r\n"
+            b"Sec-Fetch-Mode: no-cors\r\nSec-Fetch-Site: same-site\r\n"
+            % (host, UA.encode(), i % 200, i))
+    resp = (b"Date: Tue, 01 Oct 2024 12:%02d:%02d GMT\r\nContent-Type: image/png\r\n"
+            b"Content-Length: %d\r\nCache-Control: public, max-age=31536000\r\n"
+            b"ETag: \"%08x\"\r\nServer: nginx\r\nVary: Accept-Encoding\r\n"
+            % (i // 60 % 60, i % 60, 1000 + i % 5000, i))
+    return head, resp
+
+
+def _lines(raw: bytes) -> List[Tuple[str, str]]:
+    # como o leitor de headers original: uma string nova por linha, por flow
+    out = []
+    for line in raw.split(b"\r\n"):
+        if line:
+            k, v = line.decode("iso-8859-1").split(":", 1)
+            out.append((k.strip(), v.strip()))
+    return out
+
+
+def build_legacy(i, req, resp):
+    f = LegacyFlow(id=i, method=b"GET".decode("ascii"), host=("cdn%d.example.com" % (i % 50)),
+                   path=f"/static/img/{i}.png", status_code=200, size=1000)
+    f.request.headers = _lines(req)
+    f.response.headers = _lines(resp)
+    return f
+
+
+# ProxyServer interna método e host ao criar o flow
+def build_parsed(i, req, resp):
+    f = Flow(id=i, method=sys.intern(b"GET".decode("ascii")), host=sys.intern("cdn%d.example.com" % (i % 50)),
+             path=f"/static/img/{i}.png", status_code=200, size=1000)
+    f.request.headers = _lines(req)
+    f.response.headers = _lines(resp)
+    return f
+
+
+# a resposta chega do httpcore já em tuplas; só a requisição fica como bloco bruto
+def build_raw(i, req, resp):
+    f = Flow(id=i, method=sys.intern(b"GET".decode("ascii")), host=sys.intern("cdn%d.example.com" % (i % 50)),
+             path=f"/static/img/{i}.png", status_code=200, size=1000)
+    f.request.set_raw_headers(req)
+    f.response.headers = _lines(resp)
+    return f
+
+
+def measure(builder, n: int) -> float:
+    raws = [_raw_request(i) for i in range(n)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    flows = [builder(i, req, resp) for i, (req, resp) in enumerate(raws)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del flows
+    return (after - before) / n
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--flows", default=100000, type=int)
+    args = p.parse_args()
+    for name, builder in (("legacy", build_legacy), ("slots+interned", build_parsed),
+                          ("slots+raw-request-headers", build_raw)):
+        print(json.dumps({"repr": name, "flows": args.flows,
+                          "bytes_per_flow": round(measure(builder, args.flows))}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Vazão do túnel CONNECT: implementação por transports (atual) contra a antiga com streams.
+
+Um servidor de eco local responde tudo o que recebe; o cliente abre o CONNECT pelo proxy,
+envia --megabytes e lê o eco ao mesmo tempo.
+
+Uso: python -m lokiproxy.benchmarks.tunnel [--megabytes 256] [--connections 1,8]
+"""
+import argparse
+import asyncio
+import json
+import time
+from ..core.bus import EventBus
+from ..core.flows import Flow
+from ..core.proxy import ProxyServer
+
+CHUNK = 256 * 1024
+
+
+class StreamTunnelProxy(ProxyServer):
+    """_tunnel original (read/write/drain por bloco de 64 KB), mantido só para comparação"""
+
+    async def _tunnel(self, reader, writer, flow: Flow, host, port):
+        writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+        await writer.drain()
+        try:
+            remote_reader, remote_writer = await asyncio.open_connection(host, port)
+        except Exception:
+            writer.close(); await writer.wait_closed(); return
+
+        async def pipe(src, dst):
+            try:
+                while True:
+                    data = await src.read(65536)
+                    if not data:
+                        break
+                    dst.write(data)
+                    await dst.drain()
+            except Exception:
+                pass
+            finally:
+                try:
+                    dst.close()
+                    await dst.wait_closed()
+                except Exception:
+                    pass
+
+        await asyncio.gather(pipe(reader, remote_writer), pipe(remote_reader, writer))
+
+
+async def _echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    while True:
+        data = await reader.read(CHUNK)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def _client(proxy_port: int, origin_port: int, total: int) -> None:
+    r, w = await asyncio.open_connection("127.0.0.1", proxy_port)
+    w.write(b"CONNECT 127.0.0.1:%d HTTP/1.1\r\n\r\n" % origin_port)
+    await r.readuntil(b"\r\n\r\n")
+    block = b"x" * CHUNK
+
+    async def send():
+        sent = 0
+        while sent < total:
+            w.write(block)
+            await w.drain()
+            sent += len(block)
+
+    async def receive():
+        got = 0
+        while got < total:
+            data = await r.read(CHUNK)
+            if not data:
+                raise RuntimeError(f"tunnel closed after {got} bytes")
+            got += len(data)
+
+    await asyncio.gather(send(), receive())
+    w.close()
+
+
+async def bench(proxy_cls, megabytes: int, connections: int) -> dict:
+    origin = await asyncio.start_server(_echo, "127.0.0.1", 0)
+    origin_port = origin.sockets[0].getsockname()[1]
+    proxy = proxy_cls(port=0, bus=EventBus(), stats_interval=3600)
+    server = await proxy.start()
+    per_conn = megabytes * 1024 * 1024 // connections
+    try:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_client(proxy.port, origin_port, per_conn) for _ in range(connections)))
+        elapsed = time.perf_counter() - t0
+    finally:
+        server.close()
+        await proxy.close()
+        origin.close()
+    moved = 2 * per_conn * connections
+    return {"seconds": round(elapsed, 3), "MB_per_s": round(moved / elapsed / 1e6, 1)}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--megabytes", default=256, type=int, help="Bytes sent through the tunnel (echoed back)")
+    p.add_argument("--connections", default="1,8")
+    args = p.parse_args()
+    for conns in (int(c) for c in args.connections.split(",")):
+        for name, cls in (("streams", StreamTunnelProxy), ("transports", ProxyServer)):
+            row = {"impl": name, "connections": conns, **asyncio.run(bench(cls, args.megabytes, conns))}
+            print(json.dumps(row), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,12 +15,120 @@ async def run_proxy(args, bus: EventBus):
     bus.proxy = proxy
     await proxy.serve()
 
+def _proxy_opts(args) -> dict:
+    return dict(host=args.host, port=args.port,
+                max_conns_per_host=args.max_conns_per_host,
+                idle_timeout=args.idle_timeout, http2=args.http2,
+                client_idle_timeout=args.client_idle_timeout,
+                max_requests_per_conn=args.max_requests_per_conn,
+                stream_bodies=not args.no_stream, capture_limit=args.capture_limit,
+                spill_dir=args.spill_dir, merge_rule_regexes=args.merge_rule_regexes,
+                max_flows=args.max_flows, max_flow_bytes=args.max_flow_bytes,
+                body_store_threshold=args.body_store_threshold, body_store_dir=args.body_store_dir,
+                capture_path=args.capture, capture_compression=args.capture_compression,
+                mitm=args.mitm, cert_dir=args.cert_dir, leaf_key_type=args.leaf_key,
+                shared_leaf_key=not args.no_shared_leaf_key, wildcard_certs=not args.no_wildcard_certs,
+                upstream_verify=not args.insecure_upstream, search_index=not args.no_search_index,
+                dns_ttl=args.dns_ttl, dns_negative_ttl=args.dns_negative_ttl,
+                dns_hosts=_dns_hosts(args.resolve), happy_eyeballs_delay=args.happy_eyeballs_delay,
+                intercept_filter=args.intercept_filter, intercept_timeout=args.intercept_timeout,
+                intercept_default=args.intercept_default, max_paused=args.max_paused,
+                max_queued=args.max_queued)
+
+def _dns_hosts(entries) -> dict:
+    """--resolve HOST=IP[,IP...] (repetível) -> {host: [ip, ...]}"""
+    hosts = {}
+    for entry in entries or []:
+        name, sep, ips = entry.partition("=")
+        if not sep or not name or not ips:
+            raise SystemExit(f"--resolve expects HOST=IP[,IP...], got {entry!r}")
+        hosts.setdefault(name, []).extend(ip.strip() for ip in ips.split(","))
+    return hosts
+
 def cmd_run(args):
-    bus = EventBus()
+    bus = EventBus(batch_interval=args.event_batch_ms / 1000)
+    if args.workers > 1 and (args.core != "inline" or args.attach):
+        raise SystemExit("--workers is only supported with --core inline (or the serve command)")
+    if args.core == "headless":
+        # só o core e o transporte IPC; a GUI pode se conectar depois com --attach
+        import secrets
+        from .core.ipc import default_address, is_tcp, run_core
+        address = args.ipc or default_address()
+        token = args.ipc_token or (secrets.token_urlsafe(24) if is_tcp(address) else None)
+        print(f"Proxy em {args.host}:{args.port}, core IPC em {address}", flush=True)
+        if token is not None:
+            print(f"Token do core IPC: {token}", flush=True)
+        run_core(address, {"batch_interval": bus.batch_interval}, token, **_proxy_opts(args))
+        return
     #loop = asyncio.get_event_loop()
     #loop.create_task(run_proxy(args, bus))
     from .gui.main import main as gui_main
-    gui_main(bus)
+    gui_main(bus, core=args.core, ipc=args.ipc, attach=args.attach, ipc_token=args.ipc_token,
+             workers=args.workers, **_proxy_opts(args))
+
+def cmd_serve(args):
+    from .core.control import serve
+    host, _, port = args.control.rpartition(":")
+    try:
+        asyncio.run(serve(host or "127.0.0.1", int(port), {"batch_interval": args.event_batch_ms / 1000},
+                          intercept=args.intercept, workers=args.workers,
+                          control_token=args.control_token, **_proxy_opts(args)))
+    except KeyboardInterrupt:
+        pass
+
+def cmd_capture_list(args):
+    from .core.capture import CaptureReader
+    flt = None
+    if args.query:
+        from .core.filters import FlowFilter
+        flt = FlowFilter(args.query)
+    reader = CaptureReader(args.file)
+    try:
+        for e in reader.filter(host=args.host, method=args.method, status=args.status):
+            if flt is not None and not flt.matches(e):
+                continue
+            dur = e.duration_ms if e.duration_ms is not None else "-"
+            print(f"{e.id:>7} {e.method:<7} {e.status_code or '-':>3} {e.size:>10} {dur:>7}ms  {e.host}{e.path if e.path.startswith('/') else ''}")
+    finally:
+        reader.close()
+
+def cmd_capture_open(args):
+    from .gui.capture_view import main as capture_main
+    capture_main(args.file)
+
+def cmd_har_export(args):
+    from .core.capture import CaptureReader
+    from .core.har import export_har
+    reader = CaptureReader(args.capture)
+    try:
+        flows = (reader.load(e.id) for e in reader.entries)
+        with open(args.har, "w", encoding="utf-8") as fp:
+            n = export_har(flows, fp)
+    finally:
+        reader.close()
+    print(f"{n} flows exportados para {args.har}")
+
+def cmd_har_import(args):
+    import os
+    from .core.capture import CaptureReader, CaptureWriter
+    from .core.flows import Flow
+    from .core.har import iter_har_entries, entry_to_flow
+    # ids continuam após os da captura existente para não colidir no índice
+    start = 0
+    if os.path.exists(args.capture) and os.path.getsize(args.capture):
+        reader = CaptureReader(args.capture)
+        start = max((e.id for e in reader.entries), default=0)
+        reader.close()
+    writer = CaptureWriter(args.capture, compression=args.compression)
+    n = 0
+    try:
+        with open(args.har, "r", encoding="utf-8") as fp:
+            for entry in iter_har_entries(fp):
+                n += 1
+                writer.write(entry_to_flow(entry, Flow(id=start + n)))
+    finally:
+        asyncio.run(writer.close())
+    print(f"{n} flows importados para {args.capture}")
 
 def main():
     p = argparse.ArgumentParser(prog="lokiproxy", description="HuginProxy MVP")
@@ -30,15 +138,134 @@ def main():
     p_ca_sub = p_ca.add_subparsers(dest="subcmd", required=True)
     p_ca_sub.add_parser("init", help="Generate local CA")
 
-    p_run = sub.add_parser("run", help="Run proxy + GUI")
-    p_run.add_argument("--host", default="127.0.0.1")
-    p_run.add_argument("--port", default=8080, type=int)
+    # opções do proxy, comuns a run e serve
+    proxy_args = argparse.ArgumentParser(add_help=False)
+    proxy_args.add_argument("--host", default="127.0.0.1")
+    proxy_args.add_argument("--port", default=8080, type=int)
+    proxy_args.add_argument("--max-conns-per-host", default=10, type=int,
+                            help="Max upstream connections per origin")
+    proxy_args.add_argument("--idle-timeout", default=30.0, type=float,
+                            help="Seconds before an idle upstream connection is closed")
+    proxy_args.add_argument("--http2", action="store_true", help="Negotiate HTTP/2 with origins (requires h2)")
+    proxy_args.add_argument("--client-idle-timeout", default=60.0, type=float,
+                            help="Seconds to wait for the next request on a keep-alive client connection")
+    proxy_args.add_argument("--max-requests-per-conn", default=1000, type=int,
+                            help="Requests served on one client connection before closing it")
+    proxy_args.add_argument("--no-stream", action="store_true",
+                            help="Buffer whole request/response bodies instead of streaming them")
+    proxy_args.add_argument("--capture-limit", default=1024 * 1024, type=int,
+                            help="Bytes of each streamed body kept on the flow")
+    proxy_args.add_argument("--spill-dir", default=None,
+                            help="Write body bytes beyond --capture-limit to files in this directory")
+    proxy_args.add_argument("--merge-rule-regexes", action="store_true",
+                            help="Evaluate all rule url_regex patterns in a single combined regex")
+    proxy_args.add_argument("--max-flows", default=2000, type=int, help="Flows kept in memory")
+    proxy_args.add_argument("--max-flow-bytes", default=None, type=int,
+                            help="Evict old flows once in-memory bodies exceed this many bytes")
+    proxy_args.add_argument("--body-store-threshold", default=None, type=int,
+                            help="Move captured bodies larger than this to disk (loaded lazily)")
+    proxy_args.add_argument("--body-store-dir", default=None,
+                            help="Directory for body segments (default: ~/.lokiproxy/sessions/<session>)")
+    proxy_args.add_argument("--capture", default=None, help="Append finished flows to this capture file")
+    proxy_args.add_argument("--capture-compression", default="none", choices=["none", "gzip", "zstd"])
+    proxy_args.add_argument("--event-batch-ms", default=30, type=int,
+                            help="Coalesce flow events sent to the GUI over this interval (0 = one event each)")
+    proxy_args.add_argument("--mitm", action="store_true",
+                            help="Intercept HTTPS: terminate TLS on CONNECT with certificates from the local CA")
+    proxy_args.add_argument("--cert-dir", default=None,
+                            help="Directory for issued host certificates (default: ~/.lokiproxy/certs)")
+    proxy_args.add_argument("--leaf-key", default="rsa", choices=["rsa", "ecdsa"],
+                            help="Key type for issued host certificates")
+    proxy_args.add_argument("--no-shared-leaf-key", action="store_true",
+                            help="Generate a new key for every host certificate")
+    proxy_args.add_argument("--no-wildcard-certs", action="store_true",
+                            help="Issue one certificate per host instead of *.domain certificates")
+    proxy_args.add_argument("--insecure-upstream", action="store_true",
+                            help="Do not verify origin TLS certificates")
+    proxy_args.add_argument("--no-search-index", action="store_true",
+                            help="Disable the background full-text index over headers and bodies")
+    proxy_args.add_argument("--dns-ttl", default=60.0, type=float,
+                            help="Seconds a resolved origin address stays cached (0 disables the cache)")
+    proxy_args.add_argument("--dns-negative-ttl", default=5.0, type=float,
+                            help="Seconds a failed lookup stays cached")
+    proxy_args.add_argument("--resolve", action="append", default=None, metavar="HOST=IP[,IP...]",
+                            help="Static address for an origin host, overriding DNS (repeatable)")
+    proxy_args.add_argument("--happy-eyeballs-delay", default=0.25, type=float,
+                            help="Seconds before racing the next origin address when connecting")
+    proxy_args.add_argument("--intercept-filter", default="", metavar="QUERY",
+                            help="Only pause flows matching this filter when intercepting "
+                                 "(e.g. 'host:api.* method:POST'); others pass through")
+    proxy_args.add_argument("--intercept-timeout", default=None, type=float, metavar="SECONDS",
+                            help="Release a paused flow with --intercept-default after this long")
+    proxy_args.add_argument("--intercept-default", default="forward", choices=["forward", "drop"],
+                            help="Action applied to paused flows that time out")
+    proxy_args.add_argument("--max-paused", default=100, type=int,
+                            help="Flows paused at once; further intercepted flows wait for a slot")
+    proxy_args.add_argument("--max-queued", default=1000, type=int,
+                            help="Intercepted flows waiting for a slot before the proxy stops "
+                                 "reading new requests")
+    proxy_args.add_argument("--workers", default=1, type=int,
+                            help="Proxy worker processes sharing the listen port via SO_REUSEPORT "
+                                 "(flows and logs are merged into this process)")
+
+    p_run = sub.add_parser("run", help="Run proxy + GUI", parents=[proxy_args])
+    p_run.add_argument("--core", default="inline", choices=["inline", "thread", "process", "headless"],
+                       help="Where the proxy core runs: on the GUI event loop, in its own thread or "
+                            "process (talking to the GUI over IPC), or alone without a GUI")
+    p_run.add_argument("--ipc", default=None,
+                       help="IPC address for --core thread/process/headless: Unix socket path or tcp://host:port")
+    p_run.add_argument("--attach", default=None, metavar="ADDRESS",
+                       help="Open the GUI against an already running core (see --core headless)")
+    p_run.add_argument("--ipc-token", default=None, metavar="TOKEN",
+                       help="Shared secret for a tcp:// IPC address (default: a new one per run; "
+                            "--core headless prints it for --attach)")
+
+    p_serve = sub.add_parser("serve", help="Run the proxy headless with an HTTP/JSON control API",
+                             parents=[proxy_args])
+    p_serve.add_argument("--control", default="127.0.0.1:8081", metavar="HOST:PORT",
+                         help="Address of the control API")
+    p_serve.add_argument("--control-token", default=None, metavar="TOKEN",
+                         help="Bearer token required by the control API (default: a new one per run, printed at start)")
+    p_serve.add_argument("--intercept", action="store_true",
+                         help="Start with interception on (flows wait for POST /flows/<id>/forward)")
+
+    p_cap = sub.add_parser("capture", help="Capture file utilities")
+    p_cap_sub = p_cap.add_subparsers(dest="subcmd", required=True)
+    p_cap_list = p_cap_sub.add_parser("list", help="List (and filter) flows in a capture")
+    p_cap_list.add_argument("file")
+    p_cap_list.add_argument("--host", default=None, help="Substring of the host")
+    p_cap_list.add_argument("--method", default=None)
+    p_cap_list.add_argument("--status", default=None, type=int)
+    p_cap_list.add_argument("-q", "--query", default=None,
+                            help='Filter expression, e.g. \'host:api.* status:>=500\' (body terms never match)')
+    p_cap_open = p_cap_sub.add_parser("open", help="Open a capture in the GUI")
+    p_cap_open.add_argument("file")
+
+    p_har = sub.add_parser("har", help="HAR 1.2 import/export")
+    p_har_sub = p_har.add_subparsers(dest="subcmd", required=True)
+    p_har_exp = p_har_sub.add_parser("export", help="Convert a capture file to HAR")
+    p_har_exp.add_argument("capture")
+    p_har_exp.add_argument("har")
+    p_har_imp = p_har_sub.add_parser("import", help="Append the entries of a HAR to a capture file")
+    p_har_imp.add_argument("har")
+    p_har_imp.add_argument("capture")
+    p_har_imp.add_argument("--compression", default="none", choices=["none", "gzip", "zstd"])
 
     args = p.parse_args()
     if args.cmd == "ca" and args.subcmd == "init":
         cmd_ca_init(args)
     elif args.cmd == "run":
         cmd_run(args)
+    elif args.cmd == "serve":
+        cmd_serve(args)
+    elif args.cmd == "capture" and args.subcmd == "list":
+        cmd_capture_list(args)
+    elif args.cmd == "capture" and args.subcmd == "open":
+        cmd_capture_open(args)
+    elif args.cmd == "har" and args.subcmd == "export":
+        cmd_har_export(args)
+    elif args.cmd == "har" and args.subcmd == "import":
+        cmd_har_import(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+import os
+import time
+import shutil
+import threading
+from typing import BinaryIO, Dict, Optional
+from .ca import DEFAULT_DIR
+
+SESSIONS_DIR = DEFAULT_DIR / "sessions"
+
+
+class BodyEvicted(LookupError):
+    """O segmento do corpo já foi apagado: o flow saiu do LRU antes da leitura começar"""
+
+
+class BodyRef:
+    """Posição de um corpo gravado num segmento do BodyStore"""
+    __slots__ = ("store", "segment", "offset", "length")
+
+    def __init__(self, store: "BodyStore", segment: int, offset: int, length: int):
+        self.store = store
+        self.segment = segment
+        self.offset = offset
+        self.length = length
+
+    def read(self, start: int = 0, length: Optional[int] = None) -> bytes:
+        return self.store.read(self, start, length)
+
+    def release(self) -> None:
+        self.store.release(self)
+
+
+class BodyStore:
+    """Corpos de flows em arquivos de segmento append-only, um diretório por sessão.
+
+    Cada segmento é apagado assim que todos os corpos gravados nele forem liberados
+    (flows expulsos do LRUFlows), então o uso de disco acompanha os flows vivos. No close
+    o diretório de sessão criado aqui é removido; num diretório dado pelo usuário só os
+    segmentos gravados pelo store são apagados.
+
+    Leituras podem vir de threads (to_thread do HAR, da API de controle, da renderização na
+    GUI) enquanto o loop libera corpos: um lock protege as contagens e cada leitura em curso
+    segura o seu segmento, que só é apagado quando a última termina.
+    """
+
+    def __init__(self, directory: Optional[str] = None, segment_size: int = 64 * 1024 * 1024):
+        self._owns_directory = directory is None
+        if directory is None:
+            directory = str(SESSIONS_DIR / f"{int(time.time())}-{os.getpid()}")
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self._segment = 0
+        self._file: Optional[BinaryIO] = None
+        self._offset = 0
+        self._live: Dict[int, int] = {}
+        # leituras em andamento por segmento
+        self._reading: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"seg-{segment:05d}.bin")
+
+    def _roll(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        old = self._segment
+        self._segment += 1
+        self._offset = 0
+        self._live[self._segment] = 0
+        self._file = open(self._path(self._segment), "wb")
+        if old:
+            self._remove_if_unused(old)
+
+    def put(self, data: bytes) -> BodyRef:
+        with self._lock:
+            if self._file is None or (self._offset and self._offset + len(data) > self.segment_size):
+                self._roll()
+            ref = BodyRef(self, self._segment, self._offset, len(data))
+            self._file.write(data)
+            self._file.flush()
+            self._offset += len(data)
+            self._live[self._segment] += 1
+            return ref
+
+    def read(self, ref: BodyRef, start: int = 0, length: Optional[int] = None) -> bytes:
+        """Lê o corpo inteiro ou só a faixa [start, start+length) dele.
+
+        Levanta BodyEvicted se o segmento já foi apagado; enquanto a leitura corre ele não é.
+        """
+        start = min(max(start, 0), ref.length)
+        n = ref.length - start if length is None else max(0, min(length, ref.length - start))
+        segment = ref.segment
+        with self._lock:
+            if segment not in self._live:
+                raise BodyEvicted(f"body segment {segment} was already released")
+            self._reading[segment] = self._reading.get(segment, 0) + 1
+        try:
+            with open(self._path(segment), "rb") as f:
+                f.seek(ref.offset + start)
+                return f.read(n)
+        finally:
+            with self._lock:
+                left = self._reading.pop(segment) - 1
+                if left:
+                    self._reading[segment] = left
+                else:
+                    self._remove_if_unused(segment)
+
+    def release(self, ref: BodyRef) -> None:
+        with self._lock:
+            if ref.segment in self._live:
+                self._live[ref.segment] -= 1
+                self._remove_if_unused(ref.segment)
+
+    def _remove_if_unused(self, segment: int) -> None:
+        """Apaga o segmento sem corpos vivos, se não é o atual nem está sendo lido (com o lock)"""
+        if (self._live.get(segment, 1) <= 0 and segment != self._segment
+                and not self._reading.get(segment)):
+            self._remove(segment)
+
+    def _remove(self, segment: int) -> None:
+        self._live.pop(segment, None)
+        try:
+            os.remove(self._path(segment))
+        except OSError:
+            pass
+
+    def close(self, remove: bool = True) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not remove:
+                return
+            if self._owns_directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                return
+            for segment in range(1, self._segment + 1):
+                self._remove(segment)
@@ -1,6 +1,7 @@
 import asyncio
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict
+from typing import Any, Deque, Dict, List, Optional, Set
 
 @dataclass
 class Event:
@@ -10,38 +11,149 @@ class Event:
 FLOW_CREATED = "FlowCreated"
 FLOW_UPDATED = "FlowUpdated"
 FLOW_FINISHED = "FlowFinished"
+# Lote de eventos de flow coalescidos: {"created": [ids], "updated": [ids], "finished": [ids]}
+FLOW_BATCH = "FlowBatch"
 FLOW_PAUSED = "FlowPaused"
 LOG_MESSAGE = "LogMessage"
+METRICS = "Metrics"
 
 SET_INTERCEPT = "SetIntercept"
 FORWARD_FLOW = "Forward"
 DROP_FLOW = "Drop"
+# Forward/drop em lote dos flows pausados: {"action": "forward"|"drop", "filter": consulta}
+INTERCEPT_BULK = "InterceptBulk"
 REPEAT_FLOW = "Repeat"
 APPLY_RULES = "ApplyRules"
 
+_BATCH_KEYS = {FLOW_CREATED: "created", FLOW_UPDATED: "updated", FLOW_FINISHED: "finished"}
+# Com a fila cheia estes eventos são descartados; os demais esperam numa fila à parte
+_DROPPABLE = frozenset({LOG_MESSAGE, METRICS})
+
+@dataclass
+class BusStats:
+    published: int = 0
+    delivered: int = 0
+    batches: int = 0
+    # eventos de flow absorvidos por outro do mesmo flow no mesmo lote
+    coalesced: int = 0
+    dropped: int = 0
+    # eventos que encontraram a fila cheia e esperaram em _overflow
+    overflowed: int = 0
+    depth: int = 0
+    max_depth: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
 class EventBus:
-    def __init__(self) -> None:
+    """Filas entre o core e a GUI.
+
+    Com batch_interval > 0 os eventos FLOW_CREATED/UPDATED/FINISHED não vão direto para a
+    fila: são agrupados por flow e entregues como um FLOW_BATCH a cada intervalo. A fila
+    core→GUI é limitada a max_queue; cheia, logs e métricas são descartados, os eventos de
+    flow acumulam no lote (cada flow aparece uma vez, mesmo com batch_interval 0) e os
+    demais, como FLOW_PAUSED, esperam em ordem numa fila à parte (_overflow), que a GUI
+    esvazia ao consumir. publish_core nunca espera pela GUI: sem consumidor (ProxyServer
+    usado como biblioteca) o proxy segue atendendo.
+    """
+
+    def __init__(self, batch_interval: float = 0.03, max_queue: int = 10000) -> None:
         self.core_to_gui: Optional[asyncio.Queue[Event]] = None
         self.gui_to_core: Optional[asyncio.Queue[Event]] = None
         self._initialized = False
+        self.batch_interval = batch_interval
+        self.max_queue = max_queue
+        self.stats = BusStats()
+        self._batch: "OrderedDict[int, Set[str]]" = OrderedDict()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._overflow: Deque[Event] = deque()
 
     def _ensure_queues(self):
         """Garante que as queues sejam criadas no event loop correto"""
         if not self._initialized:
             try:
                 loop = asyncio.get_running_loop()
-                self.core_to_gui = asyncio.Queue()
+                self.core_to_gui = asyncio.Queue(self.max_queue)
                 self.gui_to_core = asyncio.Queue()
                 self._initialized = True
             except RuntimeError:
                 # Se não há loop rodando, cria as queues sem loop específico
-                self.core_to_gui = asyncio.Queue()
+                self.core_to_gui = asyncio.Queue(self.max_queue)
                 self.gui_to_core = asyncio.Queue()
                 self._initialized = True
 
+    @property
+    def depth(self) -> int:
+        return self.core_to_gui.qsize() if self.core_to_gui is not None else 0
+
+    def _queued(self) -> None:
+        self.stats.depth = self.core_to_gui.qsize()
+        self.stats.max_depth = max(self.stats.max_depth, self.stats.depth)
+
+    def _backlogged(self) -> bool:
+        return bool(self._overflow) or self.core_to_gui.full()
+
     async def publish_core(self, type: str, data: Dict[str, Any]) -> None:
         self._ensure_queues()
-        await self.core_to_gui.put(Event(type, data))
+        self.stats.published += 1
+        key = _BATCH_KEYS.get(type)
+        if key is not None and (self.batch_interval > 0 or self._batch or self._backlogged()):
+            kinds = self._batch.setdefault(data["id"], set())
+            if kinds:
+                self.stats.coalesced += 1
+            kinds.add(key)
+            if self._flush_handle is None and self.batch_interval > 0:
+                loop = asyncio.get_running_loop()
+                self._flush_handle = loop.call_later(self.batch_interval, self._flush)
+            return
+        ev = Event(type, data)
+        if type in _DROPPABLE:
+            try:
+                self.core_to_gui.put_nowait(ev)
+            except asyncio.QueueFull:
+                self.stats.dropped += 1
+                return
+        else:
+            if self._batch:
+                # o lote pendente vai antes, p.ex. o FLOW_CREATED de um flow antes do seu FLOW_PAUSED
+                if self._flush_handle is not None:
+                    self._flush_handle.cancel()
+                    self._flush_handle = None
+                self._put(self._take_batch())
+            self._put(ev)
+        self._queued()
+
+    def _put(self, ev: Event) -> None:
+        if self._backlogged():
+            self._overflow.append(ev)
+            self.stats.overflowed += 1
+        else:
+            self.core_to_gui.put_nowait(ev)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        if not self._batch or self._backlogged():
+            # GUI atrasada: o lote segue acumulando e sai quando ela consumir (_refill)
+            return
+        self.core_to_gui.put_nowait(self._take_batch())
+        self._queued()
+
+    def _refill(self) -> None:
+        """Depois de cada consumo da GUI: primeiro os eventos em espera, depois o lote atrasado."""
+        while self._overflow and not self.core_to_gui.full():
+            self.core_to_gui.put_nowait(self._overflow.popleft())
+        if self._batch and self._flush_handle is None and not self._backlogged():
+            self.core_to_gui.put_nowait(self._take_batch())
+        self._queued()
+
+    def _take_batch(self) -> Event:
+        data: Dict[str, List[int]] = {"created": [], "updated": [], "finished": []}
+        for fid, kinds in self._batch.items():
+            for key in kinds:
+                data[key].append(fid)
+        self._batch.clear()
+        self.stats.batches += 1
+        return Event(FLOW_BATCH, data)
 
     async def consume_gui_cmd(self) -> Event:
         self._ensure_queues()
@@ -54,6 +166,8 @@ class EventBus:
         while True:
             ev = await self.core_to_gui.get()
             self.core_to_gui.task_done()
+            self.stats.delivered += 1
+            self._refill()
             yield ev
 
     async def send_gui_cmd(self, type: str, data: Dict[str, Any]) -> None:
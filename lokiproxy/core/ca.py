@@ -1,16 +1,19 @@
 import pathlib
 import datetime
-from typing import Tuple
+import ipaddress
+from typing import List, Optional, Tuple, Union
 from cryptography import x509
 from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
 from cryptography.hazmat.primitives.serialization import Encoding, PrivateFormat, NoEncryption
 
 DEFAULT_DIR = pathlib.Path.home() / ".lokiproxy"
 CA_CERT_PATH = DEFAULT_DIR / "ca.pem"
 CA_KEY_PATH = DEFAULT_DIR / "ca.key"
 
+LeafKey = Union[rsa.RSAPrivateKey, ec.EllipticCurvePrivateKey]
+
 def ensure_ca(common_name: str = "HuginProxy Local Test CA") -> Tuple[x509.Certificate, rsa.RSAPrivateKey]:
     DEFAULT_DIR.mkdir(parents=True, exist_ok=True)
     if CA_CERT_PATH.exists() and CA_KEY_PATH.exists():
@@ -31,6 +34,7 @@ def ensure_ca(common_name: str = "HuginProxy Local Test CA") -> Tuple[x509.Certi
         .not_valid_before(datetime.datetime.utcnow() - datetime.timedelta(days=1))
         .not_valid_after(datetime.datetime.utcnow() + datetime.timedelta(days=3650))
         .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
         .add_extension(x509.KeyUsage(digital_signature=True, key_cert_sign=True, crl_sign=True,
                                      key_encipherment=False, data_encipherment=False,
                                      content_commitment=False, key_agreement=False, encipher_only=False, decipher_only=False), critical=True)
@@ -42,10 +46,31 @@ def ensure_ca(common_name: str = "HuginProxy Local Test CA") -> Tuple[x509.Certi
         f.write(cert.public_bytes(Encoding.PEM))
     return cert, key
 
-def issue_cert_for_host(hostname: str, ca_cert: x509.Certificate, ca_key: rsa.RSAPrivateKey) -> Tuple[bytes, bytes]:
-    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+def generate_leaf_key(key_type: str = "rsa") -> LeafKey:
+    """Chave para certificados de host: "rsa" (2048 bits) ou "ecdsa" (P-256, bem mais rápida)"""
+    if key_type == "ecdsa":
+        return ec.generate_private_key(ec.SECP256R1())
+    if key_type == "rsa":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f"unknown leaf key type {key_type!r}")
+
+def _general_name(name: str) -> x509.GeneralName:
+    try:
+        return x509.IPAddress(ipaddress.ip_address(name))
+    except ValueError:
+        return x509.DNSName(name)
+
+def issue_cert_for_host(hostname: str, ca_cert: x509.Certificate, ca_key: rsa.RSAPrivateKey,
+                        key: Optional[LeafKey] = None, alt_names: Optional[List[str]] = None) -> Tuple[bytes, bytes]:
+    """Emite um certificado para hostname assinado pela CA.
+
+    `key` reaproveita uma chave já gerada (a geração RSA é a parte cara da emissão) e
+    `alt_names` substitui os nomes do SAN, por exemplo para um certificado curinga.
+    """
+    if key is None:
+        key = generate_leaf_key("rsa")
     subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
-    san = x509.SubjectAlternativeName([x509.DNSName(hostname)])
+    san = x509.SubjectAlternativeName([_general_name(n) for n in (alt_names or [hostname])])
     cert = (
         x509.CertificateBuilder()
         .subject_name(subject)
@@ -56,6 +81,9 @@ def issue_cert_for_host(hostname: str, ca_cert: x509.Certificate, ca_key: rsa.RS
         .not_valid_after(datetime.datetime.utcnow() + datetime.timedelta(days=825))
         .add_extension(san, critical=False)
         .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+        # exigidos por verificadores estritos (VERIFY_X509_STRICT, padrão no Python 3.13)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()), critical=False)
         .sign(ca_key, hashes.SHA256())
     )
     cert_pem = cert.public_bytes(Encoding.PEM)
@@ -0,0 +1,364 @@
+"""Arquivo de captura de flows: append-only, um registro com prefixo de tamanho por flow.
+
+Formato:
+    MAGIC
+    repetido: >I tamanho do payload armazenado, >B codec, payload (comprimido por registro)
+
+O payload descomprimido é >I tamanho do JSON de metadados, o JSON e em seguida os corpos
+de request e response. Ao lado do arquivo fica um índice `<arquivo>.idx` (JSON lines) com
+id, offset e os campos usados para listar/filtrar, de modo que a captura pode ser aberta
+sem ler os corpos.
+"""
+import os
+import json
+import zlib
+import struct
+import asyncio
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from .flows import Flow, Message
+
+MAGIC = b"LOKICAP1"
+_RECORD = struct.Struct(">IB")
+_META = struct.Struct(">I")
+
+CODEC_NONE = 0
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+CODECS = {"none": CODEC_NONE, "gzip": CODEC_GZIP, "zstd": CODEC_ZSTD}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)") from e
+    return zstandard
+
+
+def _compress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_GZIP:
+        return zlib.compress(data, 6)
+    if codec == CODEC_ZSTD:
+        return _zstd().ZstdCompressor().compress(data)
+    return data
+
+
+def _decompress(codec: int, data: bytes) -> bytes:
+    if codec == CODEC_GZIP:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        return _zstd().ZstdDecompressor().decompress(data)
+    return data
+
+
+def _message_meta(msg: Message, body: bytes) -> Dict[str, Any]:
+    return {"headers": msg.peek_headers(), "http_version": msg.http_version,
+            "body_size": msg.body_size, "body_len": len(body)}
+
+
+def encode_flow(flow: Flow, bodies: Optional[Tuple[bytes, bytes]] = None) -> bytes:
+    """Registro do flow; `bodies` (request, response) evita reler corpos já movidos ao disco"""
+    req_body, resp_body = bodies if bodies is not None else (flow.request.body, flow.response.body)
+    meta = {
+        "id": flow.id, "method": flow.method, "scheme": flow.scheme, "host": flow.host,
+        "port": flow.port, "path": flow.path, "status_code": flow.status_code,
+        "started_at": flow.started_at, "finished_at": flow.finished_at,
+        "error": flow.error, "size": flow.size, "timings": flow.timings,
+        "request": _message_meta(flow.request, req_body),
+        "response": _message_meta(flow.response, resp_body),
+    }
+    raw = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    return _META.pack(len(raw)) + raw + req_body + resp_body
+
+
+def _decode_meta(payload: bytes) -> Tuple[Dict[str, Any], int]:
+    (n,) = _META.unpack_from(payload)
+    return json.loads(payload[_META.size:_META.size + n]), _META.size + n
+
+
+def decode_flow(payload: bytes) -> Flow:
+    meta, pos = _decode_meta(payload)
+    msgs = []
+    for side in ("request", "response"):
+        m = meta[side]
+        body = payload[pos:pos + m["body_len"]]
+        pos += m["body_len"]
+        msgs.append(Message(headers=[tuple(h) for h in m["headers"]], body=body,
+                            http_version=m["http_version"], body_size=m["body_size"]))
+    flow = Flow(id=meta["id"], method=meta["method"], scheme=meta["scheme"], host=meta["host"],
+                port=meta["port"], path=meta["path"], status_code=meta["status_code"],
+                started_at=meta["started_at"], finished_at=meta["finished_at"],
+                request=msgs[0], response=msgs[1], error=meta["error"], size=meta["size"])
+    # capturas anteriores aos tempos por fase não têm "timings"
+    flow.timings = meta.get("timings")
+    return flow
+
+
+class IndexEntry(NamedTuple):
+    id: int
+    offset: int
+    length: int
+    method: str
+    host: str
+    path: str
+    status_code: Optional[int]
+    started_at: float
+    finished_at: Optional[float]
+    size: int
+
+    @property
+    def duration_ms(self) -> Optional[int]:
+        if self.finished_at is None:
+            return None
+        return int((self.finished_at - self.started_at) * 1000)
+
+
+def _index_entry(meta: Dict[str, Any], offset: int, length: int) -> IndexEntry:
+    return IndexEntry(meta["id"], offset, length, meta["method"], meta["host"], meta["path"],
+                      meta["status_code"], meta["started_at"], meta["finished_at"], meta["size"])
+
+
+def _valid_end(path: str) -> int:
+    """Offset logo após o último registro completo da captura"""
+    size = os.path.getsize(path)
+    end = len(MAGIC)
+    with open(path, "rb") as f:
+        while True:
+            f.seek(end)
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return end
+            n, _ = _RECORD.unpack(head)
+            if end + _RECORD.size + n > size:
+                return end
+            end += _RECORD.size + n
+
+
+def _read_index(idx_path: str) -> Tuple[List[IndexEntry], int]:
+    """(entradas contíguas desde o início da captura, total de linhas do arquivo .idx)"""
+    entries: List[IndexEntry] = []
+    if not os.path.exists(idx_path):
+        return entries, 0
+    end = len(MAGIC)
+    consistent = True
+    lines = 0
+    with open(idx_path, "r", encoding="utf-8") as f:
+        for line in f:
+            lines += 1
+            if not consistent:
+                continue
+            try:
+                entry = IndexEntry(*json.loads(line))
+            except (ValueError, TypeError):
+                consistent = False
+                continue
+            if entry.offset != end:
+                consistent = False
+                continue
+            entries.append(entry)
+            end = entry.offset + entry.length
+    return entries, lines
+
+
+def _scan_records(f: BinaryIO, offset: int) -> Iterator[IndexEntry]:
+    """Percorre os registros a partir de offset; um registro final truncado é ignorado"""
+    while True:
+        f.seek(offset)
+        head = f.read(_RECORD.size)
+        if len(head) < _RECORD.size:
+            return
+        n, codec = _RECORD.unpack(head)
+        stored = f.read(n)
+        if len(stored) < n:
+            return
+        meta, _ = _decode_meta(_decompress(codec, stored))
+        yield _index_entry(meta, offset, _RECORD.size + n)
+        offset += _RECORD.size + n
+
+
+def _write_index(idx_path: str, entries: List[IndexEntry]) -> None:
+    tmp = idx_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    os.replace(tmp, idx_path)
+
+
+class CaptureWriter:
+    """Grava flows finalizados numa captura sem bloquear o loop do proxy.
+
+    submit() só enfileira o flow com referências aos corpos em memória (chame antes do
+    offload para o BodyStore); serialização, compressão e escrita acontecem numa thread.
+    Com a fila cheia o flow é descartado e contado em `dropped`.
+    """
+
+    def __init__(self, path: str, compression: str = "none", max_pending: int = 10000):
+        if compression not in CODECS:
+            raise ValueError(f"unknown capture compression {compression!r}")
+        self.codec = CODECS[compression]
+        if self.codec == CODEC_ZSTD:
+            _zstd()
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._max_pending = max_pending
+        self._task: Optional[asyncio.Task] = None
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{path} is not a lokiproxy capture")
+        self._file = open(path, "ab")
+        if new:
+            self._file.write(MAGIC)
+            self._offset = len(MAGIC)
+            # um índice de uma captura anterior com o mesmo nome não vale mais
+            _write_index(path + ".idx", [])
+        else:
+            # descarta um registro final incompleto (processo interrompido no meio da escrita);
+            # truncate não move a posição do arquivo, então o offset vem do próprio end
+            end = _valid_end(path)
+            self._file.truncate(end)
+            self._offset = end
+            self._sync_index(end)
+        self._index = open(path + ".idx", "a", encoding="utf-8")
+
+    def _sync_index(self, end: int) -> None:
+        """Deixa o .idx igual aos registros até `end`: tira linhas do final descartado e
+        completa as que faltam, para que as novas linhas continuem a sequência"""
+        idx_path = self.path + ".idx"
+        entries, lines = _read_index(idx_path)
+        entries = [e for e in entries if e.offset + e.length <= end]
+        covered = entries[-1].offset + entries[-1].length if entries else len(MAGIC)
+        if covered < end:
+            with open(self.path, "rb") as f:
+                entries += list(_scan_records(f, covered))
+        if len(entries) != lines:
+            _write_index(idx_path, entries)
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(self._max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, flow: Flow) -> None:
+        try:
+            self._queue.put_nowait((flow, (flow.request.body, flow.response.body)))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def write(self, flow: Flow) -> None:
+        """Grava um flow de forma síncrona (conversões fora do proxy, sem loop)"""
+        self._write_batch([encode_flow(flow)])
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # None é o sinal de fim enviado por close()
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                await asyncio.to_thread(self._encode_batch, batch)
+            if stop:
+                return
+
+    def _encode_batch(self, batch: List[Tuple[Flow, Tuple[bytes, bytes]]]) -> None:
+        self._write_batch([encode_flow(flow, bodies) for flow, bodies in batch])
+
+    def _write_batch(self, batch: List[bytes]) -> None:
+        lines = []
+        for payload in batch:
+            stored = _compress(self.codec, payload)
+            self._file.write(_RECORD.pack(len(stored), self.codec))
+            self._file.write(stored)
+            meta, _ = _decode_meta(payload)
+            length = _RECORD.size + len(stored)
+            lines.append(json.dumps(_index_entry(meta, self._offset, length), separators=(",", ":")))
+            self._offset += length
+        self._file.flush()
+        self._index.write("\n".join(lines) + "\n")
+        self._index.flush()
+        self.written += len(batch)
+
+    async def close(self) -> None:
+        """Grava o que ainda está na fila e fecha os arquivos"""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        self._file.close()
+        self._index.close()
+
+
+class CaptureReader:
+    """Abre uma captura usando o índice lateral, completando-o se estiver atrasado.
+
+    Só os metadados do índice ficam em memória; load() lê um flow inteiro sob demanda.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} is not a lokiproxy capture")
+        self.entries: List[IndexEntry] = []
+        self._by_id: Dict[int, int] = {}
+        self._load_index()
+
+    def _load_index(self) -> None:
+        idx_path = self.path + ".idx"
+        entries, _ = _read_index(idx_path)
+        end = len(MAGIC)
+        for entry in entries:
+            self._add(entry)
+            end = entry.offset + entry.length
+        size = os.path.getsize(self.path)
+        if end < size:
+            missing = list(_scan_records(self._file, end))
+            if missing:
+                for entry in missing:
+                    self._add(entry)
+                _write_index(idx_path, self.entries)
+
+    def _add(self, entry: IndexEntry) -> None:
+        self._by_id[entry.id] = len(self.entries)
+        self.entries.append(entry)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def entry(self, flow_id: int) -> Optional[IndexEntry]:
+        i = self._by_id.get(flow_id)
+        return self.entries[i] if i is not None else None
+
+    # all()/get() imitam a leitura do LRUFlows para que a GUI use a captura como fonte
+    def all(self) -> List[IndexEntry]:
+        return self.entries
+
+    def get(self, flow_id: int) -> Optional[Flow]:
+        return self.load(flow_id)
+
+    def load(self, flow_id: int) -> Optional[Flow]:
+        entry = self.entry(flow_id)
+        if entry is None:
+            return None
+        self._file.seek(entry.offset)
+        n, codec = _RECORD.unpack(self._file.read(_RECORD.size))
+        return decode_flow(_decompress(codec, self._file.read(n)))
+
+    def filter(self, host: Optional[str] = None, method: Optional[str] = None,
+               status: Optional[int] = None) -> Iterator[IndexEntry]:
+        for e in self.entries:
+            if host and host.lower() not in e.host.lower():
+                continue
+            if method and e.method.upper() != method.upper():
+                continue
+            if status is not None and e.status_code != status:
+                continue
+            yield e
+
+    def close(self) -> None:
+        self._file.close()
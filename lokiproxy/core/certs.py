@@ -0,0 +1,250 @@
+"""Cache de certificados de host para interceptação TLS.
+
+Emitir um certificado custa a geração da chave (RSA 2048 leva dezenas de ms) mais a
+assinatura, então o CertCache:
+  - reaproveita uma única chave de folha para todos os hosts (ou usa ECDSA P-256);
+  - emite `*.dominio` para subdomínios, de modo que a.dominio e b.dominio usam o mesmo;
+  - guarda os certificados num LRU em memória e em disco (`~/.lokiproxy/certs/<ca>/`);
+  - emite fora do event loop, e CONNECTs simultâneos ao mesmo host aguardam a mesma emissão.
+"""
+import os
+import re
+import ssl
+import asyncio
+import hashlib
+import datetime
+import ipaddress
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.serialization import Encoding, PrivateFormat, NoEncryption
+from .ca import DEFAULT_DIR, LeafKey, generate_leaf_key, issue_cert_for_host
+
+CERTS_DIR = DEFAULT_DIR / "certs"
+
+# Segundos níveis comuns sob ccTLDs (co.uk, com.br, ...): `*.co.uk` seria recusado pelos
+# navegadores, então hosts logo abaixo deles recebem certificado próprio
+_SHORT_SLDS = frozenset({"ac", "co", "com", "edu", "go", "gov", "ne", "net", "or", "org"})
+_SAFE_NAME = re.compile(r"^[a-z0-9*._-]{1,200}$")
+# certificados em disco que vencem antes disso são reemitidos
+_MIN_REMAINING = datetime.timedelta(days=1)
+
+
+class LeafCert(NamedTuple):
+    name: str
+    cert_pem: bytes
+    key_pem: bytes
+    # arquivo com certificado + chave (aceito por SSLContext.load_cert_chain); None sem disco
+    path: Optional[str]
+
+
+def _is_ip(hostname: str) -> bool:
+    try:
+        ipaddress.ip_address(hostname)
+    except ValueError:
+        return False
+    return True
+
+
+def wildcard_parent(hostname: str) -> Optional[str]:
+    """Domínio cujo `*.` cobre hostname, ou None quando um curinga não serve"""
+    if _is_ip(hostname):
+        return None
+    labels = hostname.split(".")
+    if len(labels) < 3:
+        return None
+    parent = labels[1:]
+    if len(parent) == 2 and len(parent[1]) == 2 and parent[0] in _SHORT_SLDS:
+        return None
+    return ".".join(parent)
+
+
+class CertCache:
+    def __init__(self, ca_cert: x509.Certificate, ca_key, directory: Optional[str] = None,
+                 persist: bool = True, capacity: int = 512, key_type: str = "rsa",
+                 shared_key: bool = True, wildcard: bool = True,
+                 executor: Optional[Executor] = None):
+        if key_type not in ("rsa", "ecdsa"):
+            raise ValueError(f"unknown leaf key type {key_type!r}")
+        self.ca_cert = ca_cert
+        self.ca_key = ca_key
+        self.capacity = capacity
+        self.key_type = key_type
+        self.shared_key = shared_key
+        self.wildcard = wildcard
+        self.directory: Optional[str] = None
+        if persist:
+            # um subdiretório por CA: regenerar a CA invalida os certificados antigos
+            fingerprint = ca_cert.fingerprint(hashes.SHA256()).hex()[:16]
+            self.directory = os.path.join(directory or str(CERTS_DIR), fingerprint)
+            os.makedirs(self.directory, exist_ok=True)
+        self.issued = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self._memory: "OrderedDict[str, LeafCert]" = OrderedDict()
+        self._contexts: Dict[str, ssl.SSLContext] = {}
+        self._lock = threading.Lock()
+        self._leaf_key: Optional[LeafKey] = None
+        self._inflight: Dict[str, "asyncio.Future[LeafCert]"] = {}
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix="lokiproxy-certs")
+
+    def names_for(self, hostname: str) -> Tuple[str, List[str]]:
+        """Nome de cache e nomes do SAN do certificado que atende hostname"""
+        hostname = hostname.lower().rstrip(".")
+        parent = wildcard_parent(hostname) if self.wildcard else None
+        if parent is None:
+            return hostname, [hostname]
+        return f"*.{parent}", [f"*.{parent}", parent]
+
+    def _lookup(self, name: str) -> Optional[LeafCert]:
+        with self._lock:
+            leaf = self._memory.get(name)
+            if leaf is not None:
+                self._memory.move_to_end(name)
+                self.hits += 1
+            return leaf
+
+    def _remember(self, leaf: LeafCert) -> None:
+        with self._lock:
+            self._memory[leaf.name] = leaf
+            self._memory.move_to_end(leaf.name)
+            while len(self._memory) > self.capacity:
+                name, _ = self._memory.popitem(last=False)
+                self._contexts.pop(name, None)
+
+    def _path(self, name: str) -> str:
+        if not _SAFE_NAME.match(name):
+            name = hashlib.sha256(name.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name.replace("*", "_wildcard_") + ".pem")
+
+    def _key(self) -> LeafKey:
+        if not self.shared_key:
+            return generate_leaf_key(self.key_type)
+        with self._lock:
+            if self._leaf_key is None:
+                self._leaf_key = self._load_shared_key()
+            return self._leaf_key
+
+    def _load_shared_key(self) -> LeafKey:
+        path = os.path.join(self.directory, f"leaf-{self.key_type}.key") if self.directory else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                return serialization.load_pem_private_key(f.read(), password=None)
+        key = generate_leaf_key(self.key_type)
+        if path:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(key.private_bytes(Encoding.PEM, PrivateFormat.TraditionalOpenSSL, NoEncryption()))
+        return key
+
+    def _load_from_disk(self, name: str) -> Optional[LeafCert]:
+        path = self._path(name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            cert = x509.load_pem_x509_certificate(data)
+        except (OSError, ValueError):
+            return None
+        remaining = cert.not_valid_after_utc - datetime.datetime.now(datetime.timezone.utc)
+        if remaining < _MIN_REMAINING:
+            return None
+        cert_pem = cert.public_bytes(Encoding.PEM)
+        return LeafCert(name, cert_pem, data[len(cert_pem):].lstrip(), path)
+
+    def _load_or_issue(self, name: str, alt_names: List[str]) -> LeafCert:
+        """Executado no executor: disco primeiro, emissão se não houver certificado válido"""
+        leaf = self._load_from_disk(name) if self.directory else None
+        if leaf is not None:
+            self.disk_hits += 1
+        else:
+            cert_pem, key_pem = issue_cert_for_host(name, self.ca_cert, self.ca_key,
+                                                    key=self._key(), alt_names=alt_names)
+            path = None
+            if self.directory:
+                path = self._path(name)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(cert_pem + key_pem)
+                os.replace(tmp, path)
+            leaf = LeafCert(name, cert_pem, key_pem, path)
+            self.issued += 1
+        self._remember(leaf)
+        # o SSLContext também é montado aqui, fora do loop
+        self.context(leaf)
+        return leaf
+
+    def context(self, leaf: LeafCert) -> ssl.SSLContext:
+        """SSLContext de servidor para o certificado (um por nome, reaproveitado)"""
+        with self._lock:
+            ctx = self._contexts.get(leaf.name)
+        if ctx is not None:
+            return ctx
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        # as requisições internas são lidas como HTTP/1.1; clientes com h2 fazem fallback
+        ctx.set_alpn_protocols(["http/1.1"])
+        ctx.sni_callback = self._sni
+        if leaf.path:
+            ctx.load_cert_chain(leaf.path)
+        else:
+            fd, path = tempfile.mkstemp(suffix=".pem")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(leaf.cert_pem + leaf.key_pem)
+                ctx.load_cert_chain(path)
+            finally:
+                os.remove(path)
+        with self._lock:
+            if leaf.name in self._memory:
+                ctx = self._contexts.setdefault(leaf.name, ctx)
+        return ctx
+
+    def _sni(self, sslobj: ssl.SSLObject, server_name: Optional[str], ctx: ssl.SSLContext) -> None:
+        """Troca o certificado quando o SNI não é coberto pelo certificado do alvo do CONNECT.
+
+        Acontece quando o CONNECT usa um IP. O callback roda no event loop, então só troca
+        para um certificado já pronto; senão o handshake segue com o do alvo e o do SNI é
+        emitido no executor para as próximas conexões.
+        """
+        if not server_name:
+            return
+        name, alt_names = self.names_for(server_name)
+        with self._lock:
+            target = self._contexts.get(name) if name in self._memory else None
+        if target is None:
+            # ninguém aguarda esta emissão: a exceção é consumida aqui
+            self._issue(name, alt_names).add_done_callback(lambda f: f.cancelled() or f.exception())
+        elif target is not ctx:
+            sslobj.context = target
+
+    def get(self, hostname: str) -> LeafCert:
+        """Versão síncrona (bloqueia enquanto emite)"""
+        name, alt_names = self.names_for(hostname)
+        return self._lookup(name) or self._load_or_issue(name, alt_names)
+
+    async def aget(self, hostname: str) -> LeafCert:
+        name, alt_names = self.names_for(hostname)
+        leaf = self._lookup(name)
+        if leaf is not None:
+            return leaf
+        # shield: um CONNECT cancelado não cancela a emissão que outros estão aguardando
+        return await asyncio.shield(self._issue(name, alt_names))
+
+    def _issue(self, name: str, alt_names: List[str]) -> "asyncio.Future[LeafCert]":
+        """Emissão no executor; pedidos simultâneos do mesmo nome aguardam a mesma"""
+        fut = self._inflight.get(name)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(self._executor, self._load_or_issue, name, alt_names)
+            self._inflight[name] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(name, None))
+        return fut
+
+    def close(self) -> None:
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,338 @@
+"""API de controle HTTP/JSON do modo headless (`lokiproxy serve`).
+
+    GET  /flows?q=<filtro>&since=<id>&limit=N   resumos dos flows (filtro de filters.py)
+    GET  /flows/<id>                            flow completo como entrada HAR 1.2
+    GET  /events                                NDJSON em streaming: um evento do bus por linha
+    GET  /search?q=<palavras>&limit=N           busca textual (SearchIndex)
+    GET  /stats                                 estatísticas do pool, do bus e da busca
+    GET  /metrics[?format=json]                 contadores e histogramas por fase (Prometheus)
+    POST /intercept          {"on": true, ...}  SET_INTERCEPT (filter, timeout, default_action,
+                                                max_paused, max_queued opcionais; ver intercept.py)
+    POST /intercept/forward  {"filter": "..."}  INTERCEPT_BULK: todos os pausados que casam
+    POST /intercept/drop     {"filter": "..."}  (sem filtro, todos)
+    POST /rules              ruleset JSON/YAML  APPLY_RULES
+    POST /flows/<id>/forward                    FORWARD_FLOW
+    POST /flows/<id>/drop                       DROP_FLOW
+
+Acesso: com `token` (o `serve` gera um por execução e o imprime) toda requisição precisa de
+`Authorization: Bearer <token>`. Requisições com Host ou Origin de fora (outro site aberto
+num navegador que usa o proxy, DNS rebinding) recebem 403, e todo POST precisa de
+Content-Type JSON ou YAML (415 para os demais), o que obriga o navegador a um preflight CORS
+que a API não atende.
+
+Os comandos passam pela fila GUI→core do EventBus, como os da GUI. O ControlServer é o
+consumidor da fila core→GUI: sem clientes em /events os eventos são descartados, e um
+cliente que não acompanha o ritmo recebe {"type": "Overflow"} e é desconectado.
+"""
+import hmac
+import json
+import asyncio
+import inspect
+import secrets
+from http import HTTPStatus
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, parse_qs
+import yaml
+from .bus import EventBus, SET_INTERCEPT, APPLY_RULES, FORWARD_FLOW, DROP_FLOW, INTERCEPT_BULK
+from .filters import FlowFilter
+from .flows import Flow
+from .bodystore import BodyEvicted
+from .har import flow_to_entry
+from .intercept import intercept_settings
+from .ipc import SUMMARY_FIELDS, event_flow_ids
+from .metrics import prometheus_text
+from .proxy import ProxyServer
+from .rules import Ruleset
+
+MAX_REQUEST_BODY = 4 * 1024 * 1024
+_LOOPBACK_NAMES = frozenset({"localhost", "127.0.0.1", "::1"})
+OVERFLOW = "Overflow"
+
+
+class ControlError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def flow_dict(flow: Flow) -> Dict[str, Any]:
+    d = {name: getattr(flow, name) for name in SUMMARY_FIELDS}
+    d["duration_ms"] = flow.duration_ms if flow.finished_at is not None else None
+    return d
+
+
+class ControlServer:
+    def __init__(self, proxy: ProxyServer, host: str = "127.0.0.1", port: int = 8081,
+                 stream_queue: int = 1000, token: Optional[str] = None):
+        self.proxy = proxy
+        self.bus: EventBus = proxy.bus
+        self.host = host
+        self.port = port
+        self.token = token
+        self.stream_queue = stream_queue
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._streams: Set[asyncio.Queue] = set()
+
+    async def start(self) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._pump_task = asyncio.create_task(self._pump())
+        return self._server
+
+    async def close(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        for q in list(self._streams):
+            self._end_stream(q)
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    # eventos
+
+    async def _pump(self) -> None:
+        flows = self.proxy.flows
+        async for ev in self.bus.subscribe_gui():
+            if not self._streams:
+                continue
+            msg: Dict[str, Any] = {"type": ev.type, "data": ev.data}
+            summaries = [flow_dict(f) for f in map(flows.get, event_flow_ids(ev)) if f is not None]
+            if summaries:
+                msg["flows"] = summaries
+            line = json.dumps(msg, separators=(",", ":")).encode("utf-8") + b"\n"
+            for q in list(self._streams):
+                try:
+                    q.put_nowait(line)
+                except asyncio.QueueFull:
+                    self._end_stream(q, overflow=True)
+
+    def _end_stream(self, q: asyncio.Queue, overflow: bool = False) -> None:
+        self._streams.discard(q)
+        while not q.empty():
+            q.get_nowait()
+        if overflow:
+            q.put_nowait(json.dumps({"type": OVERFLOW, "data": {}}).encode("utf-8") + b"\n")
+        q.put_nowait(None)
+
+    async def _stream_events(self, writer: asyncio.StreamWriter) -> None:
+        q: asyncio.Queue = asyncio.Queue(self.stream_queue + 2)
+        self._streams.add(q)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nCache-Control: no-cache\r\n\r\n")
+        try:
+            while True:
+                line = await q.get()
+                if line is None:
+                    break
+                writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        finally:
+            self._streams.discard(q)
+
+    # HTTP
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            line = await reader.readline()
+            parts = line.decode("iso-8859-1").split()
+            if len(parts) < 2:
+                return
+            method, target = parts[0].upper(), parts[1]
+            headers: Dict[str, str] = {}
+            while True:
+                h = await reader.readline()
+                if h in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = h.decode("iso-8859-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            try:
+                self._check_access(method, headers)
+                n = int(headers.get("content-length") or 0)
+                if n > MAX_REQUEST_BODY:
+                    raise ControlError(413, "request body too large")
+                body = await reader.readexactly(n) if n else b""
+                url = urlsplit(target)
+                path = [p for p in url.path.split("/") if p]
+                if method == "GET" and path == ["events"]:
+                    await self._stream_events(writer)
+                    return
+                if method == "GET" and path == ["metrics"] and parse_qs(url.query).get("format") != ["json"]:
+                    self._write(writer, 200, prometheus_text(self.proxy.stats()["metrics"]).encode("utf-8"),
+                                "text/plain; version=0.0.4")
+                    await writer.drain()
+                    return
+                status, result = await self._route(method, path, parse_qs(url.query), headers, body)
+            except ControlError as e:
+                status, result = e.status, {"error": str(e)}
+            except ValueError as e:
+                status, result = 400, {"error": str(e)}
+            self._write_json(writer, status, result)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _check_access(self, method: str, headers: Dict[str, str]) -> None:
+        host = headers.get("host")
+        if host is not None and not self._own_address(host):
+            raise ControlError(403, "foreign Host header")
+        origin = headers.get("origin")
+        if origin is not None:
+            url = urlsplit(origin)
+            if url.scheme != "http" or not self._own_address(url.netloc):
+                raise ControlError(403, "cross-origin requests are not allowed")
+        if self.token is not None:
+            auth = headers.get("authorization", "")
+            if not hmac.compare_digest(auth.encode("utf-8"), f"Bearer {self.token}".encode("utf-8")):
+                raise ControlError(401, "missing or invalid control token")
+        if method == "POST":
+            ctype = headers.get("content-type", "").split(";")[0].strip().lower()
+            if ctype != "application/json" and not ctype.endswith("yaml"):
+                raise ControlError(415, "POST body must be application/json or YAML")
+
+    def _own_address(self, netloc: str) -> bool:
+        """True se host[:porta] aponta para esta API (loopback ou o endereço de escuta)"""
+        try:
+            url = urlsplit("//" + netloc)
+            port = url.port
+        except ValueError:
+            return False
+        if (port or 80) != self.port:
+            return False
+        if self.host in ("", "0.0.0.0", "::"):
+            # escutando em todas as interfaces: qualquer nome desta máquina vale; o token protege
+            return True
+        return (url.hostname or "") in _LOOPBACK_NAMES | {self.host.lower().strip("[]")}
+
+    @staticmethod
+    def _write(writer: asyncio.StreamWriter, status: int, body: bytes, ctype: str) -> None:
+        writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n"
+                     b"Connection: close\r\n\r\n%s" % (status, HTTPStatus(status).phrase.encode(),
+                                                       ctype.encode(), len(body), body))
+
+    def _write_json(self, writer: asyncio.StreamWriter, status: int, result: Any) -> None:
+        self._write(writer, status, json.dumps(result, separators=(",", ":")).encode("utf-8"),
+                    "application/json")
+
+    def _flow(self, fid: str) -> Flow:
+        flow = self.proxy.flows.get(int(fid)) if fid.isdigit() else None
+        if flow is None:
+            raise ControlError(404, f"flow {fid} not found")
+        return flow
+
+    async def _route(self, method: str, path: List[str], params: Dict[str, List[str]],
+                     headers: Dict[str, str], body: bytes) -> Tuple[int, Any]:
+        def param(name: str, default: Optional[str] = None) -> Optional[str]:
+            return params.get(name, [default])[-1]
+
+        if path == ["flows"] and method == "GET":
+            flt = FlowFilter(param("q", ""))
+            since = int(param("since", "0"))
+            limit = int(param("limit", "1000"))
+            out = [flow_dict(f) for f in self.proxy.flows
+                   if f.id > since and (not flt or flt.matches(f))]
+            return 200, out[-limit:] if limit > 0 else []
+        if len(path) == 2 and path[0] == "flows" and method == "GET":
+            flow = self._flow(path[1])
+            fetch = getattr(self.proxy.flows, "fetch", None)
+            if fetch is not None:
+                # WorkerPool: o flow completo está no processo do worker
+                flow = await fetch(flow.id) or flow
+            try:
+                entry = await asyncio.to_thread(flow_to_entry, flow)
+            except BodyEvicted:
+                # expulso do LRU entre a busca e a leitura dos corpos
+                raise ControlError(404, f"flow {flow.id} was evicted")
+            return 200, {"summary": flow_dict(flow), "entry": entry}
+        if len(path) == 3 and path[0] == "flows" and path[2] in ("forward", "drop") and method == "POST":
+            flow = self._flow(path[1])
+            cmd = FORWARD_FLOW if path[2] == "forward" else DROP_FLOW
+            await self.bus.send_gui_cmd(cmd, {"flow_id": flow.id})
+            return 202, {"ok": True}
+        if path == ["search"] and method == "GET":
+            if self.proxy.search is None:
+                raise ControlError(404, "search index disabled (--no-search-index)")
+            hits = self.proxy.search.search(param("q", ""), int(param("limit", "50")))
+            if inspect.isawaitable(hits):
+                hits = await hits
+            return 200, [{"id": fid, "score": score} for fid, score in hits]
+        if path == ["stats"] and method == "GET":
+            return 200, dict(self.proxy.stats(), flows=len(self.proxy.flows), intercept=self.proxy.intercept)
+        if path == ["metrics"] and method == "GET":
+            return 200, self.proxy.stats()["metrics"]
+        if path == ["intercept"] and method == "POST":
+            data = _load(body, headers)
+            data = dict(data, on=bool(data.get("on", False))) if isinstance(data, dict) else {"on": bool(data)}
+            # valida antes de enviar, como /rules
+            settings = intercept_settings(data)
+            await self.bus.send_gui_cmd(SET_INTERCEPT, dict(settings))
+            on = settings.pop("on")
+            return 202, dict(settings, intercept=on)
+        if len(path) == 2 and path[0] == "intercept" and path[1] in ("forward", "drop") and method == "POST":
+            data = _load(body, headers)
+            flt = (data.get("filter") if isinstance(data, dict) else None) or param("filter", "")
+            FlowFilter(flt)
+            await self.bus.send_gui_cmd(INTERCEPT_BULK, {"action": path[1], "filter": flt})
+            return 202, {"action": path[1], "filter": flt}
+        if path == ["rules"] and method == "POST":
+            data = _load(body, headers)
+            try:
+                # valida antes de enviar: o core não tem como devolver o erro
+                n = len(Ruleset(**(data or {})).rules)
+            except Exception as e:
+                raise ControlError(400, f"invalid ruleset: {e}") from e
+            await self.bus.send_gui_cmd(APPLY_RULES, {"ruleset": data or {}})
+            return 202, {"rules": n}
+        if path and path[0] in ("flows", "search", "stats", "metrics", "intercept", "rules"):
+            raise ControlError(405, f"{method} not allowed here")
+        raise ControlError(404, "not found")
+
+
+def _load(body: bytes, headers: Dict[str, str]) -> Any:
+    # o Content-Type já foi conferido em _check_access: JSON ou YAML
+    if not body.strip():
+        return {}
+    if "yaml" in headers.get("content-type", "").lower():
+        return yaml.safe_load(body)
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise ControlError(400, f"invalid JSON body: {e}") from e
+
+
+async def serve(control_host: str = "127.0.0.1", control_port: int = 8081,
+                bus_opts: Optional[Dict[str, Any]] = None, intercept: bool = False, workers: int = 1,
+                control_token: Optional[str] = None, **proxy_opts) -> None:
+    """Proxy (ou um WorkerPool com workers > 1) + API de controle, sem GUI, até ser cancelado.
+
+    Sem `control_token` um token novo é gerado a cada execução e impresso junto do endereço.
+    """
+    bus = EventBus(**(bus_opts or {}))
+    if workers > 1:
+        from .workers import WorkerPool
+        proxy = WorkerPool(workers, bus, **proxy_opts)
+    else:
+        proxy = ProxyServer(bus=bus, **proxy_opts)
+    bus.proxy = proxy
+    proxy.intercept = intercept
+    server = await proxy.start()
+    control = ControlServer(proxy, control_host, control_port,
+                            token=control_token or secrets.token_urlsafe(24))
+    await control.start()
+    print(f"Proxy em {proxy.host}:{proxy.port}, API de controle em http://{control.host}:{control.port}",
+          flush=True)
+    print(f"Token da API de controle: {control.token}", flush=True)
+    try:
+        if server is None:
+            # WorkerPool: os listeners estão nos processos dos workers
+            await proxy.wait()
+        else:
+            async with server:
+                await server.serve_forever()
+    finally:
+        await control.close()
+        await proxy.close()
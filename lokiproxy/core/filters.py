@@ -0,0 +1,325 @@
+"""Linguagem de filtro de flows e índices para avaliá-la sem varrer todos os flows.
+
+Sintaxe: termos separados por espaço, todos precisam casar (E lógico).
+
+    host:api.*          host (glob com `*`; sem `*` é substring)
+    method:POST,PUT     método (lista separada por vírgula = OU)
+    status:>=500        status: 404, >=500, <300, 200-299, 5xx
+    duration:>1000      duração em ms (>, >=, <, <=, =, intervalo a-b)
+    size:>1m            tamanho em bytes (sufixos k, m, g)
+    path:/login         substring do caminho; url:... substring da URL completa
+    body:token          palavra nos corpos (usa o índice invertido quando habilitado)
+    campo~"regex"       expressão regular (host, path, url, body, method)
+    -termo / !termo     negação
+    texto               substring do host ou do caminho
+
+Valores podem vir entre aspas duplas.
+"""
+import re
+import math
+import fnmatch
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+_TERM = re.compile(r'''\s*([-!]?)(?:([a-z]+)([:~]))?("(?:[^"\\]|\\.)*"|\S+)''', re.I)
+_COMPARE = re.compile(r"^(>=|<=|>|<|=)?(\d+(?:\.\d+)?)([kmg]?)$", re.I)
+_RANGE = re.compile(r"^(\d+(?:\.\d+)?)([kmg]?)-(\d+(?:\.\d+)?)([kmg]?)$", re.I)
+_WORD = re.compile(rb"[A-Za-z0-9_]{3,}")
+_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+FIELDS = ("host", "method", "status", "duration", "size", "path", "url", "body")
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _number(digits: str, unit: str) -> float:
+    return float(digits) * _UNITS[unit.lower()]
+
+
+def _bounds(value: str, field: str) -> Tuple[float, float]:
+    """Intervalo inteiro fechado [low, high] de status/duration/size aceito por value"""
+    if field == "status":
+        m = re.match(r"^([1-5])xx$", value, re.I)
+        if m:
+            low = int(m.group(1)) * 100
+            return low, low + 99
+    m = _RANGE.match(value)
+    if m:
+        return math.ceil(_number(*m.group(1, 2))), math.floor(_number(*m.group(3, 4)))
+    m = _COMPARE.match(value)
+    if not m:
+        raise ValueError(f"invalid {field} value {value!r}")
+    op, n = m.group(1) or "=", _number(m.group(2), m.group(3))
+    if op == ">":
+        return math.floor(n) + 1, math.inf
+    if op == ">=":
+        return math.ceil(n), math.inf
+    if op == "<":
+        return -math.inf, math.ceil(n) - 1
+    if op == "<=":
+        return -math.inf, math.floor(n)
+    return n, n
+
+
+def body_tokens(body: bytes) -> FrozenSet[str]:
+    return frozenset(w.decode("ascii").lower() for w in _WORD.findall(body))
+
+
+def _bodies(flow: Any) -> List[bytes]:
+    return [msg.body for msg in (getattr(flow, "request", None), getattr(flow, "response", None))
+            if msg is not None]
+
+
+def _body_prefixes(flow: Any, limit: int) -> List[bytes]:
+    # read_body lê do BodyStore só o começo de um corpo já movido para o disco
+    out = []
+    for msg in (getattr(flow, "request", None), getattr(flow, "response", None)):
+        if msg is not None:
+            out.append(msg.read_body(0, limit) if hasattr(msg, "read_body") else msg.body[:limit])
+    return out
+
+
+def _url(flow: Any) -> str:
+    from .har import flow_url
+    return flow_url(flow)
+
+
+class Term:
+    __slots__ = ("field", "op", "value", "negate", "_match", "_tokens", "_bounds")
+
+    def __init__(self, field: str, op: str, value: str, negate: bool = False):
+        self.field = field
+        self.op = op
+        self.value = value
+        self.negate = negate
+        self._tokens: Optional[FrozenSet[str]] = None
+        self._bounds: Optional[Tuple[float, float]] = None
+        self._match = self._compile()
+
+    def __repr__(self) -> str:
+        return f"Term({'-' if self.negate else ''}{self.field}{self.op}{self.value!r})"
+
+    def _compile(self) -> Callable[[Any], bool]:
+        field, value = self.field, self.value
+        if self.op == "~":
+            try:
+                rx = re.compile(value, re.I)
+            except re.error as e:
+                raise ValueError(f"invalid regex {value!r}: {e}") from e
+            if field == "body":
+                brx = re.compile(value.encode("utf-8"), re.I)
+                return lambda f: any(brx.search(b) for b in _bodies(f))
+            get = self._getter(field)
+            return lambda f: bool(rx.search(get(f) or ""))
+        if field in ("status", "duration", "size"):
+            low, high = self._bounds = _bounds(value, field)
+            attr = {"status": "status_code", "duration": "duration_ms", "size": "size"}[field]
+            if field == "duration":
+                # flows em andamento não têm duração final
+                return lambda f: f.finished_at is not None and low <= f.duration_ms <= high
+
+            def match(f):
+                v = getattr(f, attr, None)
+                return v is not None and low <= v <= high
+            return match
+        if field == "method":
+            methods = {m.upper() for m in value.split(",") if m}
+            return lambda f: (f.method or "").upper() in methods
+        if field == "host":
+            pattern = value.lower()
+            if "*" in pattern or "?" in pattern:
+                return lambda f: fnmatch.fnmatchcase((f.host or "").lower(), pattern)
+            return lambda f: pattern in (f.host or "").lower()
+        if field == "body":
+            self._tokens = body_tokens(value.encode("utf-8"))
+            if not self._tokens:
+                raise ValueError(f"body: needs a word of 3+ letters/digits, got {value!r}")
+            tokens = self._tokens
+            return lambda f: tokens <= frozenset().union(*(body_tokens(b) for b in _bodies(f)))
+        if field in ("path", "url", "text"):
+            needle = value.lower()
+            get = self._getter(field)
+            return lambda f: needle in (get(f) or "").lower()
+        raise ValueError(f"unknown filter field {field!r} (use one of {', '.join(FIELDS)})")
+
+    @staticmethod
+    def _getter(field: str) -> Callable[[Any], str]:
+        if field == "url":
+            return _url
+        if field == "text":
+            return lambda f: f"{f.host}{f.path}"
+        if field in ("host", "method", "path"):
+            return lambda f: getattr(f, field)
+        raise ValueError(f"field {field!r} does not support ~")
+
+    def matches(self, flow: Any) -> bool:
+        return self._match(flow) != self.negate
+
+
+class FlowFilter:
+    """Expressão de filtro compilada; matches(flow) avalia um flow isolado"""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.terms: List[Term] = []
+        pos = 0
+        query = query.strip()
+        while pos < len(query):
+            m = _TERM.match(query, pos)
+            if not m or m.end() == pos:
+                raise ValueError(f"cannot parse filter near {query[pos:]!r}")
+            neg, field, op, value = m.groups()
+            value = _unquote(value)
+            if field is None:
+                field, op = "text", ":"
+            self.terms.append(Term(field.lower(), op, value, negate=bool(neg)))
+            pos = m.end()
+            while pos < len(query) and query[pos].isspace():
+                pos += 1
+
+    def __bool__(self) -> bool:
+        return bool(self.terms)
+
+    def matches(self, flow: Any) -> bool:
+        return all(t.matches(flow) for t in self.terms)
+
+
+def _duration_bucket(ms: Optional[int]) -> int:
+    # potências de 2 em ms; -1 para flows ainda sem duração
+    return -1 if ms is None else int(ms).bit_length()
+
+
+class FlowIndex:
+    """Índices por host, método, status e faixa de duração (e, opcionalmente, palavras dos
+    corpos) mantidos incrementalmente com update()/remove().
+
+    query() usa os índices para reduzir os candidatos e só avalia o predicado completo
+    nos que restam.
+    """
+
+    def __init__(self, body_index: bool = False, body_index_limit: int = 64 * 1024):
+        self.body_index = body_index
+        self.body_index_limit = body_index_limit
+        self._flows: Dict[int, Any] = {}
+        self._keys: Dict[int, Tuple[str, str, Optional[int], int]] = {}
+        self._by_host: Dict[str, Set[int]] = {}
+        self._by_method: Dict[str, Set[int]] = {}
+        self._by_status: Dict[Optional[int], Set[int]] = {}
+        self._by_duration: Dict[int, Set[int]] = {}
+        self._tokens: Dict[str, Set[int]] = {}
+        self._flow_tokens: Dict[int, FrozenSet[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def __contains__(self, fid: int) -> bool:
+        return fid in self._flows
+
+    def update(self, flow: Any) -> None:
+        """Indexa um flow novo ou reindexa um que mudou (status, duração, corpos)"""
+        fid = flow.id
+        finished = getattr(flow, "finished_at", None) is not None
+        key = ((flow.host or "").lower(), (flow.method or "").upper(), flow.status_code,
+               _duration_bucket(flow.duration_ms if finished else None))
+        old = self._keys.get(fid)
+        self._flows[fid] = flow
+        if old != key:
+            if old is not None:
+                self._unlink(fid, old)
+            self._keys[fid] = key
+            for table, k in zip(self._tables(), key):
+                table.setdefault(k, set()).add(fid)
+        if self.body_index and finished and fid not in self._flow_tokens:
+            tokens = frozenset().union(*(body_tokens(b) for b in _body_prefixes(flow, self.body_index_limit)))
+            self._flow_tokens[fid] = tokens
+            for t in tokens:
+                self._tokens.setdefault(t, set()).add(fid)
+
+    def remove(self, fid: int) -> None:
+        self._flows.pop(fid, None)
+        key = self._keys.pop(fid, None)
+        if key is not None:
+            self._unlink(fid, key)
+        for t in self._flow_tokens.pop(fid, ()):
+            ids = self._tokens.get(t)
+            if ids is not None:
+                ids.discard(fid)
+                if not ids:
+                    del self._tokens[t]
+
+    def clear(self) -> None:
+        self.__init__(self.body_index, self.body_index_limit)
+
+    def _tables(self) -> Tuple[Dict, Dict, Dict, Dict]:
+        return self._by_host, self._by_method, self._by_status, self._by_duration
+
+    def _unlink(self, fid: int, key: Tuple) -> None:
+        for table, k in zip(self._tables(), key):
+            ids = table.get(k)
+            if ids is not None:
+                ids.discard(fid)
+                if not ids:
+                    del table[k]
+
+    def _candidates(self, term: Term) -> Tuple[Optional[Set[int]], bool]:
+        """(superconjunto dos ids que casam com term, se o conjunto é exato) ou (None, False)"""
+        if term.op != ":":
+            return None, False
+        if term.field in ("host", "method", "status"):
+            table = {"host": self._by_host, "method": self._by_method, "status": self._by_status}[term.field]
+            probe = {"host": "host", "method": "method", "status": "status_code"}[term.field]
+            ids: Set[int] = set()
+            for k, members in table.items():
+                if term._match(_Probe(**{probe: k})):
+                    ids |= members
+            return ids, True
+        if term.field == "duration":
+            low, high = term._bounds
+            ids = set()
+            for bucket, members in self._by_duration.items():
+                if bucket < 0:
+                    continue
+                # bucket b guarda durações em [2^(b-1), 2^b - 1]; 0 guarda 0 ms
+                lo, hi = (0, 0) if bucket == 0 else (1 << (bucket - 1), (1 << bucket) - 1)
+                if lo <= high and hi >= low:
+                    ids |= members
+            return ids, False
+        if term.field == "body" and self.body_index and term._tokens:
+            sets = sorted((self._tokens.get(t, set()) for t in term._tokens), key=len)
+            return set.intersection(*sets) if sets else set(), False
+        return None, False
+
+    def query(self, flt: FlowFilter) -> Set[int]:
+        positive: List[Tuple[Set[int], bool, Term]] = []
+        residual: List[Term] = []
+        for term in flt.terms:
+            ids, exact = (None, False) if term.negate else self._candidates(term)
+            if ids is None:
+                residual.append(term)
+            else:
+                positive.append((ids, exact, term))
+                if not exact:
+                    residual.append(term)
+        if positive:
+            positive.sort(key=lambda p: len(p[0]))
+            result = set(positive[0][0])
+            for ids, _, _ in positive[1:]:
+                result &= ids
+        else:
+            result = set(self._flows)
+        if residual:
+            result = {fid for fid in result if all(t.matches(self._flows[fid]) for t in residual)}
+        return result
+
+
+class _Probe:
+    """Objeto com os atributos mínimos para testar um termo contra uma chave do índice"""
+    __slots__ = ("host", "method", "status_code")
+
+    def __init__(self, host: str = "", method: str = "", status_code: Optional[int] = None):
+        self.host = host
+        self.method = method
+        self.status_code = status_code
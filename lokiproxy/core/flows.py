@@ -1,29 +1,159 @@
+import sys
 import time
 import itertools
-from dataclasses import dataclass, field
-from typing import Dict, Optional, List, Tuple
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, List, Tuple
+
+if TYPE_CHECKING:
+    from .bodystore import BodyRef, BodyStore
+
+# Headers cujos valores se repetem entre milhares de flows de um mesmo navegador; esses
+# valores também são internados para que todos os flows compartilhem a mesma string.
+_SHARED_VALUES = frozenset({
+    "accept", "accept-encoding", "accept-language", "cache-control", "connection",
+    "content-encoding", "content-type", "origin", "pragma", "referer", "sec-ch-ua",
+    "sec-ch-ua-mobile", "sec-ch-ua-platform", "sec-fetch-dest", "sec-fetch-mode",
+    "sec-fetch-site", "server", "upgrade-insecure-requests", "user-agent", "vary",
+})
+
+def intern_headers(headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    out = []
+    for k, v in headers:
+        k = sys.intern(k)
+        if k.lower() in _SHARED_VALUES:
+            v = sys.intern(v)
+        out.append((k, v))
+    return out
+
+def parse_header_block(raw: bytes) -> List[Tuple[str, str]]:
+    headers = []
+    for line in raw.split(b"\r\n"):
+        if not line:
+            continue
+        k, _, v = line.decode("iso-8859-1").partition(":")
+        headers.append((k.strip(), v.strip()))
+    return intern_headers(headers)
 
-@dataclass
 class Message:
-    headers: List[Tuple[str, str]] = field(default_factory=list)
-    body: bytes = b""
-    http_version: str = "1.1"
+    """Headers e corpo de um lado do flow.
+
+    Os headers podem ser guardados como o bloco bruto recebido (set_raw_headers) e só são
+    convertidos em tuplas no primeiro acesso. O corpo pode ser movido para um BodyStore
+    (offload); nesse caso `body` é lido do disco a cada acesso e não ocupa memória.
+    """
+    __slots__ = ("_headers", "_raw_headers", "http_version", "body_size", "spill_path",
+                 "_body", "_body_ref")
+
+    def __init__(self, headers: Optional[List[Tuple[str, str]]] = None, body: bytes = b"",
+                 http_version: str = "1.1", body_size: int = 0, spill_path: Optional[str] = None):
+        self._headers = intern_headers(headers) if headers else []
+        self._raw_headers: Optional[bytes] = None
+        self.http_version = http_version
+        # Tamanho total do corpo; pode ser maior que len(body) quando só um prefixo foi capturado
+        self.body_size = body_size
+        # Arquivo com o restante do corpo além do prefixo capturado (ver ProxyServer.spill_dir)
+        self.spill_path = spill_path
+        self._body = body
+        self._body_ref: Optional["BodyRef"] = None
+
+    @property
+    def headers(self) -> List[Tuple[str, str]]:
+        # lê o bloco uma vez: outra thread pode estar convertendo ao mesmo tempo
+        raw = self._raw_headers
+        if raw is not None:
+            self._headers = parse_header_block(raw)
+            self._raw_headers = None
+        return self._headers
+
+    @headers.setter
+    def headers(self, value: List[Tuple[str, str]]):
+        self._raw_headers = None
+        self._headers = intern_headers(value)
+
+    def set_raw_headers(self, raw: bytes) -> None:
+        """Guarda o bloco de headers (linhas separadas por CRLF, sem a linha inicial)"""
+        self._raw_headers = raw
+        self._headers = []
+
+    def peek_headers(self) -> List[Tuple[str, str]]:
+        """Headers sem guardar a conversão: o bloco bruto continua sendo o que fica em memória"""
+        raw = self._raw_headers
+        return parse_header_block(raw) if raw is not None else self._headers
+
+    @property
+    def body(self) -> bytes:
+        if self._body_ref is not None:
+            return self._body_ref.read()
+        return self._body
+
+    @body.setter
+    def body(self, value: bytes):
+        self.release()
+        self._body = value
+
+    @property
+    def body_length(self) -> int:
+        """Tamanho do corpo guardado (em memória ou no BodyStore) sem lê-lo do disco"""
+        return self._body_ref.length if self._body_ref is not None else len(self._body)
+
+    def read_body(self, start: int = 0, length: Optional[int] = None) -> bytes:
+        """Faixa do corpo; com o corpo no BodyStore só essa faixa é lida"""
+        if self._body_ref is not None:
+            return self._body_ref.read(start, length)
+        return self._body[start:None if length is None else start + length]
+
+    @property
+    def memory_size(self) -> int:
+        return len(self._body)
+
+    @property
+    def offloaded(self) -> bool:
+        return self._body_ref is not None
+
+    def offload(self, store: "BodyStore") -> None:
+        if self._body_ref is None and self._body:
+            self._body_ref = store.put(self._body)
+            self._body = b""
+
+    def release(self) -> None:
+        if self._body_ref is not None:
+            self._body_ref.release()
+            self._body_ref = None
 
-@dataclass
 class Flow:
-    id: int
-    method: str = ""
-    scheme: str = "http"
-    host: str = ""
-    port: int = 80
-    path: str = "/"
-    status_code: Optional[int] = None
-    started_at: float = field(default_factory=time.time)
-    finished_at: Optional[float] = None
-    request: Message = field(default_factory=Message)
-    response: Message = field(default_factory=Message)
-    error: Optional[str] = None
-    size: int = 0
+    __slots__ = ("id", "method", "scheme", "host", "port", "path", "status_code", "started_at",
+                 "finished_at", "request", "response", "error", "size", "t0", "timings")
+
+    def __init__(self, id: int, method: str = "", scheme: str = "http", host: str = "",
+                 port: int = 80, path: str = "/", status_code: Optional[int] = None,
+                 started_at: Optional[float] = None, finished_at: Optional[float] = None,
+                 request: Optional[Message] = None, response: Optional[Message] = None,
+                 error: Optional[str] = None, size: int = 0):
+        self.id = id
+        self.method = method
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.path = path
+        self.status_code = status_code
+        self.started_at = started_at if started_at is not None else time.time()
+        self.finished_at = finished_at
+        self.request = request if request is not None else Message()
+        self.response = response if response is not None else Message()
+        self.error = error
+        self.size = size
+        # início no relógio monotônico e fim de cada fase em ms (ver core/metrics.py)
+        self.t0 = time.perf_counter()
+        self.timings: Optional[Dict[str, float]] = None
+
+    def mark(self, phase: str, now: Optional[float] = None) -> None:
+        now = time.perf_counter() if now is None else now
+        if self.timings is None:
+            self.timings = {}
+        self.timings[phase] = round((now - self.t0) * 1000, 3)
+
+    def __repr__(self) -> str:
+        return f"Flow(id={self.id}, method={self.method!r}, host={self.host!r}, path={self.path!r}, status_code={self.status_code})"
 
     @property
     def duration_ms(self) -> Optional[int]:
@@ -31,37 +161,66 @@ class Flow:
         return int((end - self.started_at) * 1000)
 
 class LRUFlows:
-    def __init__(self, capacity: int = 2000):
+    """Armazém de flows com expulsão LRU em O(1), limitado por quantidade e por bytes.
+
+    O orçamento de bytes considera os corpos mantidos em memória (request + response);
+    como os corpos chegam depois de new_flow, o proxy chama record_size ao finalizar o flow.
+    Listeners registrados com on_evict recebem cada flow expulso.
+    """
+
+    def __init__(self, capacity: int = 2000, max_bytes: Optional[int] = None,
+                 first_id: int = 1, id_step: int = 1):
         self.capacity = capacity
-        self._flows: Dict[int, Flow] = {}
-        self._order: List[int] = []
-        import itertools
-        self._id_counter = itertools.count(1)
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._flows: "OrderedDict[int, Flow]" = OrderedDict()
+        self._sizes: Dict[int, int] = {}
+        self._evict_listeners: List[Callable[[Flow], None]] = []
+        # workers de um WorkerPool usam ids intercalados (first_id, first_id + step, ...)
+        self._id_counter = itertools.count(first_id, id_step)
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def __iter__(self) -> Iterator[Flow]:
+        return iter(self._flows.values())
+
+    def on_evict(self, callback: Callable[[Flow], None]) -> None:
+        self._evict_listeners.append(callback)
 
     def new_flow(self) -> Flow:
         fid = next(self._id_counter)
         flow = Flow(id=fid)
         self._flows[fid] = flow
-        self._order.append(fid)
         self._shrink_if_needed()
         return flow
 
     def _shrink_if_needed(self):
-        while len(self._order) > self.capacity:
-            old_id = self._order.pop(0)
-            self._flows.pop(old_id, None)
+        while self._flows and (len(self._flows) > self.capacity or
+                               (self.max_bytes is not None and self.total_bytes > self.max_bytes
+                                and len(self._flows) > 1)):
+            _, flow = self._flows.popitem(last=False)
+            self.total_bytes -= self._sizes.pop(flow.id, 0)
+            for cb in self._evict_listeners:
+                cb(flow)
 
     def get(self, fid: int) -> Optional[Flow]:
         return self._flows.get(fid)
 
     def all(self) -> List[Flow]:
-        return [self._flows[i] for i in self._order if i in self._flows]
+        return list(self._flows.values())
+
+    def record_size(self, flow: Flow):
+        """Atualiza o tamanho em memória do flow (corpos capturados) sem mudar sua posição"""
+        if flow.id not in self._flows:
+            return
+        size = flow.request.memory_size + flow.response.memory_size
+        self.total_bytes += size - self._sizes.get(flow.id, 0)
+        self._sizes[flow.id] = size
+        self._shrink_if_needed()
 
     def update(self, flow: Flow):
         if flow.id in self._flows:
-            try:
-                self._order.remove(flow.id)
-            except ValueError:
-                pass
-            self._order.append(flow.id)
             self._flows[flow.id] = flow
+            self._flows.move_to_end(flow.id)
+            self.record_size(flow)
@@ -0,0 +1,289 @@
+"""Importação/exportação HAR 1.2 em streaming.
+
+A exportação escreve uma entrada por vez; a importação lê o arquivo em blocos e decodifica
+cada entrada de `log.entries` isoladamente, então o uso de memória não depende do tamanho
+do arquivo, só da maior entrada.
+"""
+import re
+import json
+import base64
+import datetime
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+from http import HTTPStatus
+from .flows import Flow, LRUFlows
+from .metrics import phase_spans
+from .. import __version__
+
+READ_SIZE = 1024 * 1024
+_STRING_CHUNK = re.compile(r'[^"\\]*')
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def _iso(ts: float) -> str:
+    dt = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+    return dt.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _from_iso(value: str) -> float:
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _header_list(headers: List[Tuple[str, str]]) -> List[Dict[str, str]]:
+    return [{"name": k, "value": v} for k, v in headers]
+
+
+def _mime(headers: List[Tuple[str, str]]) -> str:
+    return next((v for k, v in headers if k.lower() == "content-type"), "")
+
+
+def _body_fields(body: bytes) -> Dict[str, Any]:
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"text": base64.b64encode(body).decode("ascii"), "encoding": "base64"}
+
+
+def _body_from(fields: Dict[str, Any]) -> bytes:
+    text = fields.get("text") or ""
+    if fields.get("encoding") == "base64":
+        return base64.b64decode(text)
+    return text.encode("utf-8")
+
+
+def flow_url(flow: Flow) -> str:
+    if flow.path.startswith(("http://", "https://")):
+        return flow.path
+    if flow.method.upper() == "CONNECT":
+        return f"https://{flow.path}"
+    default = 443 if flow.scheme == "https" else 80
+    port = "" if flow.port == default else f":{flow.port}"
+    return f"{flow.scheme}://{flow.host}{port}{flow.path}"
+
+
+def _har_timings(flow: Flow, duration: float) -> Dict[str, float]:
+    spans = {phase: end - start for phase, start, end in phase_spans(flow.timings)}
+    if not spans:
+        return {"send": 0, "wait": duration, "receive": 0}
+
+    def total(*phases: str) -> float:
+        return round(sum(spans.get(p, 0) for p in phases), 3)
+    # no HAR connect inclui o ssl; dns vem somado ao connect (-1 = não medido)
+    return {"blocked": total("request_head", "request_body", "rules", "intercept"), "dns": -1,
+            "connect": total("dns_connect", "tls") if "dns_connect" in spans else -1,
+            "ssl": total("tls") if "tls" in spans else -1,
+            "send": total("request_send"), "wait": total("ttfb"),
+            "receive": total("response_body", "response_intercept", "client_write", "tunnel")}
+
+
+def flow_to_entry(flow: Flow) -> Dict[str, Any]:
+    req, resp = flow.request, flow.response
+    req_body, resp_body = req.body, resp.body
+    # exportar não deve converter em tuplas os headers guardados como bloco bruto
+    req_headers, resp_headers = req.peek_headers(), resp.peek_headers()
+    url = flow_url(flow)
+    duration = flow.duration_ms if flow.finished_at else 0
+    request = {
+        "method": flow.method,
+        "url": url,
+        "httpVersion": f"HTTP/{req.http_version}",
+        "cookies": [],
+        "headers": _header_list(req_headers),
+        "queryString": [{"name": k, "value": v} for k, v in parse_qsl(urlsplit(url).query, keep_blank_values=True)],
+        "headersSize": -1,
+        "bodySize": req.body_size or len(req_body),
+    }
+    if req_body:
+        request["postData"] = {"mimeType": _mime(req_headers), **_body_fields(req_body)}
+    status = flow.status_code or 0
+    try:
+        status_text = HTTPStatus(status).phrase
+    except ValueError:
+        status_text = ""
+    response = {
+        "status": status,
+        "statusText": status_text,
+        "httpVersion": f"HTTP/{resp.http_version}",
+        "cookies": [],
+        "headers": _header_list(resp_headers),
+        "content": {"size": resp.body_size or len(resp_body), "mimeType": _mime(resp_headers),
+                    **_body_fields(resp_body)},
+        "redirectURL": next((v for k, v in resp_headers if k.lower() == "location"), ""),
+        "headersSize": -1,
+        "bodySize": resp.body_size or len(resp_body),
+    }
+    entry = {
+        "startedDateTime": _iso(flow.started_at),
+        "time": duration,
+        "request": request,
+        "response": response,
+        "cache": {},
+        "timings": _har_timings(flow, duration),
+    }
+    if flow.error:
+        entry["_error"] = flow.error
+    if flow.timings:
+        # fim de cada fase em ms, como registrado pelo proxy (ver core/metrics.py)
+        entry["_phases"] = flow.timings
+    return entry
+
+
+def entry_to_flow(entry: Dict[str, Any], flow: Flow) -> Flow:
+    """Preenche `flow` (já criado pelo armazém, com id próprio) a partir de uma entrada HAR"""
+    req, resp = entry.get("request", {}), entry.get("response", {})
+    url = urlsplit(req.get("url", ""))
+    flow.method = req.get("method", "GET")
+    flow.scheme = url.scheme or "http"
+    flow.host = url.hostname or ""
+    flow.port = url.port or (443 if flow.scheme == "https" else 80)
+    flow.path = (url.path or "/") + (f"?{url.query}" if url.query else "")
+    if "startedDateTime" in entry:
+        flow.started_at = _from_iso(entry["startedDateTime"])
+    flow.finished_at = flow.started_at + float(entry.get("time") or 0) / 1000
+    flow.status_code = resp.get("status") or None
+    flow.error = entry.get("_error")
+    flow.timings = entry.get("_phases")
+    for msg, side in ((flow.request, req), (flow.response, resp)):
+        msg.headers = [(h["name"], h["value"]) for h in side.get("headers", [])]
+        msg.http_version = side.get("httpVersion", "HTTP/1.1").split("/", 1)[-1]
+    flow.request.body = _body_from(req.get("postData") or {})
+    flow.response.body = _body_from(resp.get("content") or {})
+    flow.request.body_size = len(flow.request.body)
+    flow.response.body_size = max(len(flow.response.body), (resp.get("content") or {}).get("size") or 0)
+    flow.size = flow.response.body_size
+    return flow
+
+
+def export_har(flows: Iterable[Flow], fp: IO[str]) -> int:
+    """Escreve um HAR 1.2 com os flows dados, uma entrada de cada vez"""
+    creator = {"name": "HuginProxy", "version": __version__}
+    fp.write('{"log":{"version":"1.2","creator":%s,"entries":[' % json.dumps(creator))
+    n = 0
+    for flow in flows:
+        if n:
+            fp.write(",")
+        fp.write("\n")
+        fp.write(json.dumps(flow_to_entry(flow), separators=(",", ":")))
+        n += 1
+    fp.write("\n]}}\n")
+    return n
+
+
+def _seek_entries(fp: IO[str], read_size: int) -> str:
+    """Lê o HAR até o '[' de `log.entries`; devolve o resto do buffer depois dele.
+
+    Acompanha o aninhamento e as strings do JSON, então uma chave "entries" em outro nível
+    (ou dentro de um valor) não conta.
+    """
+    buf, pos = "", 0
+    path: List[Optional[str]] = []  # chave de cada objeto/array aberto (None dentro de array)
+    stack: List[str] = []
+    key: Optional[str] = None       # chave do valor corrente no objeto do topo
+    expect_key = False
+    at_entries = False              # logo depois de "entries": dentro de log
+    string: Optional[List[str]] = None
+    while True:
+        if pos >= len(buf):
+            buf, pos = fp.read(read_size), 0
+            if not buf:
+                raise ValueError("no 'entries' array in HAR file")
+        if string is not None:
+            # só as chaves são guardadas; valores (possivelmente grandes) são só pulados
+            m = _STRING_CHUNK.match(buf, pos)
+            if expect_key:
+                string.append(m.group())
+            pos = m.end()
+            if pos >= len(buf):
+                continue
+            if buf[pos] == "\\":
+                if pos + 1 >= len(buf):
+                    more = fp.read(read_size)
+                    if not more:
+                        raise ValueError("unexpected end of HAR file")
+                    buf += more
+                if expect_key:
+                    string.append(buf[pos:pos + 2])
+                pos += 2
+                continue
+            pos += 1
+            if expect_key:
+                key, expect_key = json.loads('"' + "".join(string) + '"'), False
+            string = None
+            continue
+        c = buf[pos]
+        pos += 1
+        if c in " \t\r\n":
+            continue
+        if at_entries:
+            if c != "[":
+                raise ValueError("HAR 'entries' is not an array")
+            return buf[pos:]
+        if c == '"':
+            string = []
+        elif c in "{[":
+            path.append(key if stack and stack[-1] == "{" else None)
+            stack.append(c)
+            key, expect_key = None, c == "{"
+        elif c in "}]":
+            if not stack:
+                raise ValueError("malformed HAR file")
+            stack.pop()
+            path.pop()
+            key = None
+        elif c == ",":
+            if stack and stack[-1] == "{":
+                key, expect_key = None, True
+        elif c == ":":
+            at_entries = key == "entries" and stack == ["{", "{"] and path[1] == "log"
+
+
+def iter_har_entries(fp: IO[str], read_size: int = READ_SIZE) -> Iterator[Dict[str, Any]]:
+    """Percorre `log.entries` de um HAR sem carregar o arquivo inteiro"""
+    decoder = json.JSONDecoder()
+    buf = _seek_entries(fp, read_size)
+    eof = False
+
+    def more(size: int) -> bool:
+        nonlocal buf, eof
+        data = fp.read(size)
+        if not data:
+            eof = True
+            return False
+        buf += data
+        return True
+
+    # pos avança pelo buffer; ele só é compactado quando é preciso ler mais do arquivo
+    pos = 0
+    size = read_size
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        if pos >= len(buf):
+            buf, pos = "", 0
+            if not more(read_size):
+                raise ValueError("unexpected end of HAR file")
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            entry, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # entrada incompleta no buffer: lê mais (em blocos crescentes) e tenta de novo
+            buf, pos = buf[pos:], 0
+            if not more(size):
+                raise
+            size *= 2
+            continue
+        size = read_size
+        pos = end
+        yield entry
+
+
+def import_har(fp: IO[str], store: LRUFlows, limit: Optional[int] = None) -> int:
+    """Adiciona as entradas do HAR ao armazém; o LRU continua valendo durante a importação"""
+    n = 0
+    for entry in iter_har_entries(fp):
+        store.record_size(entry_to_flow(entry, store.new_flow()))
+        n += 1
+        if limit is not None and n >= limit:
+            break
+    return n
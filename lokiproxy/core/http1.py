@@ -0,0 +1,137 @@
+"""Leitura e parse da cabeça das requisições HTTP/1.1 dos clientes.
+
+A linha de requisição e os headers chegam num único readuntil(b"\\r\\n\\r\\n"), são
+decodificados uma vez (ISO-8859-1) e separados em linhas. Um índice por nome em minúsculas
+é montado no mesmo passo, então host, framing do corpo e Connection não percorrem mais a
+lista de headers. Cabeças acima de MAX_HEAD_BYTES (o limite do StreamReader) ou com mais de
+MAX_HEADERS headers são recusadas com 431; linha de requisição ou header malformado, folding
+obsoleto, Content-Length inválido ou conflitante e Transfer-Encoding que não termina em
+chunked, com 400.
+"""
+import re
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+MAX_HEAD_BYTES = 64 * 1024
+MAX_HEADERS = 100
+
+_TOKEN = re.compile(r"[!#$%&'*+\-.^_`|~0-9A-Za-z]+")
+_NAMES = re.compile(r"{0}(?:\n{0})*".format(_TOKEN.pattern))
+_VERSION = re.compile(r"HTTP/1\.[01]")
+# só dígitos ASCII: str.isdigit aceita "²" e outros dígitos Unicode que int() recusa
+_DIGITS = re.compile(r"[0-9]+")
+# headers de lista: ocorrências repetidas são unidas com ", " no índice
+_LIST_HEADERS = frozenset({"connection", "proxy-connection", "transfer-encoding"})
+
+
+class BadRequest(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestHead:
+    __slots__ = ("method", "target", "version", "headers", "raw", "_index")
+
+    def __init__(self, method: str, target: str, version: str, headers: List[Tuple[str, str]],
+                 index: Dict[str, str], raw: bytes = b""):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        # bloco de headers como chegou (sem a linha de requisição), para Message.set_raw_headers
+        self.raw = raw
+        self._index = index
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """Valor do header (nome em minúsculas); a primeira ocorrência, ou todas unidas nos de lista"""
+        return self._index.get(name, default)
+
+    @property
+    def keep_alive(self) -> bool:
+        tokens = {t.strip().lower() for name in ("connection", "proxy-connection")
+                  for t in self._index.get(name, "").split(",")}
+        if "close" in tokens:
+            return False
+        if self.version == "HTTP/1.0":
+            return "keep-alive" in tokens
+        return True
+
+    def framing(self) -> Tuple[bool, Optional[int]]:
+        """(chunked, content_length) do corpo, como body_framing"""
+        te = self._index.get("transfer-encoding")
+        if te is not None:
+            # RFC 9112, seção 6.3: sem chunked como última codificação o tamanho do corpo
+            # da requisição não é determinável
+            if te.split(",")[-1].strip().lower() != "chunked":
+                raise BadRequest(400, f"unsupported Transfer-Encoding {te!r}")
+            return True, None
+        cl = self._index.get("content-length")
+        if cl is None:
+            return False, None
+        if not _DIGITS.fullmatch(cl):
+            raise BadRequest(400, f"invalid Content-Length {cl!r}")
+        return False, int(cl)
+
+
+def parse_request_head(data: bytes) -> RequestHead:
+    """Parse de um bloco terminado em CRLF CRLF (CRLFs soltos antes da linha são ignorados)"""
+    data = data.lstrip(b"\r\n")
+    lines = data.decode("iso-8859-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) == 2:
+        # requisição sem versão: tratada como HTTP/1.0
+        parts.append("HTTP/1.0")
+    if len(parts) != 3 or not _TOKEN.fullmatch(parts[0]) or not parts[1]:
+        raise BadRequest(400, "malformed request line")
+    method, target, version = parts
+    version = version.upper()
+    if not _VERSION.fullmatch(version):
+        raise BadRequest(505 if version.startswith("HTTP/") else 400, f"unsupported version {version!r}")
+
+    headers: List[Tuple[str, str]] = []
+    index: Dict[str, str] = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise BadRequest(400, f"malformed header line {line[:64]!r}")
+        value = value.strip(" \t")
+        headers.append((name, value))
+        lname = name.lower()
+        prev = index.get(lname)
+        if prev is None:
+            index[lname] = value
+        elif lname in _LIST_HEADERS:
+            index[lname] = f"{prev}, {value}"
+        elif lname == "content-length" and value != prev:
+            raise BadRequest(400, "conflicting Content-Length headers")
+    # todos os nomes validados numa só passada do regex; o erro aponta o primeiro inválido
+    if headers and not _NAMES.fullmatch("\n".join([name for name, _ in headers])):
+        name = next(name for name, _ in headers if not _TOKEN.fullmatch(name))
+        if name[:1] in (" ", "\t"):
+            raise BadRequest(400, "obsolete header line folding")
+        raise BadRequest(400, f"malformed header name {name[:64]!r}")
+    if len(headers) > MAX_HEADERS:
+        raise BadRequest(431, f"more than {MAX_HEADERS} headers")
+    start = len(lines[0]) + 2
+    return RequestHead(method, target, version, headers, index, data[start:max(start, len(data) - 2)])
+
+
+async def read_request_head(reader: asyncio.StreamReader) -> Optional[RequestHead]:
+    """Lê e interpreta a próxima cabeça de requisição; None quando o cliente fecha a conexão.
+
+    O tamanho máximo é o limit do StreamReader (use MAX_HEAD_BYTES no start_server).
+    """
+    while True:
+        try:
+            data = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            # EOF: conexão encerrada entre requisições ou no meio de uma cabeça
+            return None
+        except asyncio.LimitOverrunError as e:
+            raise BadRequest(431, "request head too large") from e
+        # só CRLFs soltos entre requisições (RFC 9112, seção 2.2): continua lendo
+        if data.strip(b"\r\n"):
+            return parse_request_head(data)
@@ -0,0 +1,238 @@
+"""Fila do intercept: quais flows pausam, por quanto tempo e quantos ao mesmo tempo.
+
+Com o intercept ligado só pausam os flows que casam com `filter` (a linguagem de
+filters.py, avaliada quando a requisição chega: host, method, path, url); os demais seguem
+direto. Cada flow pausado espera a decisão (FORWARD_FLOW/DROP_FLOW) por até `timeout`
+segundos (contando a espera por vaga, mas não a leitura do corpo) e depois segue com
+`default_action`. No máximo `max_paused` flows ficam pausados ao mesmo tempo: os seguintes
+aguardam vaga em ordem de chegada e só então o corpo da requisição é lido (`prepare` do
+pause) e eles aparecem como pausados (FLOW_PAUSED); enquanto aguardam, ocupam só a conexão
+e a cabeça já lida. Com `max_queued` flows aguardando vaga o proxy para de ler requisições
+novas (admit(), chamado antes de cada cabeça) até a fila baixar. Decisões em lote
+(`decide_matching`) valem para pausados e para os que aguardam vaga; desligar o intercept
+libera todos com forward.
+
+Os ajustes chegam no SET_INTERCEPT: {"on", "filter", "timeout", "default_action",
+"max_paused", "max_queued"}, todos opcionais; as decisões em lote no INTERCEPT_BULK:
+{"action", "filter"}.
+"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from .bus import FLOW_PAUSED, FORWARD_FLOW, DROP_FLOW
+from .filters import FlowFilter
+from .flows import Flow
+
+ACTIONS = {"forward": FORWARD_FLOW, "drop": DROP_FLOW}
+
+
+@dataclass
+class InterceptStats:
+    paused: int = 0
+    queued: int = 0
+    intercepted: int = 0
+    passed: int = 0
+    forwarded: int = 0
+    dropped: int = 0
+    timed_out: int = 0
+    # requisições que esperaram em admit() porque a fila de vagas estava cheia
+    throttled: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def intercept_settings(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Valida e normaliza os ajustes de um SET_INTERCEPT (ValueError se inválidos)"""
+    out: Dict[str, Any] = {}
+    if "on" in data:
+        out["on"] = bool(data["on"])
+    if "filter" in data:
+        FlowFilter(data["filter"] or "")
+        out["filter"] = data["filter"] or ""
+    if "timeout" in data:
+        timeout = data["timeout"]
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout < 0):
+            raise ValueError(f"invalid intercept timeout {timeout!r}")
+        out["timeout"] = timeout or None
+    if "default_action" in data:
+        action = str(data["default_action"]).lower()
+        if action not in ACTIONS:
+            raise ValueError(f"default_action must be one of {', '.join(ACTIONS)}")
+        out["default_action"] = action
+    for name in ("max_paused", "max_queued"):
+        if name in data:
+            n = data[name]
+            if not isinstance(n, int) or isinstance(n, bool) or n < 1:
+                raise ValueError(f"invalid {name} {n!r}")
+            out[name] = n
+    return out
+
+
+class InterceptScheduler:
+    def __init__(self, filter: str = "", timeout: Optional[float] = None,
+                 default_action: str = "forward", max_paused: int = 100, max_queued: int = 1000):
+        self.enabled = False
+        self.filter = FlowFilter("")
+        self.timeout: Optional[float] = None
+        self.default_action = "forward"
+        self.max_paused = max_paused
+        self.max_queued = max_queued
+        self.stats = InterceptStats()
+        # id -> (flow, future da decisão); inclui os que aguardam vaga
+        self._waiting: Dict[int, Tuple[Flow, asyncio.Future]] = {}
+        self._queue: Deque[asyncio.Event] = deque()
+        # livre enquanto a fila de vagas está abaixo de max_queued (ver admit)
+        self._room = asyncio.Event()
+        self._room.set()
+        self.configure(filter=filter, timeout=timeout, default_action=default_action,
+                       max_paused=max_paused, max_queued=max_queued)
+
+    def configure(self, **data) -> Dict[str, Any]:
+        """Aplica os ajustes dados (ver intercept_settings); devolve os aplicados"""
+        settings = intercept_settings(data)
+        if "filter" in settings:
+            self.filter = FlowFilter(settings["filter"])
+        if "timeout" in settings:
+            self.timeout = settings["timeout"]
+        if "default_action" in settings:
+            self.default_action = settings["default_action"]
+        if "max_paused" in settings:
+            self.max_paused = settings["max_paused"]
+            for wake in self._queue:
+                wake.set()
+        if "max_queued" in settings:
+            self.max_queued = settings["max_queued"]
+            self._update_room()
+        if "on" in settings:
+            self.enabled = settings["on"]
+            if not self.enabled:
+                self.decide_matching(FlowFilter(""), FORWARD_FLOW)
+        return settings
+
+    def settings(self) -> Dict[str, Any]:
+        return {"on": self.enabled, "filter": self.filter.query, "timeout": self.timeout,
+                "default_action": self.default_action, "max_paused": self.max_paused,
+                "max_queued": self.max_queued}
+
+    def wants(self, flow: Flow) -> bool:
+        """True se o flow deve pausar; conta os que passam direto com o intercept ligado"""
+        if not self.enabled:
+            return False
+        if self.filter and not self.filter.matches(flow):
+            self.stats.passed += 1
+            return False
+        return True
+
+    async def admit(self) -> None:
+        """Espera enquanto max_queued flows aguardam vaga (antes de ler a próxima requisição)"""
+        if not self._room.is_set():
+            self.stats.throttled += 1
+            await self._room.wait()
+
+    async def pause(self, flow: Flow, where: str,
+                    publish: Callable[[str, Dict[str, Any]], Awaitable[None]],
+                    prepare: Optional[Callable[[], Awaitable[None]]] = None) -> Tuple[str, bool]:
+        """Pausa o flow até a decisão, o timeout ou o intercept ser desligado.
+
+        Devolve (FORWARD_FLOW ou DROP_FLOW, se foi por timeout). `publish` é o publish_core
+        do bus (FLOW_PAUSED). `prepare` roda ao conseguir a vaga, antes do FLOW_PAUSED e fora
+        do timeout; não roda se a decisão chegar enquanto o flow aguarda vaga.
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._waiting[flow.id] = (flow, fut)
+        self.stats.intercepted += 1
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        try:
+            if not await self._acquire(fut, deadline):
+                if fut.done():
+                    return fut.result(), False
+                return self._expire(), True
+            try:
+                if prepare is not None and not fut.done():
+                    started = loop.time()
+                    await prepare()
+                    if deadline is not None:
+                        deadline += loop.time() - started
+                if not fut.done():
+                    await publish(FLOW_PAUSED, {"id": flow.id, "where": where})
+                remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    return await asyncio.wait_for(fut, remaining), False
+                except asyncio.TimeoutError:
+                    return self._expire(), True
+            finally:
+                self.stats.paused -= 1
+                self._wake_next()
+        finally:
+            self._waiting.pop(flow.id, None)
+
+    async def _acquire(self, fut: asyncio.Future, deadline: Optional[float]) -> bool:
+        """Ocupa uma vaga de pausado; False se a decisão ou o prazo chegaram antes"""
+        if self.stats.paused >= self.max_paused or self._queue:
+            # sem vaga: espera a sua vez (FIFO), uma decisão em lote ou o prazo
+            loop = asyncio.get_running_loop()
+            wake = asyncio.Event()
+            fut.add_done_callback(lambda _: wake.set())
+            timer = loop.call_at(deadline, wake.set) if deadline is not None else None
+            self._queue.append(wake)
+            self.stats.queued += 1
+            self._update_room()
+            try:
+                while not fut.done() and (self.stats.paused >= self.max_paused
+                                          or self._queue[0] is not wake):
+                    if deadline is not None and loop.time() >= deadline:
+                        return False
+                    wake.clear()
+                    await wake.wait()
+                if not fut.done() and deadline is not None and loop.time() >= deadline:
+                    return False
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                self._queue.remove(wake)
+                self.stats.queued -= 1
+                self._update_room()
+                self._wake_next()
+        if fut.done():
+            return False
+        self.stats.paused += 1
+        return True
+
+    def _expire(self) -> str:
+        self.stats.timed_out += 1
+        decision = ACTIONS[self.default_action]
+        self._count(decision)
+        return decision
+
+    def _wake_next(self) -> None:
+        if self._queue and self.stats.paused < self.max_paused:
+            self._queue[0].set()
+
+    def _update_room(self) -> None:
+        if self.stats.queued >= self.max_queued:
+            self._room.clear()
+        else:
+            self._room.set()
+
+    def _count(self, decision: str) -> None:
+        if decision == DROP_FLOW:
+            self.stats.dropped += 1
+        else:
+            self.stats.forwarded += 1
+
+    def decide(self, fid: int, decision: str) -> bool:
+        """Entrega FORWARD_FLOW/DROP_FLOW ao flow pausado; outras decisões são ignoradas"""
+        entry = self._waiting.get(fid)
+        if entry is None or entry[1].done() or decision not in (FORWARD_FLOW, DROP_FLOW):
+            return False
+        entry[1].set_result(decision)
+        self._count(decision)
+        return True
+
+    def decide_matching(self, flt: FlowFilter, decision: str) -> List[int]:
+        """Decisão em lote para os flows pausados (ou aguardando vaga) que casam com o filtro"""
+        ids = [fid for fid, (flow, _) in list(self._waiting.items()) if not flt or flt.matches(flow)]
+        return [fid for fid in ids if self.decide(fid, decision)]
@@ -0,0 +1,425 @@
+"""Transporte local entre o core (ProxyServer) e uma GUI em outra thread ou processo.
+
+Cada mensagem é um frame `>II` (tamanho do cabeçalho JSON, tamanho do blob) seguido do
+JSON e do blob binário:
+
+    core → GUI  {"op": "event", "type", "data", "flows": [resumos], "evicted": [ids]}
+                {"op": "reply", "id", "result"} ou {"op": "reply", "id", "error"} (+ blob)
+    GUI → core  {"op": "hello", "token"}              primeiro frame de cada conexão
+                {"op": "cmd", "type", "data"}         comandos do EventBus (SET_INTERCEPT...)
+                {"op": "call", "id", "method", "args"} snapshot, flow, search, har_entries
+
+Os resumos (campos da tabela, sem headers nem corpos) vão junto de cada evento; o flow
+completo só atravessa o socket quando a GUI pede por id ("flow", codificado com encode_flow).
+O CoreServer é o único consumidor da fila core→GUI do EventBus, então uma GUI lenta segura
+o drain do socket e o bus volta a agrupar e descartar eventos como faria com a GUI local.
+
+Endereços: caminho de um socket Unix, ou `tcp://host:porta` onde AF_UNIX não existe. O
+socket Unix só aceita quem pode escrever no arquivo; em TCP qualquer processo local alcança
+a porta, então o CoreServer com `token` (gerado por quem sobe o core e passado ao cliente)
+fecha conexões cujo hello não o traz. Nenhuma chamada recebe caminhos: o cliente lê e grava
+os arquivos HAR no próprio processo e só troca entradas e flows com o core.
+"""
+import hmac
+import os
+import json
+import socket
+import struct
+import asyncio
+import itertools
+import tempfile
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .bus import Event, EventBus, FLOW_BATCH, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, FLOW_PAUSED, LOG_MESSAGE
+from .capture import encode_flow, decode_flow
+from .flows import Flow
+from .proxy import ProxyServer
+
+_FRAME = struct.Struct(">II")
+MAX_FRAME = 512 * 1024 * 1024
+
+# ordem dos campos de um resumo de flow (lista JSON compacta)
+SUMMARY_FIELDS = ("id", "method", "scheme", "host", "port", "path", "status_code",
+                  "started_at", "finished_at", "error", "size")
+
+
+def default_address() -> str:
+    if hasattr(socket, "AF_UNIX"):
+        return os.path.join(tempfile.gettempdir(), f"lokiproxy-{os.getpid()}.sock")
+    # porta efêmera livre agora; o core a ocupa logo em seguida
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"tcp://127.0.0.1:{s.getsockname()[1]}"
+
+
+def is_tcp(address: str) -> bool:
+    return _tcp(address) is not None
+
+
+def _tcp(address: str) -> Optional[Tuple[str, int]]:
+    if not address.startswith("tcp://"):
+        return None
+    host, _, port = address[len("tcp://"):].rpartition(":")
+    return host, int(port)
+
+
+async def _start_server(handler, address: str) -> asyncio.AbstractServer:
+    tcp = _tcp(address)
+    if tcp is not None:
+        return await asyncio.start_server(handler, *tcp)
+    if os.path.exists(address):
+        # socket de uma execução anterior que não foi removido
+        os.unlink(address)
+    return await asyncio.start_unix_server(handler, address)
+
+
+async def _connect(address: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    tcp = _tcp(address)
+    if tcp is not None:
+        return await asyncio.open_connection(*tcp)
+    return await asyncio.open_unix_connection(address)
+
+
+def encode_frame(msg: Dict[str, Any], blob: bytes = b"") -> bytes:
+    raw = json.dumps(msg, separators=(",", ":")).encode("utf-8")
+    return _FRAME.pack(len(raw), len(blob)) + raw + blob
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    n, blob_len = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    if n + blob_len > MAX_FRAME:
+        raise ValueError(f"IPC frame too large ({n + blob_len} bytes)")
+    msg = json.loads(await reader.readexactly(n))
+    blob = await reader.readexactly(blob_len) if blob_len else b""
+    return msg, blob
+
+
+def flow_summary(flow: Flow) -> List[Any]:
+    return [getattr(flow, f) for f in SUMMARY_FIELDS]
+
+
+def event_flow_ids(ev: Event) -> Iterable[int]:
+    if ev.type == FLOW_BATCH:
+        return dict.fromkeys(itertools.chain(ev.data.get("created", ()), ev.data.get("updated", ()),
+                                             ev.data.get("finished", ())))
+    if ev.type in (FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, FLOW_PAUSED):
+        return (ev.data["id"],)
+    return ()
+
+
+class CoreServer:
+    """Expõe o bus e os flows de um ProxyServer para clientes IPC (GUIs)"""
+
+    def __init__(self, proxy: ProxyServer, address: Optional[str] = None, token: Optional[str] = None):
+        self.proxy = proxy
+        self.bus: EventBus = proxy.bus
+        self.address = address or default_address()
+        self.token = token
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._evicted: List[int] = []
+        proxy.flows.on_evict(lambda flow: self._evicted.append(flow.id))
+
+    async def start(self) -> None:
+        self._server = await _start_server(self._handle_client, self.address)
+        tcp = _tcp(self.address)
+        if tcp is not None:
+            self.address = f"tcp://{tcp[0]}:{self._server.sockets[0].getsockname()[1]}"
+        self._pump_task = asyncio.create_task(self._pump())
+
+    async def close(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            self._pump_task = None
+        for t in list(self._tasks):
+            t.cancel()
+        for w in list(self._clients):
+            w.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            if _tcp(self.address) is None:
+                try:
+                    os.unlink(self.address)
+                except OSError:
+                    pass
+
+    async def _pump(self) -> None:
+        """Repassa os eventos do bus a todos os clientes, com os resumos dos flows citados"""
+        flows = self.proxy.flows
+        async for ev in self.bus.subscribe_gui():
+            msg: Dict[str, Any] = {"op": "event", "type": ev.type, "data": ev.data}
+            summaries = [flow_summary(f) for f in map(flows.get, event_flow_ids(ev)) if f is not None]
+            if summaries:
+                msg["flows"] = summaries
+            if self._evicted:
+                msg["evicted"], self._evicted = self._evicted, []
+            if not self._clients:
+                continue
+            frame = encode_frame(msg)
+            for w in list(self._clients):
+                w.write(frame)
+            for w in list(self._clients):
+                try:
+                    await w.drain()
+                except (ConnectionError, RuntimeError):
+                    self._clients.discard(w)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            hello, _ = await asyncio.wait_for(read_frame(reader), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            writer.close()
+            return
+        token = hello.get("token")
+        if hello.get("op") != "hello" or (self.token is not None and not (
+                isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode()))):
+            writer.close()
+            return
+        self._clients.add(writer)
+        try:
+            while True:
+                msg, _ = await read_frame(reader)
+                if msg.get("op") == "cmd":
+                    await self.bus.send_gui_cmd(msg["type"], msg.get("data") or {})
+                elif msg.get("op") == "call":
+                    # chamadas longas (importar HAR) não seguram os comandos seguintes
+                    task = asyncio.create_task(self._call(writer, msg))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _call(self, writer: asyncio.StreamWriter, msg: Dict[str, Any]) -> None:
+        proxy, args, blob = self.proxy, msg.get("args") or {}, b""
+        reply: Dict[str, Any] = {"op": "reply", "id": msg["id"]}
+        try:
+            method = msg["method"]
+            if method == "snapshot":
+                result: Any = [flow_summary(f) for f in proxy.flows]
+            elif method == "flow":
+                flow = proxy.flows.get(int(args["id"]))
+                result = flow is not None
+                if flow is not None:
+                    # corpos no BodyStore são lidos do disco
+                    blob = await asyncio.to_thread(encode_flow, flow)
+            elif method == "search":
+                search = proxy.search
+                result = search.search(args["query"], int(args.get("limit", 50))) if search is not None else []
+            elif method == "har_entries":
+                result = await proxy.add_har_entries(list(args["entries"]))
+            else:
+                raise ValueError(f"unknown IPC method {method!r}")
+            reply["result"] = result
+        except Exception as e:
+            reply["error"] = f"{type(e).__name__}: {e}"
+            blob = b""
+        if not writer.is_closing():
+            writer.write(encode_frame(reply, blob))
+
+
+class RemoteFlows:
+    """Resumos dos flows do core, com a interface de leitura do LRUFlows (all/get/on_evict).
+
+    get() devolve o resumo (Flow sem headers nem corpos); fetch() traz o flow completo.
+    """
+
+    def __init__(self, client: "CoreClient"):
+        self._client = client
+        self._flows: "OrderedDict[int, Flow]" = OrderedDict()
+        self._evict_listeners: List[Callable[[Flow], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def __iter__(self) -> Iterator[Flow]:
+        return iter(self._flows.values())
+
+    def on_evict(self, callback: Callable[[Flow], None]) -> None:
+        self._evict_listeners.append(callback)
+
+    def get(self, fid: int) -> Optional[Flow]:
+        return self._flows.get(fid)
+
+    def all(self) -> List[Flow]:
+        return list(self._flows.values())
+
+    async def fetch(self, fid: int) -> Optional[Flow]:
+        found, blob = await self._client.call_blob("flow", id=fid)
+        return decode_flow(blob) if found else None
+
+    def _apply(self, summaries: Iterable[List[Any]], evicted: Iterable[int]) -> None:
+        for fid in evicted:
+            flow = self._flows.pop(fid, None)
+            if flow is not None:
+                for cb in self._evict_listeners:
+                    cb(flow)
+        for values in summaries:
+            fid = values[0]
+            flow = self._flows.get(fid)
+            if flow is None:
+                flow = self._flows[fid] = Flow(id=fid)
+            # atualizado no lugar: o modelo da tabela guarda a mesma instância
+            for name, value in zip(SUMMARY_FIELDS[1:], values[1:]):
+                setattr(flow, name, value)
+
+
+class RemoteSearch:
+    """Busca textual executada pelo SearchIndex do core"""
+
+    def __init__(self, client: "CoreClient"):
+        self._client = client
+
+    async def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        return [tuple(hit) for hit in await self._client.call("search", query=query, limit=limit)]
+
+
+class CoreClient:
+    """Conexão da GUI com um CoreServer; ocupa o lugar do ProxyServer em `bus.proxy`"""
+    remote = True
+
+    def __init__(self, address: str, max_events: int = 1000, token: Optional[str] = None):
+        self.address = address
+        self.token = token
+        self.flows = RemoteFlows(self)
+        self.search = RemoteSearch(self)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._calls: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        # limitada: com a GUI atrasada a leitura para e o core sente no drain do socket
+        self.events: asyncio.Queue = asyncio.Queue(max_events)
+
+    async def connect(self, timeout: float = 10.0) -> None:
+        """Conecta (esperando o core subir, se preciso) e carrega os flows já existentes"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                self._reader, self._writer = await _connect(self.address)
+                break
+            except OSError:
+                if loop.time() >= deadline:
+                    raise
+                await asyncio.sleep(0.05)
+        self._writer.write(encode_frame({"op": "hello", "token": self.token}))
+        self._task = asyncio.create_task(self._read_loop())
+        self.flows._apply(await self.call("snapshot"), ())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                msg, blob = await read_frame(self._reader)
+                if msg["op"] == "reply":
+                    fut = self._calls.pop(msg["id"], None)
+                    if fut is None or fut.done():
+                        continue
+                    if "error" in msg:
+                        fut.set_exception(RuntimeError(msg["error"]))
+                    else:
+                        fut.set_result((msg["result"], blob))
+                elif msg["op"] == "event":
+                    self.flows._apply(msg.get("flows", ()), msg.get("evicted", ()))
+                    await self.events.put(Event(msg["type"], msg["data"]))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            for fut in self._calls.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("lokiproxy core disconnected"))
+            self._calls.clear()
+            await self.events.put(Event(LOG_MESSAGE, {"msg": "Conexão com o core encerrada"}))
+
+    async def call_blob(self, method: str, **args) -> Tuple[Any, bytes]:
+        if self._writer is None:
+            raise ConnectionError("not connected to a lokiproxy core")
+        cid = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[cid] = fut
+        self._writer.write(encode_frame({"op": "call", "id": cid, "method": method, "args": args}))
+        return await fut
+
+    async def call(self, method: str, **args) -> Any:
+        result, _ = await self.call_blob(method, **args)
+        return result
+
+    async def send_cmd(self, type: str, data: Dict[str, Any]) -> None:
+        if self._writer is None:
+            raise ConnectionError("not connected to a lokiproxy core")
+        self._writer.write(encode_frame({"op": "cmd", "type": type, "data": data}))
+        await self._writer.drain()
+
+    async def import_har(self, path: str, batch_size: int = 500) -> int:
+        """Lê o HAR aqui e manda as entradas ao core em lotes"""
+        from .har import iter_har_entries
+        n = 0
+        with open(path, "r", encoding="utf-8") as fp:
+            entries = iter_har_entries(fp)
+            while True:
+                batch = await asyncio.to_thread(list, itertools.islice(entries, batch_size))
+                if not batch:
+                    return n
+                n += await self.call("har_entries", entries=batch)
+
+    async def export_har(self, path: str) -> int:
+        """Traz os flows completos do core e grava o HAR aqui"""
+        from .har import export_har
+        flows = await asyncio.gather(*(self.flows.fetch(f.id) for f in self.flows.all()))
+
+        def write():
+            with open(path, "w", encoding="utf-8") as fp:
+                return export_har([f for f in flows if f is not None], fp)
+        return await asyncio.to_thread(write)
+
+
+class RemoteBus:
+    """O lado GUI do EventBus (subscribe_gui/send_gui_cmd) sobre um CoreClient"""
+
+    def __init__(self, client: CoreClient):
+        self.proxy = client
+
+    async def subscribe_gui(self):
+        while True:
+            yield await self.proxy.events.get()
+
+    async def send_gui_cmd(self, type: str, data: Dict[str, Any]) -> None:
+        await self.proxy.send_cmd(type, data)
+
+
+async def serve_core(address: str, bus_opts: Optional[Dict[str, Any]] = None, token: Optional[str] = None,
+                     **proxy_opts) -> None:
+    """Roda um ProxyServer e o CoreServer até ser cancelado (modo headless, thread ou processo)"""
+    bus = EventBus(**(bus_opts or {}))
+    proxy = ProxyServer(bus=bus, **proxy_opts)
+    bus.proxy = proxy
+    server = await proxy.start()
+    core = CoreServer(proxy, address, token)
+    await core.start()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await core.close()
+        await proxy.close()
+
+
+def run_core(address: str, bus_opts: Optional[Dict[str, Any]] = None, token: Optional[str] = None,
+             **proxy_opts) -> None:
+    """Ponto de entrada do core numa thread ou processo próprio"""
+    try:
+        asyncio.run(serve_core(address, bus_opts, token, **proxy_opts))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,157 @@
+"""Tempos por fase dos flows, histogramas e contadores do proxy.
+
+O proxy marca em cada flow o fim de cada fase (Flow.mark, ms desde que a cabeça da
+requisição foi lida, relógio monotônico). As fases, na ordem em que acontecem:
+
+    request_head        parse da cabeça da requisição e criação do flow
+    request_body        leitura do corpo do cliente (só quando o corpo é bufferizado)
+    rules               avaliação das regras de requisição
+    intercept           espera pela decisão do operador (intercept ligado)
+    dns_connect         DNS + conexão TCP com a origem (só em conexão nova)
+    tls                 handshake TLS com a origem (só em conexão nova https)
+    request_send        envio da requisição à origem (inclui o corpo em streaming)
+    ttfb                espera pelos headers da resposta
+    response_body       leitura do corpo da origem (só quando bufferizado)
+    response_intercept  espera pela decisão do operador na resposta
+    client_write        escrita da resposta ao cliente (em streaming, a transferência toda)
+    tunnel              túnel CONNECT aberto, até o fechamento
+
+Fases ausentes (conexão reaproveitada, corpo em streaming) simplesmente não aparecem: cada
+fase começa onde terminou a anterior registrada.
+"""
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .flows import Flow
+
+PHASES = ("request_head", "request_body", "rules", "intercept", "dns_connect", "tls", "request_send",
+          "ttfb", "response_body", "response_intercept", "client_write", "tunnel")
+# limites superiores dos baldes, em ms (o último balde é +inf)
+BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+COUNTERS = ("connections", "requests", "bytes_in", "bytes_out", "errors", "rule_hits")
+
+
+def phase_spans(timings: Optional[Dict[str, float]]) -> List[Tuple[str, float, float]]:
+    """[(fase, início ms, fim ms)] na ordem de PHASES"""
+    spans, start = [], 0.0
+    for phase in PHASES:
+        end = (timings or {}).get(phase)
+        if end is None:
+            continue
+        spans.append((phase, start, max(end, start)))
+        start = max(end, start)
+    return spans
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.sum += ms
+        self.count += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"counts": list(self.counts), "sum": round(self.sum, 3), "count": self.count}
+
+
+class Metrics:
+    """Contadores do proxy e histogramas das fases e da duração total dos flows"""
+
+    def __init__(self):
+        self.active_connections = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.rule_hits: Dict[str, int] = {}
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.total = Histogram()
+
+    def connection_opened(self) -> None:
+        self.active_connections += 1
+        self.counters["connections"] += 1
+
+    def connection_closed(self) -> None:
+        self.active_connections -= 1
+
+    def rule_hit(self, rule) -> None:
+        self.counters["rule_hits"] += 1
+        self.rule_hits[rule.name] = self.rule_hits.get(rule.name, 0) + 1
+
+    def observe_flow(self, flow: Flow) -> None:
+        c = self.counters
+        c["requests"] += 1
+        c["bytes_in"] += flow.request.body_size
+        c["bytes_out"] += flow.response.body_size
+        if flow.error:
+            c["errors"] += 1
+        spans = phase_spans(flow.timings)
+        for phase, start, end in spans:
+            self.phases[phase].observe(end - start)
+        if spans:
+            self.total.observe(spans[-1][2])
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"active_connections": self.active_connections, "counters": dict(self.counters),
+                "rule_hits": dict(self.rule_hits), "buckets_ms": list(BUCKETS_MS),
+                "total": self.total.as_dict(),
+                "phases": {p: h.as_dict() for p, h in self.phases.items() if h.count}}
+
+
+def merge_metrics(snapshots: Iterable[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Soma os as_dict() de vários proxies (workers de um WorkerPool)"""
+    out = Metrics().as_dict()
+
+    def add(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+        dst["counts"] = [a + b for a, b in zip(dst["counts"], src["counts"])]
+        dst["sum"] = round(dst["sum"] + src["sum"], 3)
+        dst["count"] += src["count"]
+
+    for snap in snapshots:
+        if not snap:
+            continue
+        out["active_connections"] += snap["active_connections"]
+        for k, v in snap["counters"].items():
+            out["counters"][k] = out["counters"].get(k, 0) + v
+        for k, v in snap["rule_hits"].items():
+            out["rule_hits"][k] = out["rule_hits"].get(k, 0) + v
+        add(out["total"], snap["total"])
+        for phase, h in snap["phases"].items():
+            add(out["phases"].setdefault(phase, Histogram().as_dict()), h)
+    return out
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def prometheus_text(snap: Dict[str, Any]) -> str:
+    """Formato de exposição de texto do Prometheus (durações em segundos)"""
+    lines = ["# TYPE lokiproxy_active_connections gauge",
+             f"lokiproxy_active_connections {snap['active_connections']}"]
+    for name, value in snap["counters"].items():
+        lines += [f"# TYPE lokiproxy_{name}_total counter", f"lokiproxy_{name}_total {value}"]
+    if snap["rule_hits"]:
+        lines.append("# TYPE lokiproxy_rule_hits_by_rule_total counter")
+        lines += [f'lokiproxy_rule_hits_by_rule_total{{rule="{_label(rule)}"}} {n}'
+                  for rule, n in snap["rule_hits"].items()]
+
+    def histogram(name: str, label: str, h: Dict[str, Any]) -> None:
+        cumulative = 0
+        for bound, n in zip(list(snap["buckets_ms"]) + ["+Inf"], h["counts"]):
+            cumulative += n
+            le = bound if bound == "+Inf" else f"{bound / 1000:g}"
+            lines.append(f'{name}_bucket{{{label + "," if label else ""}le="{le}"}} {cumulative}')
+        suffix = f"{{{label}}}" if label else ""
+        lines.append(f"{name}_sum{suffix} {h['sum'] / 1000:g}")
+        lines.append(f"{name}_count{suffix} {h['count']}")
+
+    lines.append("# TYPE lokiproxy_flow_duration_seconds histogram")
+    histogram("lokiproxy_flow_duration_seconds", "", snap["total"])
+    lines.append("# TYPE lokiproxy_phase_duration_seconds histogram")
+    for phase, h in snap["phases"].items():
+        histogram("lokiproxy_phase_duration_seconds", f'phase="{phase}"', h)
+    return "\n".join(lines) + "\n"
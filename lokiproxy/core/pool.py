@@ -0,0 +1,188 @@
+import ssl
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+import certifi
+import httpcore
+from .resolver import Resolver, ResolvingBackend
+
+# Headers hop-by-hop: dizem respeito a uma conexão específica e não devem ser
+# repassados entre cliente e origem (RFC 9110, seção 7.6.1).
+HOP_BY_HOP = {
+    "connection",
+    "proxy-connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+def strip_hop_by_hop(headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    extra = set()
+    for k, v in headers:
+        if k.lower() == "connection":
+            extra.update(t.strip().lower() for t in v.split(","))
+    return [(k, v) for k, v in headers if k.lower() not in HOP_BY_HOP and k.lower() not in extra]
+
+
+def _request_headers(headers: List[Tuple[str, str]],
+                     body: Union[bytes, AsyncIterator[bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Refaz o enquadramento do corpo para a origem a partir do que será de fato enviado"""
+    length = next((v for k, v in headers if k.lower() == "content-length"), None)
+    hdrs = [(k, v) for k, v in strip_hop_by_hop(headers) if k.lower() != "content-length"]
+    if isinstance(body, bytes):
+        if body or length is not None:
+            hdrs.append(("Content-Length", str(len(body))))
+    elif length is not None and not any(k.lower() == "transfer-encoding" for k, _ in headers):
+        hdrs.append(("Content-Length", length))
+    else:
+        hdrs.append(("Transfer-Encoding", "chunked"))
+    return [(k.encode("iso-8859-1"), v.encode("iso-8859-1")) for k, v in hdrs]
+
+
+@dataclass
+class PoolStats:
+    requests: int = 0
+    hits: int = 0
+    new_connections: int = 0
+    evictions: int = 0
+    origins: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class UpstreamPool:
+    """Pool de conexões keep-alive para as origens, com um pool httpcore por origem."""
+
+    def __init__(self, max_per_host: int = 10, idle_timeout: float = 30.0, http2: bool = False,
+                 timeout: float = 30.0, verify: bool = True, resolver: Optional[Resolver] = None):
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError as e:
+                raise RuntimeError("HTTP/2 upstream requires the 'h2' package (pip install h2)") from e
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.http2 = http2
+        self.timeout = timeout
+        # Um único SSLContext para todas as origens (o httpcore criaria um por pool,
+        # carregando o bundle de CAs a cada origem nova)
+        self.ssl_context = self._ssl_context(verify)
+        # DNS com cache e happy eyeballs compartilhados por todos os pools (e pelo CONNECT)
+        self.resolver = resolver
+        self.network_backend = ResolvingBackend(resolver) if resolver is not None else None
+        self.stats = PoolStats()
+        self._pools: Dict[Tuple[bytes, bytes, int], httpcore.AsyncConnectionPool] = {}
+        self._last_used: Dict[Tuple[bytes, bytes, int], float] = {}
+        self._inflight: Dict[Tuple[bytes, bytes, int], int] = {}
+
+    @staticmethod
+    def _ssl_context(verify: bool) -> ssl.SSLContext:
+        if not verify:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+            return ctx
+        return ssl.create_default_context(cafile=certifi.where())
+
+    def _pool_for(self, key: Tuple[bytes, bytes, int]) -> httpcore.AsyncConnectionPool:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = httpcore.AsyncConnectionPool(
+                max_connections=self.max_per_host,
+                max_keepalive_connections=self.max_per_host,
+                keepalive_expiry=self.idle_timeout,
+                http1=True,
+                http2=self.http2,
+                ssl_context=self.ssl_context,
+                network_backend=self.network_backend,
+            )
+            self._pools[key] = pool
+            self.stats.origins = len(self._pools)
+        return pool
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, headers: List[Tuple[str, str]],
+                     body: Union[bytes, AsyncIterator[bytes]],
+                     on_trace: Optional[Callable[[str], None]] = None):
+        """Envia a requisição e entrega (status, headers, iterador do corpo) sem bufferizar a resposta.
+
+        on_trace recebe o nome de cada evento de trace do httpcore (tempos por fase).
+        """
+        target = httpcore.URL(url)
+        key = target.origin.scheme, target.origin.host, target.origin.port
+        pool = self._pool_for(key)
+        new_conn = False
+
+        async def trace(event_name, info):
+            nonlocal new_conn
+            if event_name == "connection.connect_tcp.complete":
+                new_conn = True
+            if on_trace is not None:
+                on_trace(event_name)
+
+        extensions = {
+            "trace": trace,
+            "timeout": {"connect": self.timeout, "read": self.timeout,
+                        "write": self.timeout, "pool": self.timeout},
+        }
+        self.stats.requests += 1
+        self._inflight[key] = self._inflight.get(key, 0) + 1
+        counted = False
+        try:
+            async with pool.stream(method.encode("ascii"), target,
+                                   headers=_request_headers(headers, body),
+                                   content=body, extensions=extensions) as r:
+                self._count(new_conn)
+                counted = True
+                resp_headers = [(k.decode("iso-8859-1"), v.decode("iso-8859-1")) for k, v in r.headers]
+                yield r.status, strip_hop_by_hop(resp_headers), r.aiter_stream()
+        finally:
+            if not counted:
+                self._count(new_conn)
+            self._inflight[key] -= 1
+            self._last_used[key] = time.monotonic()
+
+    def _count(self, new_conn: bool):
+        if new_conn:
+            self.stats.new_connections += 1
+        else:
+            self.stats.hits += 1
+
+    async def request(self, method: str, url: str, headers: List[Tuple[str, str]],
+                      body: bytes) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        async with self.stream(method, url, headers, body) as (status, resp_headers, chunks):
+            content = b"".join([data async for data in chunks])
+        return status, resp_headers, content
+
+    async def evict_idle(self) -> int:
+        """Fecha os pools de origens sem uso há mais que idle_timeout."""
+        now = time.monotonic()
+        evicted = 0
+        for key, last in list(self._last_used.items()):
+            if now - last < self.idle_timeout or self._inflight.get(key):
+                continue
+            pool = self._pools.pop(key, None)
+            self._last_used.pop(key, None)
+            self._inflight.pop(key, None)
+            if pool is None:
+                continue
+            evicted += len(pool.connections)
+            await pool.aclose()
+        self.stats.evictions += evicted
+        self.stats.origins = len(self._pools)
+        return evicted
+
+    async def aclose(self):
+        for pool in self._pools.values():
+            await pool.aclose()
+        self._pools.clear()
+        self._last_used.clear()
+        self._inflight.clear()
+        self.stats.origins = 0
@@ -0,0 +1,132 @@
+"""Formatação de corpos para exibição sem materializar o corpo inteiro.
+
+BodySource dá acesso por faixa ao corpo de uma Message (memoryview quando está em memória,
+páginas lidas sob demanda quando está no BodyStore) e hex_line monta uma linha do dump a
+partir do offset, então um visualizador só formata as linhas visíveis. render_body decodifica
+e, para JSON, indenta o texto; é feito para rodar fora da thread da GUI.
+"""
+import re
+import json
+import codecs
+from collections import OrderedDict
+from typing import List, Optional, Tuple, Union
+from .flows import Message
+
+# Acima disso o texto mostra só uma prévia do início do corpo
+PREVIEW_LIMIT = 1024 * 1024
+# JSON maior que isso não é indentado (json.loads + dumps custa várias vezes o tamanho)
+PRETTY_LIMIT = 8 * 1024 * 1024
+HEX_WIDTH = 16
+
+_CHARSET = re.compile(r"charset\s*=\s*\"?([\w.:-]+)", re.I)
+_PRINTABLE = bytes(b if 32 <= b < 127 else 46 for b in range(256))
+
+
+def hex_line(data: Union[bytes, memoryview], offset: int, width: int = HEX_WIDTH) -> str:
+    """Linha do dump hex com os bytes data (que começam em offset)"""
+    chunk = bytes(data)
+    hexpart = chunk.hex(" ")
+    asc = chunk.translate(_PRINTABLE).decode("ascii")
+    return f"{offset:08x}  {hexpart:<{width * 3}}  {asc}"
+
+
+def hex_dump(data: bytes, width: int = HEX_WIDTH) -> str:
+    view = memoryview(data)
+    return "\n".join(hex_line(view[i:i + width], i, width) for i in range(0, len(data), width))
+
+
+class BodySource:
+    """Acesso por faixa ao corpo de uma Message.
+
+    Corpos em memória são fatiados por memoryview, sem cópia; corpos no BodyStore são lidos
+    em páginas de page_size bytes, das quais as últimas cache_pages ficam em cache.
+    """
+
+    def __init__(self, msg: Message, page_size: int = 64 * 1024, cache_pages: int = 16):
+        self.length = msg.body_length
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self._msg = msg
+        self._view: Optional[memoryview] = None if msg.offloaded else memoryview(msg.body)
+        self._pages: "OrderedDict[int, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _page(self, n: int) -> bytes:
+        page = self._pages.get(n)
+        if page is None:
+            page = self._msg.read_body(n * self.page_size, self.page_size)
+            self._pages[n] = page
+            if len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(n)
+        return page
+
+    def read(self, start: int, length: int) -> Union[bytes, memoryview]:
+        end = min(start + length, self.length)
+        if start >= end:
+            return b""
+        if self._view is not None:
+            return self._view[start:end]
+        first, last = start // self.page_size, (end - 1) // self.page_size
+        data = b"".join(self._page(n) for n in range(first, last + 1))
+        skip = start - first * self.page_size
+        return data[skip:skip + end - start]
+
+    def rows(self, width: int = HEX_WIDTH) -> int:
+        return -(-self.length // width)
+
+    def hex_line(self, row: int, width: int = HEX_WIDTH) -> str:
+        offset = row * width
+        return hex_line(self.read(offset, width), offset, width)
+
+
+def _header(headers: List[Tuple[str, str]], name: str) -> str:
+    name = name.lower()
+    return next((v for k, v in headers if k.lower() == name), "")
+
+
+def _charset(content_type: str) -> str:
+    m = _CHARSET.search(content_type)
+    if m:
+        try:
+            return codecs.lookup(m.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def render_body(msg: Message, limit: int = PREVIEW_LIMIT, pretty: bool = True) -> Tuple[str, bool]:
+    """Texto do corpo para exibição e se ele foi truncado na prévia.
+
+    Só os primeiros limit bytes são lidos; JSON completo (até PRETTY_LIMIT) é indentado.
+    """
+    length = msg.body_length
+    truncated = limit is not None and length > limit
+    body = msg.read_body(0, limit if truncated else None)
+    content_type = _header(msg.headers, "content-type")
+    text = body.decode(_charset(content_type), errors="replace")
+    if pretty and not truncated and length <= PRETTY_LIMIT and _looks_json(content_type, text):
+        try:
+            text = json.dumps(json.loads(text), indent=2, ensure_ascii=False)
+        except ValueError:
+            pass
+    notes = []
+    if truncated:
+        notes.append(f"[prévia: primeiros {limit} de {length} bytes]")
+    missing = msg.body_size - length
+    if missing > 0:
+        where = f" (restante em {msg.spill_path})" if msg.spill_path else ""
+        notes.append(f"[... {missing} bytes não capturados{where}]")
+    if notes:
+        text += "\n\n" + "\n".join(notes)
+    return text, truncated
+
+
+def _looks_json(content_type: str, text: str) -> bool:
+    if "json" in content_type.lower():
+        return True
+    head = text[:64].lstrip()[:1]
+    return not content_type and head in ("{", "[")
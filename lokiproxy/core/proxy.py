@@ -1,53 +1,233 @@
+import os
+import ssl
+import sys
+import time
 import asyncio
-import httpx
-from typing import Tuple, List, Optional
-from .flows import LRUFlows, Flow
-from .bus import EventBus, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, FLOW_PAUSED, LOG_MESSAGE, SET_INTERCEPT, FORWARD_FLOW, DROP_FLOW, REPEAT_FLOW
-from .rules import Ruleset, apply_rules
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Tuple, List, Optional
+from .flows import LRUFlows, Flow, Message
+from .bus import EventBus, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, LOG_MESSAGE, METRICS, SET_INTERCEPT, FORWARD_FLOW, DROP_FLOW, REPEAT_FLOW, APPLY_RULES, INTERCEPT_BULK
+from .rules import Ruleset, apply_rules, needs_buffering
+from .pool import UpstreamPool
+from .resolver import HAPPY_EYEBALLS_DELAY, Resolver
+from .bodystore import BodyStore
+from .capture import CaptureWriter
+from .ca import ensure_ca
+from .certs import CertCache
+from .tunnel import Tunnel
+from .search import SearchIndex
+from .filters import FlowFilter
+from .intercept import ACTIONS, InterceptScheduler
+from .http1 import MAX_HEAD_BYTES, BadRequest, RequestHead, read_request_head
+from .metrics import Metrics
+from .streaming import BodyCapture, body_framing, iter_chunked, iter_fixed, encode_chunk, LAST_CHUNK
+
+# eventos de trace do httpcore que encerram uma fase do flow (ver core/metrics.py)
+_TRACE_PHASES = {
+    "connection.connect_tcp.complete": "dns_connect",
+    "connection.start_tls.complete": "tls",
+    "http11.send_request_body.complete": "request_send",
+    "http2.send_request_body.complete": "request_send",
+    "http11.receive_response_headers.complete": "ttfb",
+    "http2.receive_response_headers.complete": "ttfb",
+}
 
 class ProxyServer:
-    def __init__(self, host="127.0.0.1", port=8080, bus: Optional[EventBus]=None):
+    def __init__(self, host="127.0.0.1", port=8080, bus: Optional[EventBus]=None,
+                 max_conns_per_host: int = 10, idle_timeout: float = 30.0, http2: bool = False,
+                 stats_interval: float = 5.0, client_idle_timeout: float = 60.0,
+                 max_requests_per_conn: int = 1000, stream_bodies: bool = True,
+                 capture_limit: int = 1024 * 1024, spill_dir: Optional[str] = None,
+                 merge_rule_regexes: bool = False, max_flows: int = 2000,
+                 max_flow_bytes: Optional[int] = None, body_store_threshold: Optional[int] = None,
+                 body_store_dir: Optional[str] = None, capture_path: Optional[str] = None,
+                 capture_compression: str = "none", mitm: bool = False,
+                 cert_dir: Optional[str] = None, leaf_key_type: str = "rsa",
+                 shared_leaf_key: bool = True, wildcard_certs: bool = True,
+                 upstream_verify: bool = True, search_index: bool = True,
+                 reuse_port: bool = False, flow_id_start: int = 1, flow_id_step: int = 1,
+                 dns_ttl: float = 60.0, dns_negative_ttl: float = 5.0,
+                 dns_hosts: Optional[Dict[str, List[str]]] = None,
+                 happy_eyeballs_delay: float = HAPPY_EYEBALLS_DELAY, intercept_filter: str = "",
+                 intercept_timeout: Optional[float] = None, intercept_default: str = "forward",
+                 max_paused: int = 100, max_queued: int = 1000):
         self.host = host
         self.port = port
-        self.flows = LRUFlows(2000)
+        self.flows = LRUFlows(max_flows, max_bytes=max_flow_bytes, first_id=flow_id_start,
+                              id_step=flow_id_step)
+        self.flows.on_evict(self._release_bodies)
+        # Corpos acima de body_store_threshold vão para segmentos em disco ao fim do flow
+        self.body_store_threshold = body_store_threshold
+        self.body_store = BodyStore(body_store_dir) if body_store_threshold is not None else None
+        self.capture = CaptureWriter(capture_path, capture_compression) if capture_path else None
         self.bus = bus or EventBus()
-        self.intercept = False
-        self.ruleset = Ruleset()
-        self._pending_forwards = {}
+        # Quais flows pausam no intercept, por quanto tempo, quantos ao mesmo tempo e quantos
+        # na fila antes de parar de ler requisições novas
+        self.interceptor = InterceptScheduler(filter=intercept_filter, timeout=intercept_timeout,
+                                              default_action=intercept_default, max_paused=max_paused,
+                                              max_queued=max_queued)
+        self.merge_rule_regexes = merge_rule_regexes
+        self.ruleset = Ruleset().compile(merge_rule_regexes)
+        # DNS com cache (TTL, negativo, consultas juntadas, hosts estáticos) e happy eyeballs,
+        # usado pelo pool upstream e pelos túneis CONNECT
+        self.resolver = Resolver(ttl=dns_ttl, negative_ttl=dns_negative_ttl, hosts=dns_hosts,
+                                 happy_eyeballs_delay=happy_eyeballs_delay)
+        self.upstream = UpstreamPool(max_per_host=max_conns_per_host, idle_timeout=idle_timeout,
+                                     http2=http2, verify=upstream_verify, resolver=self.resolver)
+        self.stats_interval = stats_interval
+        self._tasks: List[asyncio.Task] = []
+        self.client_idle_timeout = client_idle_timeout
+        self.max_requests_per_conn = max_requests_per_conn
+        self.stream_bodies = stream_bodies
+        self.capture_limit = capture_limit
+        self.spill_dir = spill_dir
+        # Com mitm o TLS dos CONNECT é terminado aqui e as requisições internas passam pelo
+        # mesmo caminho do HTTP; sem ele o CONNECT vira um túnel de bytes
+        if mitm and not hasattr(asyncio.StreamWriter, "start_tls"):
+            raise RuntimeError("TLS interception requires Python 3.11+")
+        self.mitm = mitm
+        self.cert_dir = cert_dir
+        self.leaf_key_type = leaf_key_type
+        self.shared_leaf_key = shared_leaf_key
+        self.wildcard_certs = wildcard_certs
+        self.certs: Optional[CertCache] = None
+        self.metrics = Metrics()
+        # SO_REUSEPORT: vários processos (WorkerPool) escutam na mesma porta
+        self.reuse_port = reuse_port
+        # Índice de busca textual alimentado por uma thread; flows expulsos saem dele
+        self.search: Optional[SearchIndex] = SearchIndex() if search_index else None
+        if self.search is not None:
+            self.flows.on_evict(lambda flow: self.search.remove(flow.id))
 
-    async def serve(self):
-        asyncio.create_task(self._gui_cmd_loop())
-        server = await asyncio.start_server(self._handle_client, self.host, self.port)
+    @property
+    def intercept(self) -> bool:
+        return self.interceptor.enabled
+
+    @intercept.setter
+    def intercept(self, on: bool) -> None:
+        self.interceptor.configure(on=on)
+
+    async def start(self) -> asyncio.AbstractServer:
+        """Abre o listener e as tasks de fundo sem bloquear (port=0 escolhe uma porta livre)"""
+        self._tasks = [asyncio.create_task(self._gui_cmd_loop()),
+                       asyncio.create_task(self._stats_loop())]
+        if self.capture is not None:
+            self.capture.start()
+        if self.search is not None:
+            self.search.start()
+        if self.mitm and self.certs is None:
+            ca_cert, ca_key = await asyncio.to_thread(ensure_ca)
+            self.certs = CertCache(ca_cert, ca_key, directory=self.cert_dir, key_type=self.leaf_key_type,
+                                   shared_key=self.shared_leaf_key, wildcard=self.wildcard_certs)
+        # o limite do StreamReader é o tamanho máximo da cabeça de uma requisição
+        server = await asyncio.start_server(self._handle_client, self.host, self.port,
+                                            limit=MAX_HEAD_BYTES, reuse_port=self.reuse_port or None)
+        self.port = server.sockets[0].getsockname()[1]
         await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Proxy listening on {self.host}:{self.port}"})
-        async with server:
-            await server.serve_forever()
+        return server
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+        await self.upstream.aclose()
+        if self.capture is not None:
+            await self.capture.close()
+        if self.body_store is not None:
+            self.body_store.close()
+        if self.certs is not None:
+            self.certs.close()
+        if self.search is not None:
+            self.search.close()
+
+    async def serve(self):
+        server = await self.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.close()
+
+    async def export_har(self, path: str) -> int:
+        """Exporta os flows atuais para um HAR; a escrita acontece numa thread"""
+        from .har import export_har
+        flows = self.flows.all()
+
+        def write():
+            with open(path, "w", encoding="utf-8") as fp:
+                return export_har(flows, fp)
+        return await asyncio.to_thread(write)
+
+    async def import_har(self, path: str, batch_size: int = 500) -> int:
+        """Importa as entradas de um HAR como flows, lendo-as em lotes numa thread"""
+        import itertools
+        from .har import iter_har_entries
+        n = 0
+        with open(path, "r", encoding="utf-8") as fp:
+            entries = iter_har_entries(fp)
+            while True:
+                batch = await asyncio.to_thread(list, itertools.islice(entries, batch_size))
+                if not batch:
+                    return n
+                n += await self.add_har_entries(batch)
+
+    async def add_har_entries(self, entries: List[Dict[str, Any]]) -> int:
+        """Cria um flow por entrada HAR já lida (import_har, ou o cliente IPC que leu o arquivo)"""
+        from .har import entry_to_flow
+        for entry in entries:
+            flow = entry_to_flow(entry, self.flows.new_flow())
+            self.flows.record_size(flow)
+            if self.search is not None:
+                self.search.submit(flow)
+            await self.bus.publish_core(FLOW_CREATED, {"id": flow.id})
+        return len(entries)
+
+    def stats(self) -> dict:
+        stats = {"pool": self.upstream.stats.as_dict(), "dns": self.resolver.stats.as_dict(),
+                 "bus": self.bus.stats.as_dict(), "intercept_queue": self.interceptor.stats.as_dict(),
+                 "metrics": self.metrics.as_dict()}
+        if self.search is not None:
+            stats["search"] = self.search.stats.as_dict()
+        return stats
+
+    async def _stats_loop(self):
+        """Expira origens ociosas e publica as estatísticas do pool upstream e do bus"""
+        last = None
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            evicted = await self.upstream.evict_idle()
+            if evicted:
+                await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Upstream pool evicted {evicted} idle connection(s)"})
+            stats = self.stats()
+            if stats != last:
+                await self.bus.publish_core(METRICS, stats)
+                last = stats
 
     async def _gui_cmd_loop(self):
         while True:
             ev = await self.bus.consume_gui_cmd()
             if ev.type == SET_INTERCEPT:
-                self.intercept = bool(ev.data.get("on", False))
+                try:
+                    self.interceptor.configure(**ev.data)
+                except ValueError as e:
+                    await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Invalid intercept settings: {e}"})
+                    continue
                 await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Intercept set to {self.intercept}"})
             elif ev.type in (FORWARD_FLOW, DROP_FLOW, REPEAT_FLOW):
-                fid = int(ev.data["flow_id"])
-                fut = self._pending_forwards.get(fid)
-                if fut and not fut.done():
-                    fut.set_result(ev.type)
-            elif ev.type == "ApplyRules":
-                self.ruleset = Ruleset(**ev.data["ruleset"])
-
-    async def _read_line(self, reader: asyncio.StreamReader) -> bytes:
-        return await reader.readline()
-
-    async def _read_headers(self, reader: asyncio.StreamReader) -> List[Tuple[str, str]]:
-        headers = []
-        while True:
-            line = await reader.readline()
-            if not line or line in (b"\r\n", b"\n"):
-                break
-            k, v = line.decode("iso-8859-1").split(":", 1)
-            headers.append((k.strip(), v.strip()))
-        return headers
+                # só forward/drop decidem um flow pausado; Repeat não o libera
+                self.interceptor.decide(int(ev.data["flow_id"]), ev.type)
+            elif ev.type == INTERCEPT_BULK:
+                try:
+                    action = ACTIONS[str(ev.data.get("action", "forward")).lower()]
+                    flt = FlowFilter(ev.data.get("filter") or "")
+                except (KeyError, ValueError) as e:
+                    await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Invalid bulk intercept command: {e}"})
+                    continue
+                ids = self.interceptor.decide_matching(flt, action)
+                await self.bus.publish_core(LOG_MESSAGE, {"msg": f"{action} {len(ids)} paused flow(s)"})
+            elif ev.type == APPLY_RULES:
+                self.ruleset = Ruleset(**ev.data["ruleset"]).compile(self.merge_rule_regexes)
+                await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Applied {len(self.ruleset.rules)} rule(s)"})
 
     def _split_host(self, host: str) -> Tuple[str, int]:
         if ":" in host:
@@ -59,181 +239,407 @@ class ProxyServer:
         return host, 80
 
     async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.metrics.connection_opened()
         try:
-            line = await self._read_line(reader)
-            if not line:
-                writer.close(); await writer.wait_closed(); return
-            req_line = line.decode("iso-8859-1").strip()
-            parts = req_line.split(" ", 2)
-            if len(parts) < 2:
-                writer.close(); await writer.wait_closed(); return
-            method, target = parts[0], parts[1]
-            headers = await self._read_headers(reader)
-
-            if method.upper() == "CONNECT":
-                host, port = self._split_host(target)
-                
-                # Criar flow para requisições CONNECT também
-                flow = self.flows.new_flow()
-                flow.method = method
-                flow.scheme = "https"
-                flow.host = host
-                flow.port = port
-                flow.path = f"{host}:{port}"
-                flow.request.headers = headers
-                flow.request.body = b""
-                await self.bus.publish_core(FLOW_CREATED, {"id": flow.id})
-                
-                # Intercept CONNECT se necessário
-                if self.intercept:
-                    await self.bus.publish_core(FLOW_PAUSED, {"id": flow.id, "where": "request"})
-                    fut = asyncio.get_event_loop().create_future()
-                    self._pending_forwards[flow.id] = fut
-                    decision = await fut
-                    self._pending_forwards.pop(flow.id, None)
-                    if decision == DROP_FLOW:
-                        flow.error = "Dropped by user at request"
-                        await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
-                        writer.close(); await writer.wait_closed(); return
-                    elif decision != FORWARD_FLOW:
-                        # Se não foi forward nem drop, aguarda novamente
-                        await self.bus.publish_core(FLOW_PAUSED, {"id": flow.id, "where": "request"})
-                        fut = asyncio.get_event_loop().create_future()
-                        self._pending_forwards[flow.id] = fut
-                        decision = await fut
-                        self._pending_forwards.pop(flow.id, None)
-                        if decision == DROP_FLOW:
-                            flow.error = "Dropped by user at request"
-                            await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
-                            writer.close(); await writer.wait_closed(); return
-                
-                # MVP: simple TCP tunnel (no MITM in this minimal file, see README for scope)
-                await self._tunnel(reader, writer, host, port)
-                
-                # Marcar como finalizado
-                flow.status_code = 200
-                await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
-                return
-
-            host_header = next((v for (k, v) in headers if k.lower() == "host"), "")
-            url = target if target.startswith("http") else f"http://{host_header}{target}"
+            await self._request_loop(reader, writer)
+        except Exception as e:
+            try:
+                await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Handler error: {e!r}"})
+            except Exception:
+                pass
+        finally:
+            self.metrics.connection_closed()
+            try:
+                writer.close(); await writer.wait_closed()
+            except Exception:
+                pass
 
-            body = b""
-            cl = next((v for (k, v) in headers if k.lower() == "content-length"), None)
-            if cl:
-                body = await reader.readexactly(int(cl))
+    async def _request_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            origin: Optional[Tuple[str, int]] = None):
+        """Keep-alive: atende requisições em sequência na mesma conexão.
+
+        Requisições pipelined já ficam no buffer do reader e são respondidas na ordem de
+        chegada. `origin` é o alvo do CONNECT quando a conexão é um túnel TLS interceptado.
+        """
+        served = 0
+        while served < self.max_requests_per_conn:
+            # com a fila do intercept cheia não lê requisições novas (nem cabeças)
+            await self.interceptor.admit()
+            try:
+                head = await asyncio.wait_for(read_request_head(reader), self.client_idle_timeout)
+            except asyncio.TimeoutError:
+                break
+            except BadRequest as e:
+                await self._write_response(writer, "GET", e.status, [("Content-Type", "text/plain")],
+                                           str(e).encode("utf-8"), keep_alive=False)
+                await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Rejected client request: {e}"})
+                break
+            if head is None:
+                break
+            served += 1
+            try:
+                keep_alive = await self._handle_request(reader, writer, head,
+                                                        last=served >= self.max_requests_per_conn,
+                                                        origin=origin, t0=time.perf_counter())
+            except BadRequest as e:
+                await self._write_response(writer, head.method, e.status, [("Content-Type", "text/plain")],
+                                           str(e).encode("utf-8"), keep_alive=False)
+                break
+            if not keep_alive:
+                break
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              head: RequestHead, last: bool = False,
+                              origin: Optional[Tuple[str, int]] = None, t0: Optional[float] = None) -> bool:
+        """Atende uma requisição; retorna True se a conexão do cliente pode ser reutilizada.
 
+        t0 é o instante (perf_counter) em que a cabeça da requisição foi lida: início do flow.
+        """
+        method, target, version, headers = head.method, head.target, head.version, head.headers
+        head_done = time.perf_counter()
+        keep_alive = not last and head.keep_alive
+
+        if method.upper() == "CONNECT" and origin is not None:
+            await self._write_response(writer, method, 400, [("Content-Type", "text/plain")],
+                                       b"CONNECT inside an intercepted tunnel", keep_alive=False)
+            return False
+
+        if method.upper() == "CONNECT":
+            host, port = self._split_host(target)
+
+            # Criar flow para requisições CONNECT também
             flow = self.flows.new_flow()
             flow.method = method
-            flow.scheme = "http"
-            flow.host = host_header.split(":")[0]
-            flow.port = int(host_header.split(":")[1]) if ":" in host_header else 80
-            flow.path = target
-            flow.request.headers = headers
-            flow.request.body = body
+            flow.scheme = "https"
+            flow.host = host
+            flow.port = port
+            flow.path = f"{host}:{port}"
+            flow.request.set_raw_headers(head.raw)
+            flow.request.body = b""
+            flow.t0 = t0 or head_done
+            flow.mark("request_head", head_done)
             await self.bus.publish_core(FLOW_CREATED, {"id": flow.id})
 
-            url, headers, body, mocked = apply_rules("request", url, method, None, headers, body, self.ruleset)
-
-            if self.intercept:
-                await self.bus.publish_core(FLOW_PAUSED, {"id": flow.id, "where": "request"})
-                fut = asyncio.get_event_loop().create_future()
-                self._pending_forwards[flow.id] = fut
-                decision = await fut
-                self._pending_forwards.pop(flow.id, None)
-                if decision == DROP_FLOW:
-                    flow.error = "Dropped by user at request"
-                    await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
-                    writer.close(); await writer.wait_closed(); return
-                elif decision != FORWARD_FLOW:
-                    # Se não foi forward nem drop, aguarda novamente
-                    await self.bus.publish_core(FLOW_PAUSED, {"id": flow.id, "where": "request"})
-                    fut = asyncio.get_event_loop().create_future()
-                    self._pending_forwards[flow.id] = fut
-                    decision = await fut
-                    self._pending_forwards.pop(flow.id, None)
-                    if decision == DROP_FLOW:
-                        flow.error = "Dropped by user at request"
-                        await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
-                        writer.close(); await writer.wait_closed(); return
-
-            if mocked:
-                resp_status = mocked["status"]
-                resp_headers = mocked["headers"]
-                resp_body = mocked["body"]
+            if self.interceptor.wants(flow) and not await self._intercept(flow, "request"):
+                return False
+
+            if self.mitm:
+                await self._mitm(reader, writer, flow, host, port)
             else:
-                async with httpx.AsyncClient(follow_redirects=False) as client:
-                    r = await client.request(method, url, headers=dict(headers), content=body)
-                resp_status = r.status_code
-                resp_headers = list(r.headers.items())
-                resp_body = r.content
-
-            _, resp_headers, resp_body, _ = apply_rules("response", url, method, resp_status, resp_headers, resp_body, self.ruleset)
-
-            if self.intercept:
-                await self.bus.publish_core(FLOW_PAUSED, {"id": flow.id, "where": "response"})
-                fut = asyncio.get_event_loop().create_future()
-                self._pending_forwards[flow.id] = fut
-                decision = await fut
-                self._pending_forwards.pop(flow.id, None)
-                if decision == DROP_FLOW:
-                    flow.error = "Dropped by user at response"
-                    await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
-                    writer.close(); await writer.wait_closed(); return
-
-            flow.response.headers = resp_headers
-            flow.response.body = resp_body
-            flow.status_code = resp_status
-            flow.size = len(resp_body)
-            await self.bus.publish_core(FLOW_UPDATED, {"id": flow.id})
-
-            writer.write(f"HTTP/1.1 {resp_status} OK\r\n".encode("ascii"))
-            has_cl = any(k.lower() == "content-length" for k, _ in resp_headers)
-            hdrs = resp_headers[:]
-            if not has_cl:
-                hdrs.append(("Content-Length", str(len(resp_body))))
-            for k, v in hdrs:
-                writer.write(f"{k}: {v}\r\n".encode("iso-8859-1"))
-            writer.write(b"\r\n")
-            writer.write(resp_body)
-            await writer.drain()
+                await self._tunnel(reader, writer, flow, host, port)
+
+            # Marcar como finalizado
+            await self._finish(flow)
+            return False
+
+        host_header = head.get("host", "")
+        if origin is not None:
+            # Requisição dentro do túnel interceptado: origem implícita é o alvo do CONNECT
+            scheme, default_port = "https", 443
+            host_header = host_header or f"{origin[0]}:{origin[1]}"
+            url = target if target.startswith("https://") else f"https://{host_header}{target}"
+        else:
+            scheme, default_port = "http", 80
+            url = target if target.startswith("http") else f"http://{host_header}{target}"
+
+        chunked, length = head.framing()
+        if chunked:
+            req_chunks = iter_chunked(reader)
+        elif length:
+            req_chunks = iter_fixed(reader, length)
+        else:
+            req_chunks = None
+
+        flow = self.flows.new_flow()
+        flow.method = sys.intern(method)
+        flow.scheme = scheme
+        flow.host = sys.intern(host_header.split(":")[0])
+        flow.port = int(host_header.split(":")[1]) if ":" in host_header else default_port
+        flow.path = target
+        # o bloco bruto ocupa bem menos que as tuplas; vira tuplas só quando os headers são lidos
+        flow.request.set_raw_headers(head.raw)
+        flow.t0 = t0 or head_done
+        flow.mark("request_head", head_done)
+        await self.bus.publish_core(FLOW_CREATED, {"id": flow.id})
+        intercepted = self.interceptor.wants(flow)
+
+        async def read_body() -> None:
+            nonlocal body
+            body = b"".join([data async for data in req_chunks])
+            flow.mark("request_body")
+            flow.request.body = body
+            flow.request.body_size = len(body)
+
+        # Em modo streaming o corpo só é lido enquanto é enviado à origem; intercept e
+        # regras com buffer_body exigem o corpo completo em memória. No intercept ele é
+        # lido só com a vaga garantida, e as regras de requisição valem depois da decisão.
+        req_capture = None
+        body: Optional[bytes] = None
+        if req_chunks is None:
+            body = b""
+        elif intercepted:
+            # o corpo só é lido quando o flow consegue vaga no intercept (prepare do pause)
+            pass
+        elif (self.stream_bodies
+              and not needs_buffering("request", url, method, None, self.ruleset)):
+            req_capture = self._capture(flow, "request")
+        else:
+            await read_body()
+
+        if intercepted:
+            if not await self._intercept(flow, "request", prepare=read_body if req_chunks is not None else None):
+                return False
+            if body is None:
+                # decidido (forward) enquanto aguardava vaga: o corpo ainda está na conexão
+                await read_body()
+
+        url, headers, body, mocked = apply_rules("request", url, method, None, headers, body, self.ruleset, self.metrics.rule_hit)
+        flow.mark("rules")
+
+        if req_capture is not None:
+            pending = req_capture.tee(req_chunks)
+            if body is None and not mocked:
+                body = pending
+            else:
+                # Corpo substituído por regra: consome o original para liberar a conexão
+                async for _ in pending:
+                    pass
+                self._record_body(flow.request, req_capture)
 
-            await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
-            writer.close(); await writer.wait_closed()
+        if mocked:
+            return await self._finish_buffered(writer, flow, url, method, mocked["status"],
+                                               mocked["headers"], mocked["body"], keep_alive,
+                                               intercepted=intercepted)
 
+        try:
+            async with self.upstream.stream(method, url, headers, body, on_trace=self._tracer(flow)) as (resp_status, resp_headers, resp_chunks):
+                if req_capture is not None and not isinstance(body, bytes):
+                    # httpcore envia a requisição inteira antes de ler a resposta
+                    self._record_body(flow.request, req_capture)
+                    keep_alive = keep_alive and req_capture.complete
+                if (self.stream_bodies and not (intercepted and self.intercept)
+                        and not needs_buffering("response", url, method, resp_status, self.ruleset)):
+                    _, resp_headers, resp_body, _ = apply_rules("response", url, method, resp_status, resp_headers, None, self.ruleset, self.metrics.rule_hit)
+                    if resp_body is None:
+                        return await self._stream_response(writer, flow, method, version, resp_status,
+                                                           resp_headers, resp_chunks, keep_alive)
+                else:
+                    resp_body = b"".join([data async for data in resp_chunks])
+                    flow.mark("response_body")
+                    _, resp_headers, resp_body, _ = apply_rules("response", url, method, resp_status, resp_headers, resp_body, self.ruleset, self.metrics.rule_hit)
         except Exception as e:
-            try:
-                await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Handler error: {e!r}"})
-            except Exception:
-                pass
-            try:
-                writer.close(); await writer.wait_closed()
-            except Exception:
-                pass
+            if flow.status_code is not None:
+                # Resposta já começou a ser enviada ao cliente: só resta fechar a conexão
+                flow.error = f"Stream error: {e!r}"
+                await self._finish(flow)
+                return False
+            flow.error = f"Upstream error: {e!r}"
+            await self._finish(flow)
+            await self._write_response(writer, method, 502, [("Content-Type", "text/plain")],
+                                       b"Bad Gateway", keep_alive=False)
+            return False
 
-    async def _tunnel(self, reader, writer, host, port):
-        writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+        return await self._finish_buffered(writer, flow, url, method, resp_status, resp_headers,
+                                           resp_body, keep_alive, rules_applied=True,
+                                           intercepted=intercepted)
+
+    async def _finish_buffered(self, writer: asyncio.StreamWriter, flow: Flow, url: str, method: str,
+                               status: int, headers: List[Tuple[str, str]], body: bytes,
+                               keep_alive: bool, rules_applied: bool = False,
+                               intercepted: bool = False) -> bool:
+        if not rules_applied:
+            _, headers, body, _ = apply_rules("response", url, method, status, headers, body, self.ruleset, self.metrics.rule_hit)
+
+        if intercepted and self.intercept and not await self._intercept(flow, "response"):
+            return False
+
+        flow.response.headers = headers
+        flow.response.body = body
+        flow.response.body_size = len(body)
+        flow.status_code = status
+        flow.size = len(body)
+        await self.bus.publish_core(FLOW_UPDATED, {"id": flow.id})
+
+        await self._write_response(writer, method, status, headers, body, keep_alive)
+        flow.mark("client_write")
+
+        await self._finish(flow)
+        return keep_alive
+
+    async def _intercept(self, flow: Flow, where: str,
+                         prepare: Optional[Callable[[], Awaitable[None]]] = None) -> bool:
+        """Pausa o flow no intercept (request/response); False se ele foi descartado"""
+        decision, timed_out = await self.interceptor.pause(flow, where, self.bus.publish_core, prepare)
+        if decision == DROP_FLOW:
+            flow.error = f"Dropped by {'intercept timeout' if timed_out else 'user'} at {where}"
+            await self._finish(flow)
+            return False
+        flow.mark("intercept" if where == "request" else "response_intercept")
+        return True
+
+    async def _stream_response(self, writer: asyncio.StreamWriter, flow: Flow, method: str, version: str,
+                               status: int, headers: List[Tuple[str, str]],
+                               chunks: AsyncIterator[bytes], keep_alive: bool) -> bool:
+        """Repassa o corpo da origem ao cliente pedaço a pedaço, respeitando o drain do writer"""
+        _, length = body_framing(headers)
+        hdrs = [(k, v) for k, v in headers if k.lower() != "transfer-encoding"]
+        encode = False
+        if self._has_body(method, status) and length is None:
+            if version == "HTTP/1.1":
+                hdrs.append(("Transfer-Encoding", "chunked"))
+                encode = True
+            else:
+                # Cliente HTTP/1.0: corpo delimitado pelo fechamento da conexão
+                keep_alive = False
+
+        flow.response.headers = headers
+        flow.status_code = status
+        await self.bus.publish_core(FLOW_UPDATED, {"id": flow.id})
+
+        capture = self._capture(flow, "response")
+        self._write_head(writer, status, hdrs, keep_alive)
+        async for data in capture.tee(chunks):
+            writer.write(encode_chunk(data) if encode else data)
+            await writer.drain()
+        if encode:
+            writer.write(LAST_CHUNK)
         await writer.drain()
-        try:
-            remote_reader, remote_writer = await asyncio.open_connection(host, port)
-        except Exception:
-            writer.close(); await writer.wait_closed(); return
+        flow.mark("client_write")
 
-        async def pipe(src, dst):
-            try:
-                while True:
-                    data = await src.read(65536)
-                    if not data:
-                        break
-                    dst.write(data)
-                    await dst.drain()
-            except Exception:
-                pass
-            finally:
+        self._record_body(flow.response, capture)
+        flow.size = capture.size
+        await self._finish(flow)
+        return keep_alive
+
+    @staticmethod
+    def _tracer(flow: Flow):
+        """Callback dos eventos de trace do httpcore que marca as fases upstream do flow"""
+        def trace(event: str):
+            phase = _TRACE_PHASES.get(event)
+            if phase is not None:
+                flow.mark(phase)
+        return trace
+
+    async def _finish(self, flow: Flow):
+        flow.finished_at = time.time()
+        self.metrics.observe_flow(flow)
+        # um flow longo (túnel, download) pode ter sido expulso do store enquanto corria: o
+        # on_evict já o tirou do índice de busca e liberou os corpos, e ele não deve voltar
+        stored = self.flows.get(flow.id) is flow
+        if self.search is not None and stored:
+            # enfileira os corpos ainda em memória, antes de um eventual offload
+            self.search.submit(flow)
+        if self.capture is not None:
+            # a captura leva as referências aos corpos em memória e serializa na sua thread
+            self.capture.submit(flow)
+        if self.body_store is not None and stored:
+            for msg in (flow.request, flow.response):
+                if msg.memory_size > self.body_store_threshold:
+                    msg.offload(self.body_store)
+        self.flows.record_size(flow)
+        if not stored:
+            # _release_bodies já rodou na expulsão; os spills gravados depois dela ficariam no disco
+            self._release_bodies(flow)
+        await self.bus.publish_core(FLOW_FINISHED, {"id": flow.id})
+
+    def _release_bodies(self, flow: Flow):
+        for msg in (flow.request, flow.response):
+            msg.release()
+            if msg.spill_path:
                 try:
-                    dst.close()
-                    await dst.wait_closed()
-                except Exception:
+                    os.remove(msg.spill_path)
+                except OSError:
                     pass
 
-        await asyncio.gather(pipe(reader, remote_writer), pipe(remote_reader, writer))
+    def _capture(self, flow: Flow, kind: str) -> BodyCapture:
+        spill_path = None
+        if self.spill_dir:
+            spill_path = os.path.join(self.spill_dir, f"flow-{flow.id}-{kind}.body")
+        return BodyCapture(self.capture_limit, spill_path)
+
+    def _record_body(self, msg: Message, capture: BodyCapture):
+        msg.body = capture.body
+        msg.body_size = capture.size
+        msg.spill_path = capture.spill_path if capture.spilled else None
+
+    def _has_body(self, method: str, status: int) -> bool:
+        return not (method.upper() == "HEAD" or 100 <= status < 200 or status in (204, 304))
+
+    def _write_head(self, writer: asyncio.StreamWriter, status: int,
+                    headers: List[Tuple[str, str]], keep_alive: bool):
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ""
+        writer.write(f"HTTP/1.1 {status} {reason}\r\n".encode("ascii"))
+        for k, v in headers:
+            if k.lower() != "connection":
+                writer.write(f"{k}: {v}\r\n".encode("iso-8859-1"))
+        writer.write(f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("ascii"))
+
+    async def _write_response(self, writer: asyncio.StreamWriter, method: str, status: int,
+                              headers: List[Tuple[str, str]], body: bytes, keep_alive: bool):
+        hdrs = [(k, v) for k, v in headers if k.lower() != "transfer-encoding"]
+        if self._has_body(method, status):
+            # O corpo pode ter sido trocado por uma regra: Content-Length sempre recalculado
+            hdrs = [(k, v) for k, v in hdrs if k.lower() != "content-length"]
+            hdrs.append(("Content-Length", str(len(body))))
+        else:
+            body = b""
+        self._write_head(writer, status, hdrs, keep_alive)
+        writer.write(body)
+        await writer.drain()
+
+    async def _mitm(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    flow: Flow, host: str, port: int):
+        """Termina o TLS do cliente com um certificado da CA local e atende as requisições
+        internas pelo mesmo caminho das requisições HTTP (regras, intercept, flows)"""
+        # o contexto precisa estar pronto antes do 200: bytes do ClientHello que chegassem
+        # antes do start_tls ficariam no buffer do StreamReader, fora do TLS
+        try:
+            ctx = self.certs.context(await self.certs.aget(host))
+        except Exception as e:
+            flow.error = f"Certificate error: {e!r}"
+            await self._write_response(writer, "CONNECT", 502, [("Content-Type", "text/plain")],
+                                       b"Bad Gateway", keep_alive=False)
+            return
+        writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+        flow.status_code = 200
+        try:
+            await writer.start_tls(ctx)
+        except (ssl.SSLError, ConnectionError, OSError) as e:
+            # tipicamente o cliente ainda não confia na CA local
+            flow.error = f"TLS handshake failed: {e!r}"
+            await self.bus.publish_core(LOG_MESSAGE, {"msg": f"TLS handshake with client failed for {host}: {e!r}"})
+            return
+        await self._request_loop(reader, writer, origin=(host, port))
+        flow.mark("tunnel")
+
+    async def _tunnel(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                      flow: Flow, host: str, port: int):
+        """Túnel transparente para o CONNECT sem interceptação (ver core/tunnel.py)"""
+        try:
+            tunnel = await asyncio.wait_for(Tunnel.connect(host, port, self.resolver),
+                                            self.upstream.timeout)
+        except Exception as e:
+            flow.error = f"Upstream error: {e!r}"
+            await self._write_response(writer, "CONNECT", 502, [("Content-Type", "text/plain")],
+                                       b"Bad Gateway", keep_alive=False)
+            return
+        flow.status_code = 200
+        flow.mark("dns_connect")
+        # bytes que o cliente mandou junto com o CONNECT e já estão no buffer do reader: com o
+        # EOF marcado o read() devolve o buffer sem ceder o loop, então nada chega ao reader
+        # antes de o attach passar o transport ao túnel
+        reader.feed_eof()
+        initial = await reader.read()
+        try:
+            tunnel.attach(writer.transport, head=b"HTTP/1.1 200 Connection Established\r\n\r\n",
+                          initial=initial)
+            await tunnel.wait()
+        finally:
+            tunnel.close()
+            flow.mark("tunnel")
+            flow.request.body_size = tunnel.bytes_up
+            flow.response.body_size = tunnel.bytes_down
+            flow.size = tunnel.bytes_up + tunnel.bytes_down
@@ -0,0 +1,254 @@
+"""Resolução de nomes e conexão TCP com as origens, compartilhadas pelo HTTP e pelo CONNECT.
+
+Cada conexão nova passava pelo getaddrinfo padrão, que roda no executor de threads do loop:
+sob carga o executor satura e cada conexão paga dezenas de ms. O Resolver guarda as
+respostas em memória por `ttl` segundos (o getaddrinfo não expõe o TTL do registro DNS,
+então o TTL é configurado e funciona como teto), guarda as falhas por `negative_ttl`, junta
+consultas simultâneas ao mesmo nome numa só e aceita uma tabela estática de hosts
+(`{"api.example.com": ["127.0.0.1"]}`) que tem precedência sobre o DNS.
+
+A conexão usa happy eyeballs (RFC 8305): os endereços são intercalados por família e cada
+tentativa nova começa quando a anterior falha ou após `happy_eyeballs_delay`; a primeira
+que conecta vence e as demais são canceladas.
+"""
+import asyncio
+import socket
+import time
+from dataclasses import dataclass, asdict
+from ipaddress import ip_address
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+import httpcore
+
+HAPPY_EYEBALLS_DELAY = 0.25
+
+# (família, sockaddr sem a porta definida)
+Address = Tuple[int, tuple]
+T = TypeVar("T")
+
+
+@dataclass
+class ResolverStats:
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+    negative_hits: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    entries: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _literal(host: str) -> Optional[List[Address]]:
+    try:
+        ip = ip_address(host.strip("[]"))
+    except ValueError:
+        return None
+    if ip.version == 6:
+        return [(socket.AF_INET6, (ip.compressed, 0, 0, 0))]
+    return [(socket.AF_INET, (ip.compressed, 0))]
+
+
+def interleave(addrs: Sequence[Address]) -> List[Address]:
+    """Alterna as famílias começando pela primeira devolvida (RFC 8305, seção 4)"""
+    if not addrs:
+        return []
+    first = [a for a in addrs if a[0] == addrs[0][0]]
+    other = [a for a in addrs if a[0] != addrs[0][0]]
+    out: List[Address] = []
+    for i in range(max(len(first), len(other))):
+        out += first[i:i + 1] + other[i:i + 1]
+    return out
+
+
+async def staggered_connect(addrs: Iterable[Address], attempt: Callable[[Address], Awaitable[T]],
+                            discard: Callable[[T], Awaitable[None]],
+                            delay: float = HAPPY_EYEBALLS_DELAY) -> T:
+    """Tenta `attempt` em cada endereço, escalonadas por `delay`; devolve a primeira conexão.
+
+    Uma falha libera a tentativa seguinte na hora. Conexões que completarem depois da
+    vencedora são passadas a `discard`. Se todas falharem, relança o erro (ou um OSError
+    com todos eles).
+    """
+    queue = list(addrs)
+    pending: set = set()
+    errors: List[BaseException] = []
+    winner = None
+    try:
+        while queue or pending:
+            if queue:
+                pending.add(asyncio.ensure_future(attempt(queue.pop(0))))
+            done, pending = await asyncio.wait(pending, timeout=delay if queue else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                elif winner is None:
+                    winner = task
+                else:
+                    await discard(task.result())
+            if winner is not None:
+                return winner.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if not isinstance(result, BaseException):
+                await discard(result)
+    if not errors:
+        raise OSError("no addresses to connect to")
+    if len(errors) == 1 or len({str(e) for e in errors}) == 1:
+        raise errors[0]
+    raise OSError("Multiple exceptions: " + "; ".join(str(e) for e in errors))
+
+
+class Resolver:
+    def __init__(self, ttl: float = 60.0, negative_ttl: float = 5.0,
+                 hosts: Optional[Dict[str, List[str]]] = None,
+                 happy_eyeballs_delay: float = HAPPY_EYEBALLS_DELAY, max_entries: int = 4096):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.max_entries = max_entries
+        self.hosts: Dict[str, List[Address]] = {}
+        for name, ips in (hosts or {}).items():
+            addrs = [a for ip in ips for a in (_literal(ip) or [])]
+            if len(addrs) != len(ips):
+                raise ValueError(f"invalid address in hosts entry for {name!r}: {ips!r}")
+            self.hosts[name.lower().rstrip(".")] = addrs
+        self.stats = ResolverStats()
+        # nome -> (expira em, endereços ou a exceção da consulta)
+        self._cache: Dict[str, Tuple[float, object]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def resolve(self, host: str) -> List[Address]:
+        """Endereços de `host` na ordem em que devem ser tentados"""
+        name = host.lower().rstrip(".")
+        addrs = self.hosts.get(name) or _literal(name)
+        if addrs is not None:
+            return addrs
+        self.stats.lookups += 1
+        entry = self._cache.get(name)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                if isinstance(value, BaseException):
+                    self.stats.negative_hits += 1
+                    raise socket.gaierror(*value.args)
+                self.stats.hits += 1
+                return value
+            del self._cache[name]
+        future = self._inflight.get(name)
+        if future is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(future)
+        self.stats.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[name] = future
+        try:
+            addrs = await self._lookup(name)
+        except socket.gaierror as e:
+            self.stats.errors += 1
+            self._store(name, self.negative_ttl, e)
+            future.set_exception(e)
+            # consultas juntadas recebem o erro; sem elas o future não deve avisar no GC
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else OSError(f"lookup of {host!r} aborted"))
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(name, None)
+        self._store(name, self.ttl, addrs)
+        future.set_result(addrs)
+        return addrs
+
+    async def _lookup(self, name: str) -> List[Address]:
+        infos = await asyncio.get_running_loop().getaddrinfo(name, None, type=socket.SOCK_STREAM)
+        addrs: List[Address] = []
+        for family, _, _, _, sockaddr in infos:
+            if (family, sockaddr) not in addrs:
+                addrs.append((family, sockaddr))
+        return interleave(addrs)
+
+    def _store(self, name: str, ttl: float, value) -> None:
+        if ttl <= 0:
+            return
+        if len(self._cache) >= self.max_entries:
+            # descarta a entrada mais antiga (ordem de inserção do dict)
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[name] = (time.monotonic() + ttl, value)
+        self.stats.entries = len(self._cache)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self.stats.entries = 0
+
+    async def connect(self, host: str, port: int) -> socket.socket:
+        """Socket não bloqueante já conectado a host:port"""
+        loop = asyncio.get_running_loop()
+
+        async def attempt(addr: Address) -> socket.socket:
+            family, sockaddr = addr
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.setblocking(False)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                await loop.sock_connect(sock, (sockaddr[0], port) + tuple(sockaddr[2:]))
+            except BaseException:
+                sock.close()
+                raise
+            return sock
+
+        async def discard(sock: socket.socket) -> None:
+            sock.close()
+
+        return await staggered_connect(await self.resolve(host), attempt, discard,
+                                       self.happy_eyeballs_delay)
+
+
+class ResolvingBackend(httpcore.AsyncNetworkBackend):
+    """Backend de rede do httpcore que resolve pelo Resolver e conecta com happy eyeballs.
+
+    Cada tentativa conecta o backend padrão (AnyIO) a um IP literal, então o AnyIO não
+    consulta o DNS; o TLS continua usando o nome original como SNI.
+    """
+
+    def __init__(self, resolver: Resolver, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self.resolver = resolver
+        self.backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                          local_address: Optional[str] = None,
+                          socket_options=None) -> httpcore.AsyncNetworkStream:
+        try:
+            addrs = await asyncio.wait_for(self.resolver.resolve(host), timeout)
+        except asyncio.TimeoutError as e:
+            raise httpcore.ConnectTimeout(f"DNS lookup of {host!r} timed out") from e
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+
+        async def attempt(addr: Address) -> httpcore.AsyncNetworkStream:
+            return await self.backend.connect_tcp(addr[1][0], port, timeout=timeout,
+                                                  local_address=local_address,
+                                                  socket_options=socket_options)
+
+        async def discard(stream: httpcore.AsyncNetworkStream) -> None:
+            await stream.aclose()
+
+        try:
+            return await staggered_connect(addrs, attempt, discard, self.resolver.happy_eyeballs_delay)
+        except httpcore.ConnectError:
+            raise
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None,
+                                  socket_options=None) -> httpcore.AsyncNetworkStream:
+        return await self.backend.connect_unix_socket(path, timeout=timeout,
+                                                      socket_options=socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self.backend.sleep(seconds)
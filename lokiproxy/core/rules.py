@@ -1,5 +1,5 @@
 import re
-from typing import List, Optional, Dict, Any, Tuple
+from typing import Callable, List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel, Field
 import yaml
 
@@ -22,6 +22,8 @@ class Rule(BaseModel):
     on: str = Field(default="request", pattern="^(request|response)$")
     action: RuleAction
     enabled: bool = True
+    # Regras que precisam do corpo completo desligam o streaming para os flows em que casam
+    buffer_body: bool = False
 
 class Ruleset(BaseModel):
     rules: List[Rule] = Field(default_factory=list)
@@ -32,32 +34,190 @@ class Ruleset(BaseModel):
             data = yaml.safe_load(f) or {}
         return Ruleset(**data)
 
+    def compile(self, merge_regexes: bool = False) -> "CompiledRuleset":
+        return CompiledRuleset(self, merge_regexes)
+
     def dump_yaml(self, path: str) -> None:
         with open(path, "w", encoding="utf-8") as f:
             yaml.safe_dump(self.dict(), f, sort_keys=False, allow_unicode=True)
 
-def apply_rules(kind: str, url: str, method: str, status: Optional[int], headers: List[Tuple[str,str]], body: bytes, ruleset: Ruleset):
-    mocked = None
-    hdict = {k.lower(): v for k, v in headers}
-    for rule in ruleset.rules:
-        if not rule.enabled or rule.on != kind:
+# Regex ancorada em "^http(s)://<host literal>" seguido de "/", ":" ou fim: a regra só
+# pode casar com URLs desse host exato, então entra no índice por host. O separador não
+# pode ser opcional ("/?", "/*", "/{0,1}") e o padrão não pode ter "|" fora de grupos,
+# senão o resto da regex casaria com outros hosts.
+_HOST_PREFIX = re.compile(r"\^(?:https\?|https|http)://((?:[A-Za-z0-9-]|\\\.)+)(?:/|:|\\/|\$$)")
+_BACKREF = re.compile(r"\\[1-9]|\(\?P=")
+
+def _top_level_alternation(pattern: str) -> bool:
+    depth, i, in_class = 0, 0, False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
             continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+            # "]" logo após "[" ou "[^" é literal
+            if pattern[i + 1:i + 2] == "^":
+                i += 1
+            if pattern[i + 1:i + 2] == "]":
+                i += 1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+def _literal_host(url_regex: str) -> Optional[str]:
+    m = _HOST_PREFIX.match(url_regex)
+    if m is None or url_regex[m.end():m.end() + 1] in ("?", "*", "{") or _top_level_alternation(url_regex):
+        return None
+    return m.group(1).replace("\\.", ".")
+
+def _url_host(url: str) -> str:
+    rest = url.partition("://")[2]
+    end = len(rest)
+    for sep in "/:?#":
+        i = rest.find(sep, 0, end)
+        if i != -1:
+            end = i
+    return rest[:end]
+
+class CompiledRule:
+    __slots__ = ("index", "rule", "regex", "method", "status", "group")
+
+    def __init__(self, index: int, rule: Rule):
+        self.index = index
+        self.rule = rule
         m = rule.match
-        if m.url_regex and not re.search(m.url_regex, url):
-            continue
-        if m.method and m.method.upper() != method.upper():
-            continue
-        if m.status is not None and status != m.status:
+        self.regex = re.compile(m.url_regex) if m.url_regex else None
+        self.method = m.method.upper() if m.method else None
+        self.status = m.status
+        # nome do grupo na alternância combinada (quando merge_regexes=True)
+        self.group: Optional[str] = None
+
+class _MethodIndex:
+    """Regras particionadas por método, mantendo a ordem original do ruleset"""
+
+    def __init__(self, rules: List[CompiledRule]):
+        self.any_method: Tuple[CompiledRule, ...] = tuple(r for r in rules if r.method is None)
+        self.by_method: Dict[str, Tuple[CompiledRule, ...]] = {
+            method: tuple(r for r in rules if r.method in (None, method))
+            for method in {r.method for r in rules if r.method}
+        }
+
+    def candidates(self, method: str) -> Tuple[CompiledRule, ...]:
+        return self.by_method.get(method.upper(), self.any_method)
+
+class _KindTable:
+    def __init__(self, rules: List[CompiledRule], merge_regexes: bool):
+        generic: List[CompiledRule] = []
+        hosted: Dict[str, List[CompiledRule]] = {}
+        for r in rules:
+            host = _literal_host(r.regex.pattern) if r.regex else None
+            if host:
+                hosted.setdefault(host, []).append(r)
+            else:
+                generic.append(r)
+        self.generic = _MethodIndex(generic)
+        self.hosts = {h: _MethodIndex(rs) for h, rs in hosted.items()}
+        self.merged = _merge_regexes(rules) if merge_regexes else None
+
+def _merge_regexes(rules: List[CompiledRule]) -> Optional["re.Pattern"]:
+    # Cada regex vira um lookahead opcional com grupo nomeado: um único match a partir da
+    # posição 0 informa quais regexes ocorrem na URL (equivale a um re.search de cada uma).
+    parts = []
+    for r in rules:
+        if r.regex is None or r.regex.groupindex or _BACKREF.search(r.regex.pattern):
             continue
+        r.group = f"_r{r.index}"
+        parts.append(f"(?:(?=[\\s\\S]*?(?P<{r.group}>{r.regex.pattern})))?")
+    if not parts:
+        return None
+    try:
+        return re.compile("".join(parts))
+    except re.error:
+        for r in rules:
+            r.group = None
+        return None
+
+class CompiledRuleset:
+    """Forma imutável de um Ruleset, montada uma vez em APPLY_RULES.
+
+    As regexes são compiladas uma única vez e as regras ficam particionadas por `on`,
+    método e host literal, de modo que o custo por requisição acompanha as regras
+    candidatas e não o total de regras. Com merge_regexes=True todas as url_regex de um
+    `on` são avaliadas numa única alternância.
+    """
+
+    def __init__(self, ruleset: Ruleset, merge_regexes: bool = False):
+        self.ruleset = ruleset
+        self.merge_regexes = merge_regexes
+        self._tables = {
+            kind: _KindTable([CompiledRule(i, r) for i, r in enumerate(ruleset.rules)
+                              if r.enabled and r.on == kind], merge_regexes)
+            for kind in ("request", "response")
+        }
+
+    @property
+    def rules(self) -> List[Rule]:
+        return self.ruleset.rules
 
-        a = rule.action
+    def matching(self, kind: str, url: str, method: str, status: Optional[int]) -> List[CompiledRule]:
+        table = self._tables.get(kind)
+        if table is None:
+            return []
+        cands = table.generic.candidates(method)
+        if table.hosts:
+            by_host = table.hosts.get(_url_host(url))
+            if by_host is not None:
+                cands = sorted(cands + by_host.candidates(method), key=lambda r: r.index)
+        out = []
+        merged = None
+        for r in cands:
+            if r.status is not None and status != r.status:
+                continue
+            if r.group is not None:
+                if merged is None:
+                    merged = table.merged.match(url)
+                if merged.group(r.group) is None:
+                    continue
+            elif r.regex is not None and not r.regex.search(url):
+                continue
+            out.append(r)
+        return out
+
+def _compiled(ruleset) -> CompiledRuleset:
+    return ruleset if isinstance(ruleset, CompiledRuleset) else CompiledRuleset(ruleset)
+
+def needs_buffering(kind: str, url: str, method: str, status: Optional[int], ruleset) -> bool:
+    return any(r.rule.buffer_body for r in _compiled(ruleset).matching(kind, url, method, status))
+
+def apply_rules(kind: str, url: str, method: str, status: Optional[int], headers: List[Tuple[str,str]], body: Optional[bytes], ruleset,
+                on_match: Optional[Callable[[Rule], None]] = None):
+    """Aplica as regras de `kind`; body=None indica corpo em streaming (só pode ser substituído).
+
+    `ruleset` pode ser um Ruleset (compilado a cada chamada) ou um CompiledRuleset.
+    on_match recebe cada regra aplicada (contadores de métricas).
+    """
+    mocked = None
+    for cr in _compiled(ruleset).matching(kind, url, method, status):
+        if on_match is not None:
+            on_match(cr.rule)
+        a = cr.rule.action
         if a.rewrite_url and kind == "request":
             url = a.rewrite_url
 
-        for k, v in a.set_headers.items():
-            hdict[k.lower()] = v
-        for k in a.remove_headers:
-            hdict.pop(k.lower(), None)
+        if a.set_headers or a.remove_headers:
+            removed = {k.lower() for k in a.remove_headers}
+            drop = removed | {k.lower() for k in a.set_headers}
+            headers = [(k, v) for k, v in headers if k.lower() not in drop]
+            headers += [(k, v) for k, v in a.set_headers.items() if k.lower() not in removed]
 
         if a.set_request_body and kind == "request":
             body = a.set_request_body.encode("utf-8")
@@ -72,5 +232,4 @@ def apply_rules(kind: str, url: str, method: str, status: Optional[int], headers
             }
             break
 
-    new_headers = [(k.title(), v) for k, v in hdict.items()]
-    return url, new_headers, body, mocked
+    return url, headers, body, mocked
@@ -0,0 +1,165 @@
+"""Busca textual nos headers e corpos capturados.
+
+O SearchIndex mantém um índice invertido (termo → {flow id: peso}) alimentado por uma
+thread própria: o proxy só enfileira referências aos corpos ao finalizar o flow, e a
+tokenização acontece fora do event loop. Flows expulsos do LRUFlows saem do índice.
+"""
+import re
+import math
+import queue
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+from .flows import Flow
+
+# palavras de 2+ letras/dígitos/_; "api.example.com" na consulta vira api E example E com
+_TOKEN = re.compile(rb"[A-Za-z0-9_]{2,}")
+_QUERY_TOKEN = re.compile(r"[A-Za-z0-9_]{2,}")
+# peso de uma ocorrência por parte do flow: URL e headers pesam mais que corpo
+_WEIGHTS = {"url": 3.0, "headers": 2.0, "body": 1.0}
+_MAX_TF = 20
+
+
+@dataclass
+class SearchStats:
+    indexed: int = 0
+    terms: int = 0
+    pending: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+def tokenize(data: bytes) -> List[str]:
+    return [t.decode("ascii").lower() for t in _TOKEN.findall(data)]
+
+
+class SearchIndex:
+    def __init__(self, max_body_bytes: int = 256 * 1024):
+        self.max_body_bytes = max_body_bytes
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._terms: Dict[int, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        # operações enfileiradas e ainda não aplicadas
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="lokiproxy-search", daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # chamados no loop do proxy: só enfileiram
+    def submit(self, flow: Flow) -> None:
+        """Agenda a indexação de um flow finalizado (antes de os corpos irem para disco)"""
+        limit = self.max_body_bytes
+        parts = [
+            ("url", f"{flow.method} {flow.host} {flow.path}".encode("utf-8", "replace")),
+            ("headers", _header_bytes(flow.request.peek_headers()) + _header_bytes(flow.response.peek_headers())),
+            ("body", flow.request.body[:limit]),
+            ("body", flow.response.body[:limit]),
+        ]
+        self._put(("add", flow.id, parts))
+
+    def remove(self, flow_id: int) -> None:
+        self._put(("remove", flow_id, None))
+
+    def _put(self, item: tuple) -> None:
+        with self._idle:
+            self._pending += 1
+        self._queue.put(item)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda a thread aplicar tudo o que já foi enfileirado"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            op, fid, parts = item
+            try:
+                if op == "add":
+                    self._add(fid, parts)
+                else:
+                    self._remove(fid)
+            finally:
+                with self._idle:
+                    self._pending -= 1
+                    if not self._pending:
+                        self._idle.notify_all()
+
+    def _add(self, fid: int, parts: List[Tuple[str, bytes]]) -> None:
+        weights: Dict[str, float] = {}
+        counts: Dict[str, int] = {}
+        for kind, data in parts:
+            w = _WEIGHTS[kind]
+            for token in tokenize(data):
+                n = counts.get(token, 0)
+                if n < _MAX_TF:
+                    counts[token] = n + 1
+                    weights[token] = weights.get(token, 0.0) + w
+        with self._lock:
+            self._remove_locked(fid)
+            for token, w in weights.items():
+                # saturação logarítmica: muitas repetições não dominam o ranking
+                self._postings.setdefault(token, {})[fid] = 1.0 + math.log(w)
+            self._terms[fid] = tuple(weights)
+
+    def _remove(self, fid: int) -> None:
+        with self._lock:
+            self._remove_locked(fid)
+
+    def _remove_locked(self, fid: int) -> None:
+        for token in self._terms.pop(fid, ()):
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(fid, None)
+                if not posting:
+                    del self._postings[token]
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        """Flows que contêm todos os termos da consulta, do mais relevante ao menos.
+
+        O score soma peso × idf de cada termo (idf = log(1 + N/df)), então termos raros
+        contam mais. Retorna [(flow_id, score)].
+        """
+        tokens = list(dict.fromkeys(t.lower() for t in _QUERY_TOKEN.findall(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            postings = [self._postings.get(t) for t in tokens]
+            if not all(postings):
+                return []
+            total = len(self._terms)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for p in postings[1:]:
+                candidates.intersection_update(p)
+                if not candidates:
+                    return []
+            scored = []
+            for fid in candidates:
+                score = sum(p[fid] * math.log(1 + total / len(p)) for p in postings)
+                scored.append((fid, round(score, 4)))
+        scored.sort(key=lambda s: (-s[1], -s[0]))
+        return scored[:limit]
+
+    @property
+    def stats(self) -> SearchStats:
+        with self._lock:
+            return SearchStats(len(self._terms), len(self._postings), self._pending)
+
+
+def _header_bytes(headers: List[Tuple[str, str]]) -> bytes:
+    return "\n".join(f"{k}: {v}" for k, v in headers).encode("utf-8", "replace")
@@ -0,0 +1,106 @@
+import os
+import asyncio
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple
+
+CHUNK_SIZE = 65536
+MAX_CHUNK_LINE = 4096
+
+
+async def iter_fixed(reader: asyncio.StreamReader, length: int) -> AsyncIterator[bytes]:
+    """Lê exatamente `length` bytes do reader, em pedaços de até CHUNK_SIZE"""
+    remaining = length
+    while remaining > 0:
+        data = await reader.read(min(remaining, CHUNK_SIZE))
+        if not data:
+            raise asyncio.IncompleteReadError(b"", remaining)
+        remaining -= len(data)
+        yield data
+
+
+async def iter_chunked(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    """Decodifica um corpo `Transfer-Encoding: chunked` (RFC 9112, seção 7.1)"""
+    while True:
+        line = await reader.readuntil(b"\n")
+        if len(line) > MAX_CHUNK_LINE:
+            raise ValueError("chunk size line too long")
+        size = int(line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            # trailers são descartados
+            while (await reader.readuntil(b"\n")).strip():
+                pass
+            return
+        async for data in iter_fixed(reader, size):
+            yield data
+        if (await reader.readexactly(2)) != b"\r\n":
+            raise ValueError("malformed chunk terminator")
+
+
+def encode_chunk(data: bytes) -> bytes:
+    return b"%x\r\n%b\r\n" % (len(data), data)
+
+
+LAST_CHUNK = b"0\r\n\r\n"
+
+
+def body_framing(headers: List[Tuple[str, str]]) -> Tuple[bool, Optional[int]]:
+    """Retorna (chunked, content_length) a partir dos headers de uma mensagem"""
+    chunked = False
+    length = None
+    for k, v in headers:
+        lk = k.lower()
+        if lk == "transfer-encoding":
+            chunked = v.strip().lower().endswith("chunked")
+        elif lk == "content-length":
+            length = int(v.strip())
+    if chunked:
+        length = None
+    return chunked, length
+
+
+class BodyCapture:
+    """Guarda em memória só os primeiros `limit` bytes de um corpo.
+
+    O restante é gravado em `spill_path` (se informado) ou descartado; `size` conta o
+    total de bytes que passaram pela captura.
+    """
+
+    def __init__(self, limit: int, spill_path: Optional[str] = None):
+        self.limit = limit
+        self.spill_path = spill_path
+        self.size = 0
+        self.complete = False
+        self._prefix = bytearray()
+        self._spill: Optional[BinaryIO] = None
+
+    def feed(self, data: bytes) -> None:
+        self.size += len(data)
+        room = self.limit - len(self._prefix)
+        if room > 0:
+            self._prefix += data[:room]
+            data = data[room:]
+        if data and self.spill_path:
+            if self._spill is None:
+                os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+                self._spill = open(self.spill_path, "wb")
+            self._spill.write(data)
+
+    @property
+    def body(self) -> bytes:
+        return bytes(self._prefix)
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill is not None
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+
+    async def tee(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        try:
+            async for data in chunks:
+                self.feed(data)
+                yield data
+            self.complete = True
+        finally:
+            self.close()
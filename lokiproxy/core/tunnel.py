@@ -0,0 +1,145 @@
+"""Túnel TCP para CONNECT sem interceptação, direto sobre transports do asyncio.
+
+Cada lado é um asyncio.Protocol que escreve o que recebe no transport do outro lado: sem
+StreamReader no meio, os bytes vindos do recv vão direto para o send, sem cópias extras
+nem uma volta do loop por bloco. Backpressure usa o controle de fluxo dos transports
+(pause_writing de um lado pausa a leitura do outro) e EOF de um lado vira write_eof no
+outro, então meio-fechamentos (shutdown(SHUT_WR)) são repassados.
+"""
+import asyncio
+from typing import List, Optional
+from .resolver import Resolver
+
+
+class _Side(asyncio.Protocol):
+    def __init__(self, tunnel: "Tunnel"):
+        self.tunnel = tunnel
+        self.peer: Optional["_Side"] = None
+        self.transport: Optional[asyncio.Transport] = None
+        self.received = 0
+        self.eof = False
+        self.closed = asyncio.get_running_loop().create_future()
+        # dados recebidos antes do outro lado ter transport
+        self._pending: List[bytes] = []
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+        peer = self.peer
+        if peer._pending:
+            transport.write(b"".join(peer._pending))
+            peer._pending.clear()
+        if peer.eof and transport.can_write_eof():
+            transport.write_eof()
+        if peer.transport is not None:
+            peer.transport.resume_reading()
+
+    def data_received(self, data: bytes) -> None:
+        self.received += len(data)
+        target = self.peer.transport
+        if target is None:
+            self._pending.append(data)
+            self.transport.pause_reading()
+            return
+        target.write(data)
+
+    def eof_received(self) -> bool:
+        self.eof = True
+        target = self.peer.transport
+        if self.peer.eof:
+            # fechado nos dois sentidos
+            self.tunnel.close()
+            return False
+        if target is not None:
+            if not target.can_write_eof():
+                self.tunnel.close()
+                return False
+            target.write_eof()
+        # mantém o transport aberto para o sentido contrário
+        return True
+
+    # o buffer de escrita deste lado encheu/esvaziou: pausa/retoma quem escreve nele
+    def pause_writing(self) -> None:
+        if self.peer.transport is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        if self.peer.transport is not None:
+            self.peer.transport.resume_reading()
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if not self.closed.done():
+            self.closed.set_result(exc)
+        target = self.peer.transport
+        if target is not None and not target.is_closing():
+            if exc is None:
+                target.close()
+            else:
+                target.abort()
+
+
+class Tunnel:
+    """Liga um transport de cliente já aceito a uma conexão nova com host:port.
+
+    Uso: `tunnel = await Tunnel.connect(host, port)`, depois `tunnel.attach(transport)` e
+    `await tunnel.wait()`. `bytes_up`/`bytes_down` contam o tráfego em cada sentido.
+    """
+
+    def __init__(self):
+        self.client = _Side(self)
+        self.upstream = _Side(self)
+        self.client.peer = self.upstream
+        self.upstream.peer = self.client
+        self._previous: Optional[asyncio.BaseProtocol] = None
+
+    @classmethod
+    async def connect(cls, host: str, port: int, resolver: Optional[Resolver] = None) -> "Tunnel":
+        """Conecta à origem; com `resolver`, pelo cache de DNS e happy eyeballs dele"""
+        tunnel = cls()
+        loop = asyncio.get_running_loop()
+        if resolver is None:
+            await loop.create_connection(lambda: tunnel.upstream, host, port)
+        else:
+            sock = await resolver.connect(host, port)
+            await loop.create_connection(lambda: tunnel.upstream, sock=sock)
+        return tunnel
+
+    @property
+    def bytes_up(self) -> int:
+        return self.client.received
+
+    @property
+    def bytes_down(self) -> int:
+        return self.upstream.received
+
+    def attach(self, transport: asyncio.Transport, head: bytes = b"", initial: bytes = b"") -> None:
+        """Passa o transport do cliente para o túnel.
+
+        `head` é escrito antes de qualquer byte da origem (a resposta ao CONNECT) e `initial`
+        são bytes do cliente que já tinham sido lidos para o buffer do StreamReader.
+        """
+        self._previous = transport.get_protocol()
+        if head:
+            transport.write(head)
+        if initial:
+            self.client.received += len(initial)
+            self.upstream.transport.write(initial)
+        transport.set_protocol(self.client)
+        self.client.connection_made(transport)
+        # o StreamReaderProtocol pode ter pausado a leitura com o buffer cheio
+        transport.resume_reading()
+
+    async def wait(self) -> None:
+        try:
+            await asyncio.gather(self.client.closed, self.upstream.closed)
+        finally:
+            self.close()
+            # devolve o fechamento ao protocolo original (StreamReaderProtocol), senão
+            # writer.wait_closed() do handler nunca termina
+            if self._previous is not None:
+                self._previous.connection_lost(None)
+                self._previous = None
+
+    def close(self) -> None:
+        for side in (self.client, self.upstream):
+            if side.transport is not None and not side.transport.is_closing():
+                side.transport.close()
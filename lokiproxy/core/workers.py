@@ -0,0 +1,214 @@
+"""Vários processos de proxy atrás de uma única porta (SO_REUSEPORT).
+
+Cada worker é um processo (spawn) rodando run_core: um ProxyServer com loop, pool upstream,
+body store e índice de busca próprios, escutando na porta compartilhada com reuse_port, e
+um CoreServer num socket Unix privado. O kernel distribui as conexões entre os workers.
+
+O WorkerPool, no processo principal, conecta um CoreClient a cada worker e ocupa o lugar
+do ProxyServer em `bus.proxy`: os eventos de todos os workers são republicados no EventBus
+local (que volta a agrupá-los em FLOW_BATCH), os resumos formam um único store de flows e
+os comandos da GUI ou da API de controle seguem para os workers (SET_INTERCEPT,
+INTERCEPT_BULK e APPLY_RULES para todos, FORWARD/DROP/REPEAT para o dono do flow).
+
+Os ids não colidem: o worker i numera seus flows i+1, i+1+N, i+1+2N...
+"""
+import os
+import heapq
+import shutil
+import socket
+import asyncio
+import tempfile
+import multiprocessing
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from .bus import (EventBus, FLOW_BATCH, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, LOG_MESSAGE, METRICS,
+                  SET_INTERCEPT, FORWARD_FLOW, DROP_FLOW, REPEAT_FLOW)
+from .flows import Flow
+from .ipc import CoreClient, run_core
+from .metrics import merge_metrics
+
+_BATCH_TYPES = (("created", FLOW_CREATED), ("updated", FLOW_UPDATED), ("finished", FLOW_FINISHED))
+
+
+class WorkerFlows:
+    """Os resumos de todos os workers com a interface de leitura do LRUFlows"""
+
+    def __init__(self, pool: "WorkerPool"):
+        self._pool = pool
+
+    def __len__(self) -> int:
+        return sum(len(c.flows) for c in self._pool.clients)
+
+    def __iter__(self) -> Iterator[Flow]:
+        # cada worker já devolve os seus em ordem crescente de id
+        return heapq.merge(*(c.flows for c in self._pool.clients), key=lambda f: f.id)
+
+    def on_evict(self, callback: Callable[[Flow], None]) -> None:
+        for c in self._pool.clients:
+            c.flows.on_evict(callback)
+
+    def get(self, fid: int) -> Optional[Flow]:
+        return self._pool.owner(fid).flows.get(fid)
+
+    def all(self) -> List[Flow]:
+        return list(self)
+
+    async def fetch(self, fid: int) -> Optional[Flow]:
+        return await self._pool.owner(fid).flows.fetch(fid)
+
+
+class WorkerSearch:
+    """Busca em todos os workers, resultados intercalados por score.
+
+    Cada worker pontua com o idf do seu próprio índice, então a ordem entre workers é
+    aproximada.
+    """
+
+    def __init__(self, pool: "WorkerPool"):
+        self._pool = pool
+
+    async def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        results = await asyncio.gather(*(c.search.search(query, limit) for c in self._pool.clients))
+        return heapq.nlargest(limit, (hit for hits in results for hit in hits), key=lambda h: h[1])
+
+
+class WorkerPool:
+    """N processos ProxyServer na mesma porta, vistos como um só proxy"""
+
+    def __init__(self, workers: int, bus: EventBus, host: str = "127.0.0.1", port: int = 8080,
+                 connect_timeout: float = 30.0, **proxy_opts):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("--workers requires SO_REUSEPORT, which this platform lacks")
+        self.workers = workers
+        self.bus = bus
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.proxy_opts = proxy_opts
+        self.intercept = False
+        self._dir = tempfile.mkdtemp(prefix="lokiproxy-workers-")
+        self.clients = [CoreClient(os.path.join(self._dir, f"worker-{i}.sock")) for i in range(workers)]
+        self.flows = WorkerFlows(self)
+        self.search: Optional[WorkerSearch] = WorkerSearch(self) if proxy_opts.get("search_index", True) else None
+        # últimas métricas publicadas por cada worker
+        self.worker_stats: Dict[int, Dict[str, Any]] = {}
+        self._procs: List[multiprocessing.Process] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def owner(self, fid: int) -> CoreClient:
+        return self.clients[(fid - 1) % self.workers]
+
+    def _worker_opts(self, i: int) -> Dict[str, Any]:
+        opts = dict(self.proxy_opts, host=self.host, port=self.port, reuse_port=True,
+                    flow_id_start=i + 1, flow_id_step=self.workers)
+        if opts.get("capture_path"):
+            # um arquivo de captura por worker: o writer não é compartilhável entre processos
+            opts["capture_path"] = f"{opts['capture_path']}.{i}"
+        if opts.get("body_store_dir"):
+            # cada BodyStore numera seus segmentos a partir de seg-1.bin: um diretório por worker
+            opts["body_store_dir"] = f"{opts['body_store_dir']}.{i}"
+        return opts
+
+    async def start(self) -> None:
+        reserved = None
+        if self.port == 0:
+            # escolhe a porta aqui e a mantém ocupada (com SO_REUSEPORT) até os workers escutarem
+            reserved = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET)
+            reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            reserved.bind((self.host, 0))
+            self.port = reserved.getsockname()[1]
+        try:
+            ctx = multiprocessing.get_context("spawn")
+            bus_opts = {"batch_interval": self.bus.batch_interval, "max_queue": self.bus.max_queue}
+            for i, client in enumerate(self.clients):
+                proc = ctx.Process(target=run_core, args=(client.address, bus_opts), kwargs=self._worker_opts(i),
+                                   name=f"lokiproxy-worker-{i}", daemon=True)
+                proc.start()
+                self._procs.append(proc)
+            await asyncio.gather(*(c.connect(self.connect_timeout) for c in self.clients))
+        finally:
+            if reserved is not None:
+                reserved.close()
+        if self.intercept:
+            await self._broadcast(SET_INTERCEPT, {"on": True})
+        self._tasks = [asyncio.create_task(self._relay(i, c)) for i, c in enumerate(self.clients)]
+        self._tasks.append(asyncio.create_task(self._gui_cmd_loop()))
+        await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Proxy listening on {self.host}:{self.port} "
+                                                         f"({self.workers} workers)"})
+
+    async def close(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+        for c in self.clients:
+            await c.close()
+        for proc in self._procs:
+            proc.terminate()
+        for proc in self._procs:
+            await asyncio.to_thread(proc.join, 5)
+        self._procs = []
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    async def wait(self) -> None:
+        """Repassa eventos e comandos até ser cancelado"""
+        await asyncio.gather(*self._tasks)
+
+    async def serve(self) -> None:
+        await self.start()
+        try:
+            await self.wait()
+        finally:
+            await self.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"bus": self.bus.stats.as_dict(),
+                "metrics": merge_metrics(w.get("metrics") for w in self.worker_stats.values()),
+                "workers": [dict(self.worker_stats.get(i, {}), worker=i) for i in range(self.workers)]}
+
+    async def export_har(self, path: str) -> int:
+        """Traz os flows completos de cada worker e os exporta num único HAR"""
+        from .har import export_har
+        flows = await asyncio.gather(*(self.flows.fetch(f.id) for f in self.flows.all()))
+
+        def write():
+            with open(path, "w", encoding="utf-8") as fp:
+                return export_har([f for f in flows if f is not None], fp)
+        return await asyncio.to_thread(write)
+
+    async def import_har(self, path: str) -> int:
+        # o primeiro worker guarda os flows importados
+        return await self.clients[0].import_har(path)
+
+    async def _relay(self, i: int, client: CoreClient) -> None:
+        """Republica no bus local os eventos de um worker"""
+        while True:
+            ev = await client.events.get()
+            if ev.type == FLOW_BATCH:
+                for key, type in _BATCH_TYPES:
+                    for fid in ev.data.get(key, ()):
+                        await self.bus.publish_core(type, {"id": fid})
+            elif ev.type == METRICS:
+                self.worker_stats[i] = ev.data
+                await self.bus.publish_core(METRICS, dict(ev.data, worker=i))
+            elif ev.type == LOG_MESSAGE:
+                await self.bus.publish_core(LOG_MESSAGE, dict(ev.data, msg=f"[worker {i}] {ev.data.get('msg', '')}"))
+            else:
+                await self.bus.publish_core(ev.type, ev.data)
+
+    async def _broadcast(self, type: str, data: Dict[str, Any]) -> None:
+        await asyncio.gather(*(c.send_cmd(type, data) for c in self.clients))
+
+    async def _gui_cmd_loop(self) -> None:
+        while True:
+            ev = await self.bus.consume_gui_cmd()
+            try:
+                if ev.type in (FORWARD_FLOW, DROP_FLOW, REPEAT_FLOW):
+                    await self.owner(int(ev.data["flow_id"])).send_cmd(ev.type, ev.data)
+                else:
+                    if ev.type == SET_INTERCEPT and "on" in ev.data:
+                        self.intercept = bool(ev.data["on"])
+                    # SET_INTERCEPT, INTERCEPT_BULK, APPLY_RULES: todos os workers aplicam
+                    await self._broadcast(ev.type, ev.data)
+            except ConnectionError as e:
+                await self.bus.publish_core(LOG_MESSAGE, {"msg": f"Worker unreachable: {e}"})
@@ -1,10 +1,11 @@
 import asyncio
 from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLineEdit, QLabel, QSplitter
-from PySide6.QtCore import Qt, Slot
-from ..core.bus import EventBus, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, FLOW_PAUSED, LOG_MESSAGE, SET_INTERCEPT, FORWARD_FLOW, DROP_FLOW
+from PySide6.QtCore import Qt, Slot, QTimer
+from ..core.bus import EventBus, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, FLOW_BATCH, FLOW_PAUSED, LOG_MESSAGE, SET_INTERCEPT, FORWARD_FLOW, DROP_FLOW, INTERCEPT_BULK
 from .flows_view import FlowsTable
 from .flow_detail import FlowDetail
 from .rules_editor import RulesEditor
+from .search_panel import SearchPanel
 from ..core.proxy import ProxyServer
 
 class HuginApp(QMainWindow):
@@ -15,6 +16,7 @@ class HuginApp(QMainWindow):
         self.bus = bus or EventBus()
         self.intercept_on = False
         self.autoscroll_on = False
+        self._capture_windows = []
 
         # start proxy in background
         #self.proxy = ProxyServer(bus=self.bus)
@@ -27,17 +29,28 @@ class HuginApp(QMainWindow):
         self.btn_intercept = QPushButton("Intercept OFF")
         self.btn_forward = QPushButton("Forward")
         self.btn_drop = QPushButton("Drop")
+        # em lote: todos os flows pausados que casam com o filtro da tabela
+        self.btn_forward_all = QPushButton("Forward filtrados")
+        self.btn_drop_all = QPushButton("Drop filtrados")
         self.btn_autoscroll = QPushButton("Auto-scroll OFF")
         self.btn_autoscroll.setCheckable(True)
         self.btn_cert = QPushButton("Gerar Certificado HTTPS")
+        self.btn_open_capture = QPushButton("Abrir captura")
+        self.btn_export_har = QPushButton("Exportar HAR")
+        self.btn_import_har = QPushButton("Importar HAR")
         self.search = QLineEdit()
-        self.search.setPlaceholderText("Filtro (texto / host / método / status)")
+        self.search.setPlaceholderText('Filtro: host:api.* status:>=500 method:POST body~"token"')
 
         topbar.addWidget(self.btn_intercept)
         topbar.addWidget(self.btn_forward)
         topbar.addWidget(self.btn_drop)
+        topbar.addWidget(self.btn_forward_all)
+        topbar.addWidget(self.btn_drop_all)
         topbar.addWidget(self.btn_autoscroll)
         topbar.addWidget(self.btn_cert)
+        topbar.addWidget(self.btn_open_capture)
+        topbar.addWidget(self.btn_export_har)
+        topbar.addWidget(self.btn_import_har)
         topbar.addWidget(QLabel("Filtro:"))
         topbar.addWidget(self.search, 1)
 
@@ -46,7 +59,8 @@ class HuginApp(QMainWindow):
         
         # Área principal: tabela de requisições e detalhes
         center = QSplitter()
-        self.table = FlowsTable(self.bus)
+        # índice de palavras dos corpos (limitado a body_index_limit) para body: sem varrer tudo
+        self.table = FlowsTable(self.bus, body_index=True)
         self.detail = FlowDetail(self.bus)
 
         center.addWidget(self.table)
@@ -54,12 +68,19 @@ class HuginApp(QMainWindow):
         center.setStretchFactor(0, 2)  # Tabela menor
         center.setStretchFactor(1, 3)  # Detalhes maior
 
-        # Editor de regras (menor)
+        # Editor de regras (menor) e, ao lado, a busca textual
         rules = RulesEditor(self.bus)
-        rules.setMaximumHeight(150)  # Limita altura máxima
+        bottom = QSplitter()
+        bottom.addWidget(rules)
+        self.search_panel = None
+        search_index = getattr(self.proxy, "search", None)
+        if search_index is not None:
+            self.search_panel = SearchPanel(search_index, self.proxy.flows)
+            bottom.addWidget(self.search_panel)
+        bottom.setMaximumHeight(150)  # Limita altura máxima
 
         main_splitter.addWidget(center)
-        main_splitter.addWidget(rules)
+        main_splitter.addWidget(bottom)
         main_splitter.setStretchFactor(0, 4)  # Área principal maior
         main_splitter.setStretchFactor(1, 1)  # Regras menor
 
@@ -74,11 +95,19 @@ class HuginApp(QMainWindow):
         self.btn_intercept.clicked.connect(self.toggle_intercept)
         self.btn_forward.clicked.connect(self.forward_selected)
         self.btn_drop.clicked.connect(self.drop_selected)
+        self.btn_forward_all.clicked.connect(lambda: self.bulk_decision("forward"))
+        self.btn_drop_all.clicked.connect(lambda: self.bulk_decision("drop"))
         self.btn_autoscroll.clicked.connect(self.toggle_autoscroll)
         self.btn_cert.clicked.connect(self.generate_certificate)
+        self.btn_open_capture.clicked.connect(self.open_capture)
+        self.btn_export_har.clicked.connect(self.export_har)
+        self.btn_import_har.clicked.connect(self.import_har)
         self.search.textChanged.connect(self.table.set_filter)
+        self.table.filter_error.connect(lambda msg: self.statusBar().showMessage(f"Filtro inválido: {msg}", 5000))
 
         self.table.selection_changed.connect(self.detail.load_flow)
+        if self.search_panel is not None:
+            self.search_panel.flow_selected.connect(self._show_search_hit)
 
         # Inicia o event loop após a GUI estar pronta
         self._start_event_loop()
@@ -113,14 +142,21 @@ class HuginApp(QMainWindow):
         async for ev in self.bus.subscribe_gui():
             if ev.type == LOG_MESSAGE:
                 self.statusBar().showMessage(ev.data.get("msg", ""), 5000)
-            elif ev.type in (FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED):
-                from PySide6.QtCore import QTimer
-                QTimer.singleShot(0, self.table.refresh)
+            elif ev.type in (FLOW_BATCH, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED):
+                if ev.type == FLOW_BATCH:
+                    batch = ev.data
+                else:
+                    # bus sem agrupamento: um evento por vez
+                    key = {FLOW_CREATED: "created", FLOW_UPDATED: "updated",
+                           FLOW_FINISHED: "finished"}[ev.type]
+                    batch = {key: [ev.data["id"]]}
+                self.table.apply_batch(batch)
+                created = bool(batch.get("created"))
                 # Auto-scroll para a última requisição se habilitado
-                if self.autoscroll_on and ev.type == FLOW_CREATED:
+                if self.autoscroll_on and created:
                     QTimer.singleShot(50, self.table.scroll_to_bottom)
                 # Se intercept está ativo, seleciona automaticamente a última requisição
-                if self.intercept_on and ev.type == FLOW_CREATED:
+                if self.intercept_on and created:
                     QTimer.singleShot(100, self.table.scroll_to_bottom)
                     QTimer.singleShot(150, self._select_last_flow)
             elif ev.type == FLOW_PAUSED:
@@ -175,6 +211,56 @@ class HuginApp(QMainWindow):
             from PySide6.QtWidgets import QMessageBox
             QMessageBox.critical(self, "Erro", f"Erro ao gerar certificado: {str(e)}")
 
+    @Slot()
+    def open_capture(self):
+        """Abre um arquivo de captura numa janela separada"""
+        from PySide6.QtWidgets import QFileDialog, QMessageBox
+        from ..core.capture import CaptureReader
+        from .capture_view import CaptureWindow
+        path, _ = QFileDialog.getOpenFileName(self, "Abrir captura", "", "Capturas (*.loki);;Todos (*)")
+        if not path:
+            return
+        try:
+            reader = CaptureReader(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Erro ao abrir captura: {str(e)}")
+            return
+        win = CaptureWindow(reader, bus=self.bus)
+        self._capture_windows.append(win)
+        win.show()
+
+    @Slot()
+    def export_har(self):
+        """Exporta os flows atuais para um HAR; a escrita acontece numa thread do core"""
+        from PySide6.QtWidgets import QFileDialog
+        path, _ = QFileDialog.getSaveFileName(self, "Exportar HAR", "flows.har", "HAR (*.har);;Todos (*)")
+        if path:
+            self._safe_create_task(self._export_har(path))
+
+    async def _export_har(self, path):
+        try:
+            n = await self.proxy.export_har(path)
+        except Exception as e:
+            self.statusBar().showMessage(f"Erro ao exportar HAR: {e}", 5000)
+            return
+        self.statusBar().showMessage(f"{n} flows exportados para {path}", 5000)
+
+    @Slot()
+    def import_har(self):
+        """Importa um HAR no core; os flows chegam à tabela pelos eventos do bus"""
+        from PySide6.QtWidgets import QFileDialog
+        path, _ = QFileDialog.getOpenFileName(self, "Importar HAR", "", "HAR (*.har);;Todos (*)")
+        if path:
+            self._safe_create_task(self._import_har(path))
+
+    async def _import_har(self, path):
+        try:
+            n = await self.proxy.import_har(path)
+        except Exception as e:
+            self.statusBar().showMessage(f"Erro ao importar HAR: {e}", 5000)
+            return
+        self.statusBar().showMessage(f"{n} flows importados de {path}", 5000)
+
     def _selected_flow_id(self):
         return self.table.current_flow_id()
 
@@ -190,14 +276,13 @@ class HuginApp(QMainWindow):
 
     def _select_flow_by_id(self, flow_id):
         """Seleciona uma requisição específica pelo ID"""
-        for row in range(self.table.model.rowCount()):
-            flow = self.table.model.flow_at(row)
-            if flow.id == flow_id:
-                idx = self.table.model.index(row, 0)
-                proxy_idx = self.table.proxy_model.mapFromSource(idx)
-                self.table.table.setCurrentIndex(proxy_idx)
-                self.detail.load_flow(flow_id)
-                break
+        if self.table.select_flow(flow_id):
+            self.detail.load_flow(flow_id)
+
+    def _show_search_hit(self, flow_id):
+        """Mostra o flow encontrado na busca, mesmo que o filtro da tabela o esconda"""
+        self.table.select_flow(flow_id)
+        self.detail.load_flow(flow_id)
 
     @Slot()
     def forward_selected(self):
@@ -210,3 +295,8 @@ class HuginApp(QMainWindow):
         fid = self._selected_flow_id()
         if fid:
             self._safe_create_task(self.bus.send_gui_cmd(DROP_FLOW, {"flow_id": fid}))
+
+    def bulk_decision(self, action: str):
+        """Forward/drop de todos os flows pausados que casam com o filtro da tabela"""
+        self._safe_create_task(self.bus.send_gui_cmd(INTERCEPT_BULK, {"action": action,
+                                                                      "filter": self.search.text()}))
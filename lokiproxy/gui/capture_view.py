@@ -0,0 +1,51 @@
+from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QLabel, QSplitter
+from ..core.bus import EventBus
+from ..core.capture import CaptureReader
+from .flows_view import FlowsTable
+from .flow_detail import FlowDetail
+
+class CaptureWindow(QMainWindow):
+    """Visualizador de um arquivo de captura: lista vem do índice, detalhes sob demanda"""
+
+    def __init__(self, reader: CaptureReader, bus=None):
+        super().__init__()
+        self.reader = reader
+        self.bus = bus or EventBus()
+        self.setWindowTitle(f"HuginProxy - {reader.path}")
+        self.resize(1100, 650)
+
+        self.search = QLineEdit()
+        self.search.setPlaceholderText('Filtro: host:api.* status:>=500 method:POST body~"token"')
+        topbar = QHBoxLayout()
+        topbar.addWidget(QLabel(f"{len(reader)} flows"))
+        topbar.addWidget(QLabel("Filtro:"))
+        topbar.addWidget(self.search, 1)
+
+        center = QSplitter()
+        self.table = FlowsTable(self.bus, flows=reader)
+        self.detail = FlowDetail(self.bus, flows=reader)
+        center.addWidget(self.table)
+        center.addWidget(self.detail)
+        center.setStretchFactor(0, 2)
+        center.setStretchFactor(1, 3)
+
+        container = QWidget()
+        v = QVBoxLayout(container)
+        v.addLayout(topbar)
+        v.addWidget(center, 1)
+        self.setCentralWidget(container)
+
+        self.search.textChanged.connect(self.table.set_filter)
+        self.table.filter_error.connect(lambda msg: self.statusBar().showMessage(f"Filtro inválido: {msg}", 5000))
+        self.table.selection_changed.connect(self.detail.load_flow)
+
+    def closeEvent(self, event):
+        self.reader.close()
+        super().closeEvent(event)
+
+def main(path: str):
+    from PySide6.QtWidgets import QApplication
+    app = QApplication([])
+    win = CaptureWindow(CaptureReader(path))
+    win.show()
+    app.exec()
@@ -1,60 +1,199 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QTabWidget, QTextEdit, QLabel
+import asyncio
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QTabWidget, QPlainTextEdit, QLabel, QListView, QPushButton
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QRectF
+from PySide6.QtGui import QFontDatabase, QPainter, QColor
 from typing import Optional
-from ..core.flows import Flow
+from ..core.flows import Flow, Message
 from ..core.bus import EventBus
+from ..core.preview import BodySource, PREVIEW_LIMIT, render_body
+from ..core.metrics import PHASES, phase_spans
 
 def _fmt_headers(headers):
     return "\n".join(f"{k}: {v}" for k, v in headers)
 
-def _fmt_hex(data: bytes, width=16):
-    out = []
-    for i in range(0, len(data), width):
-        chunk = data[i:i+width]
-        hexpart = " ".join(f"{b:02x}" for b in chunk)
-        asc = "".join(chr(b) if 32 <= b < 127 else "." for b in chunk)
-        out.append(f"{i:08x}  {hexpart:<{width*3}}  {asc}")
-    return "\n".join(out)
+class HexModel(QAbstractListModel):
+    """Uma linha do dump hex por item, formatada só quando a view a pede (linhas visíveis)"""
+
+    def __init__(self):
+        super().__init__()
+        self._source: Optional[BodySource] = None
+        self._rows = 0
+
+    def set_source(self, source: Optional[BodySource]):
+        self.beginResetModel()
+        self._source = source
+        self._rows = source.rows() if source is not None else 0
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self._source.hex_line(index.row())
+        return None
+
+class _MessagePane(QWidget):
+    """Headers + corpo (texto renderizado em segundo plano) e o dump hex virtualizado"""
+
+    def __init__(self):
+        super().__init__()
+        mono = QFontDatabase.systemFont(QFontDatabase.FixedFont)
+        self.text = QPlainTextEdit(); self.text.setReadOnly(False)
+        self.hex_model = HexModel()
+        self.hex = QListView()
+        self.hex.setModel(self.hex_model)
+        self.hex.setUniformItemSizes(True)
+        self.hex.setFont(mono)
+        self.btn_full = QPushButton("Carregar corpo completo")
+        self.btn_full.hide()
+
+        head = QHBoxLayout()
+        head.addWidget(QLabel("Headers + Body (editável)"), 1)
+        head.addWidget(self.btn_full)
+        v = QVBoxLayout(self)
+        v.addLayout(head)
+        v.addWidget(self.text, 1)
+        v.addWidget(QLabel("Hex (só leitura)"))
+        v.addWidget(self.hex, 1)
+
+    def clear(self):
+        self.text.setPlainText("")
+        self.hex_model.set_source(None)
+        self.btn_full.hide()
+
+class TimingWaterfall(QWidget):
+    """Uma barra por fase do flow, posicionada na linha do tempo do flow inteiro"""
+    ROW = 20
+    LABEL = 140
+
+    def __init__(self):
+        super().__init__()
+        self._spans = []
+        self.setMinimumHeight(self.ROW * 2)
+
+    def set_flow(self, flow: Optional[Flow]):
+        self._spans = phase_spans(flow.timings) if flow is not None else []
+        self.setMinimumHeight(self.ROW * (len(self._spans) + 2))
+        self.update()
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        if not self._spans:
+            p.drawText(self.rect(), Qt.AlignCenter, "Sem tempos por fase para este flow")
+            return
+        total = self._spans[-1][2] or 1.0
+        width = max(self.width() - self.LABEL - 80, 10)
+        for row, (phase, start, end) in enumerate(self._spans):
+            y = row * self.ROW
+            p.setPen(self.palette().text().color())
+            p.drawText(QRectF(4, y, self.LABEL - 8, self.ROW), Qt.AlignVCenter, phase)
+            x = self.LABEL + start / total * width
+            bar = QRectF(x, y + 4, max((end - start) / total * width, 1.0), self.ROW - 8)
+            p.fillRect(bar, QColor.fromHsv(PHASES.index(phase) * 360 // len(PHASES), 160, 220))
+            p.drawText(QRectF(bar.right() + 4, y, 80, self.ROW), Qt.AlignVCenter, f"{end - start:.1f} ms")
+        p.drawText(QRectF(4, len(self._spans) * self.ROW, self.width() - 8, self.ROW), Qt.AlignVCenter,
+                   f"Total: {total:.1f} ms")
 
 class FlowDetail(QWidget):
-    def __init__(self, bus: EventBus):
+    def __init__(self, bus: EventBus, flows=None, preview_limit: int = PREVIEW_LIMIT):
         super().__init__()
         self.bus = bus
+        self.flows = flows
+        self.preview_limit = preview_limit
         self._flow: Optional[Flow] = None
+        # incrementado a cada load_flow; renderizações de um flow anterior são descartadas
+        self._generation = 0
 
         tabs = QTabWidget()
-        self.req_text = QTextEdit(); self.req_text.setReadOnly(False)
-        self.req_hex = QTextEdit(); self.req_hex.setReadOnly(True)
-        self.resp_text = QTextEdit(); self.resp_text.setReadOnly(False)
-        self.resp_hex = QTextEdit(); self.resp_hex.setReadOnly(True)
-
-        reqw = QWidget(); rv = QVBoxLayout(reqw)
-        rv.addWidget(QLabel("Headers + Body (editável)"))
-        rv.addWidget(self.req_text, 1)
-        rv.addWidget(QLabel("Hex (só leitura)"))
-        rv.addWidget(self.req_hex, 1)
-
-        respw = QWidget(); rsv = QVBoxLayout(respw)
-        rsv.addWidget(QLabel("Headers + Body (editável)"))
-        rsv.addWidget(self.resp_text, 1)
-        rsv.addWidget(QLabel("Hex (só leitura)"))
-        rsv.addWidget(self.resp_hex, 1)
-
-        tabs.addTab(reqw, "Request")
-        tabs.addTab(respw, "Response")
+        self.req = _MessagePane()
+        self.resp = _MessagePane()
+        tabs.addTab(self.req, "Request")
+        tabs.addTab(self.resp, "Response")
+        self.timing = TimingWaterfall()
+        tabs.addTab(self.timing, "Timing")
+        self.req.btn_full.clicked.connect(lambda: self._render_full(self.req, "request"))
+        self.resp.btn_full.clicked.connect(lambda: self._render_full(self.resp, "response"))
 
         v = QVBoxLayout(self)
         v.addWidget(tabs, 1)
 
     def load_flow(self, fid: int):
-        flow = self.bus.proxy.flows.get(fid)
+        flows = self.flows if self.flows is not None else self.bus.proxy.flows
+        flow = flows.get(fid)
+        self._generation += 1
+        fetch = getattr(flows, "fetch", None)
+        if flow is not None and fetch is not None:
+            # core em outro processo: get() só tem o resumo, o flow completo vem por id
+            self._flow = None
+            self.timing.set_flow(None)
+            for pane in (self.req, self.resp):
+                pane.clear()
+                pane.text.setPlainText("[carregando flow...]")
+            self._spawn(self._fetch(fetch, fid, self._generation), lambda: None)
+            return
+        self._show(flow)
+
+    async def _fetch(self, fetch, fid: int, generation: int):
+        try:
+            flow = await fetch(fid)
+        except Exception as e:
+            if generation == self._generation:
+                self.req.text.setPlainText(f"[erro ao carregar flow: {e}]")
+            return
+        if generation == self._generation:
+            self._show(flow)
+
+    def _show(self, flow: Optional[Flow]):
         self._flow = flow
+        self.timing.set_flow(flow)
         if not flow:
-            self.req_text.setPlainText(""); self.resp_text.setPlainText("")
-            self.req_hex.setPlainText(""); self.resp_hex.setPlainText("")
+            self.req.clear(); self.resp.clear()
+            return
+        for pane, msg in ((self.req, flow.request), (self.resp, flow.response)):
+            # o hex lê só as linhas visíveis; o texto chega quando a renderização terminar
+            pane.hex_model.set_source(BodySource(msg))
+            pane.btn_full.hide()
+            headers = _fmt_headers(msg.headers)
+            if msg.body_length:
+                pane.text.setPlainText(headers + "\n\n[carregando corpo...]")
+                self._render(pane, msg, headers, self.preview_limit)
+            else:
+                pane.text.setPlainText(headers + "\n\n" + render_body(msg)[0])
+
+    def _render_full(self, pane: _MessagePane, side: str):
+        if self._flow is None:
+            return
+        msg: Message = getattr(self._flow, side)
+        pane.btn_full.hide()
+        self._render(pane, msg, _fmt_headers(msg.headers), None)
+
+    def _render(self, pane: _MessagePane, msg: Message, headers: str, limit: Optional[int]):
+        """Decodifica/indenta o corpo numa thread e mostra o texto se o flow ainda for o atual"""
+        generation = self._generation
+
+        def show(result):
+            if generation != self._generation:
+                return
+            text, truncated = result
+            pane.text.setPlainText(headers + "\n\n" + text)
+            pane.btn_full.setVisible(truncated)
+
+        async def run():
+            try:
+                result = await asyncio.to_thread(render_body, msg, limit)
+            except Exception as e:
+                result = (f"[erro ao carregar corpo: {e}]", False)
+            show(result)
+        self._spawn(run(), lambda: show(render_body(msg, limit)))
+
+    @staticmethod
+    def _spawn(coro, fallback):
+        """Agenda coro no loop do qasync; sem loop rodando executa fallback na hora"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            coro.close()
+            fallback()
             return
-        req_headers = _fmt_headers(flow.request.headers)
-        self.req_text.setPlainText(req_headers + "\n\n" + flow.request.body.decode("utf-8", errors="replace"))
-        self.req_hex.setPlainText(_fmt_hex(flow.request.body))
-        resp_headers = _fmt_headers(flow.response.headers)
-        self.resp_text.setPlainText(resp_headers + "\n\n" + (flow.response.body or b"").decode("utf-8", errors="replace"))
-        self.resp_hex.setPlainText(_fmt_hex(flow.response.body or b""))
+        loop.create_task(coro)
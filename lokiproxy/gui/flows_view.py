@@ -1,21 +1,107 @@
-from PySide6.QtCore import QAbstractTableModel, Qt, QModelIndex, Signal, QSortFilterProxyModel
+from PySide6.QtCore import QAbstractTableModel, Qt, QModelIndex, Signal, QSortFilterProxyModel, QTimer
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QTableView
-from typing import Optional
+import itertools
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from ..core.flows import Flow, LRUFlows
 from ..core.bus import EventBus
+from ..core.filters import FlowFilter, FlowIndex
+
+FILTER_DEBOUNCE_MS = 250
+
+def _runs(rows: List[int]) -> Iterator[Tuple[int, int]]:
+    """Agrupa linhas ordenadas em intervalos contíguos (início, fim)"""
+    start = prev = None
+    for r in rows:
+        if prev is not None and r == prev + 1:
+            prev = r
+            continue
+        if start is not None:
+            yield start, prev
+        start = prev = r
+    if start is not None:
+        yield start, prev
 
 class FlowsModel(QAbstractTableModel):
+    """Linhas na ordem de criação dos flows, atualizadas incrementalmente.
+
+    apply() recebe os ids de um FLOW_BATCH: flows novos viram beginInsertRows no fim,
+    atualizados viram dataChanged só nas suas linhas, e flows expulsos do LRUFlows
+    (avisados por on_evict) viram beginRemoveRows. `_index` guarda a posição absoluta de
+    cada id; como as expulsões quase sempre são das linhas mais antigas, remover do início
+    só avança `_base` em vez de renumerar o índice.
+    """
     HEADERS = ["ID", "Método", "Host", "Caminho", "Status", "Tamanho", "Duração (ms)"]
     def __init__(self, flows: LRUFlows):
         super().__init__()
         self.flows = flows
-        self._rows = []
+        self._rows: List[Flow] = []
+        self._index: Dict[int, int] = {}
+        self._base = 0
+        self._evicted: Set[int] = set()
+        if hasattr(flows, "on_evict"):
+            flows.on_evict(self._on_evict)
 
     def refresh(self):
+        """Reconstrói o modelo inteiro (carga inicial, importação em massa)"""
         self.beginResetModel()
         self._rows = self.flows.all()
+        self._base = 0
+        self._index = {f.id: row for row, f in enumerate(self._rows)}
+        self._evicted.clear()
         self.endResetModel()
 
+    def _on_evict(self, flow: Flow):
+        # aplicado no próximo apply(), junto com o lote de eventos
+        if flow.id in self._index:
+            self._evicted.add(flow.id)
+
+    def row_of(self, fid: int) -> Optional[int]:
+        pos = self._index.get(fid)
+        return None if pos is None else pos - self._base
+
+    def apply(self, created: Iterable[int] = (), updated: Iterable[int] = (),
+              finished: Iterable[int] = ()):
+        self._remove_evicted()
+
+        new = []
+        for fid in created:
+            if fid in self._index:
+                continue
+            flow = self.flows.get(fid)
+            if flow is not None:
+                new.append(flow)
+        if new:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(new) - 1)
+            for flow in new:
+                self._index[flow.id] = self._base + len(self._rows)
+                self._rows.append(flow)
+            self.endInsertRows()
+
+        rows = sorted({r for r in map(self.row_of, itertools.chain(updated, finished)) if r is not None})
+        last_col = len(self.HEADERS) - 1
+        for start, end in _runs(rows):
+            self.dataChanged.emit(self.index(start, 0), self.index(end, last_col), [Qt.DisplayRole])
+
+    def _remove_evicted(self):
+        if not self._evicted:
+            return
+        rows = sorted(r for r in map(self.row_of, self._evicted) if r is not None)
+        self._evicted.clear()
+        for fid in [self._rows[r].id for r in rows]:
+            del self._index[fid]
+        # de trás para frente para que as linhas ainda não removidas não mudem de posição
+        for start, end in reversed(list(_runs(rows))):
+            self.beginRemoveRows(QModelIndex(), start, end)
+            del self._rows[start:end + 1]
+            self.endRemoveRows()
+        if rows and rows[-1] == len(rows) - 1:
+            # só linhas do início: as posições absolutas continuam válidas
+            self._base += len(rows)
+        else:
+            self._base = 0
+            self._index = {f.id: row for row, f in enumerate(self._rows)}
+
     def rowCount(self, parent=None):
         return len(self._rows)
 
@@ -45,17 +131,61 @@ class FlowsModel(QAbstractTableModel):
     def flow_at(self, row) -> Flow:
         return self._rows[row]
 
+class FlowFilterProxy(QSortFilterProxyModel):
+    """Filtra linhas pelo conjunto de ids calculado com o FlowIndex.
+
+    Flows criados ou alterados depois da última consulta ficam em `_stale` e são avaliados
+    individualmente (FlowFilter.matches) quando o proxy reavalia suas linhas.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._filter: Optional[FlowFilter] = None
+        self._accepted: Set[int] = set()
+        self._stale: Set[int] = set()
+
+    def set_result(self, flt: Optional[FlowFilter], accepted: Set[int]):
+        self._filter = flt
+        self._accepted = accepted
+        self._stale.clear()
+        self.invalidateFilter()
+
+    def mark_stale(self, ids: Iterable[int]):
+        if self._filter is not None:
+            self._stale.update(ids)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._filter is None:
+            return True
+        flow = self.sourceModel().flow_at(source_row)
+        if flow.id in self._stale:
+            self._stale.discard(flow.id)
+            if self._filter.matches(flow):
+                self._accepted.add(flow.id)
+            else:
+                self._accepted.discard(flow.id)
+        return flow.id in self._accepted
+
 class FlowsTable(QWidget):
     selection_changed = Signal(int)  # flow id
-    def __init__(self, bus: EventBus):
+    filter_error = Signal(str)
+    def __init__(self, bus: EventBus, flows=None, body_index: bool = False):
         super().__init__()
         self.bus = bus
-        self.proxy = bus.proxy
+        self.proxy = getattr(bus, "proxy", None)
 
-        self.model = FlowsModel(self.proxy.flows)
-        self.proxy_model = QSortFilterProxyModel(self)
-        self.proxy_model.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        # flows: fonte alternativa com all()/get(), p.ex. um CaptureReader
+        self.model = FlowsModel(flows if flows is not None else self.proxy.flows)
+        self.index = FlowIndex(body_index=body_index)
+        if hasattr(self.model.flows, "on_evict"):
+            self.model.flows.on_evict(lambda flow: self.index.remove(flow.id))
+        self.proxy_model = FlowFilterProxy(self)
         self.proxy_model.setSourceModel(self.model)
+        self._query = ""
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(FILTER_DEBOUNCE_MS)
+        self._filter_timer.timeout.connect(self._apply_filter)
 
         v = QVBoxLayout(self)
         self.table = QTableView()
@@ -69,6 +199,28 @@ class FlowsTable(QWidget):
 
     def refresh(self):
         self.model.refresh()
+        self.index.clear()
+        for row in range(self.model.rowCount()):
+            self.index.update(self.model.flow_at(row))
+        self._apply_filter()
+
+    def apply_batch(self, data: dict):
+        """Aplica um FLOW_BATCH do bus sem resetar o modelo (seleção e rolagem são mantidas)"""
+        created, updated, finished = data.get("created", ()), data.get("updated", ()), data.get("finished", ())
+        changed = set(created) | set(updated) | set(finished)
+        for fid in changed:
+            flow = self.model.flows.get(fid)
+            if flow is not None:
+                self.index.update(flow)
+        self.proxy_model.mark_stale(changed)
+        self.model.apply(created, updated, finished)
+
+    def select_flow(self, fid: int) -> bool:
+        row = self.model.row_of(fid)
+        if row is None:
+            return False
+        self.table.setCurrentIndex(self.proxy_model.mapFromSource(self.model.index(row, 0)))
+        return True
 
     def _emit_selected(self, idx):
         src = self.proxy_model.mapToSource(idx)
@@ -83,14 +235,23 @@ class FlowsTable(QWidget):
         return self.model.flow_at(src.row()).id
 
     def set_filter(self, text: str):
-        self.proxy_model.setFilterFixedString(text)
+        """Agenda a filtragem; digitação seguida só consulta o índice depois da pausa"""
+        self._query = text
+        self._filter_timer.start()
+
+    def _apply_filter(self):
+        try:
+            flt = FlowFilter(self._query)
+        except ValueError as e:
+            self.filter_error.emit(str(e))
+            return
+        if not flt:
+            self.proxy_model.set_result(None, set())
+        else:
+            self.proxy_model.set_result(flt, self.index.query(flt))
 
     def mark_paused(self, fid: int):
-        for row, f in enumerate(self.model._rows):
-            if f.id == fid:
-                idx = self.model.index(row, 0)
-                self.table.setCurrentIndex(self.proxy_model.mapFromSource(idx))
-                break
+        self.select_flow(fid)
 
     def scroll_to_bottom(self):
         """Rola a tabela para o final para mostrar as requisições mais recentes"""
@@ -1,29 +1,76 @@
 import asyncio
+import secrets
+import threading
+import multiprocessing
 from PySide6.QtWidgets import QApplication
 from qasync import QEventLoop
 from .app import HuginApp
 from ..core.bus import EventBus
 from ..core.proxy import ProxyServer
+from ..core.ipc import CoreClient, RemoteBus, default_address, is_tcp, run_core
+from ..core.workers import WorkerPool
 
-def main(bus=None, host="127.0.0.1", port=8080):
+def _start_core(mode: str, address: str, token, bus: EventBus, proxy_opts: dict):
+    """Sobe o core numa thread (loop asyncio próprio) ou num processo; devolve um finalizador"""
+    bus_opts = {"batch_interval": bus.batch_interval, "max_queue": bus.max_queue}
+    if mode == "thread":
+        t = threading.Thread(target=run_core, args=(address, bus_opts, token), kwargs=proxy_opts,
+                             name="lokiproxy-core", daemon=True)
+        t.start()
+        # thread daemon: termina junto com a GUI
+        return lambda: None
+    # spawn: o filho não herda o estado do Qt
+    proc = multiprocessing.get_context("spawn").Process(target=run_core, args=(address, bus_opts, token),
+                                                         kwargs=proxy_opts, name="lokiproxy-core")
+    proc.start()
+
+    def stop():
+        proc.terminate()
+        proc.join(5)
+    return stop
+
+def main(bus=None, host="127.0.0.1", port=8080, core="inline", ipc=None, attach=None, ipc_token=None,
+         workers=1, **proxy_opts):
+    """core: "inline" roda o proxy no loop do Qt; "thread"/"process" o isolam da GUI, que
+    conversa com ele pelo transporte IPC; attach conecta a um core já rodando (headless).
+    workers > 1 (só com core inline) sobe um WorkerPool de processos na mesma porta."""
     app = QApplication([])
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
     bus = bus or EventBus()
+    stop_core = lambda: None
 
-    # Cria o proxy e o expõe no bus ANTES de criar a janela
-    proxy = ProxyServer(host=host, port=port, bus=bus)
-    bus.proxy = proxy
+    if attach is None and core == "inline":
+        # Cria o proxy e o expõe no bus ANTES de criar a janela
+        if workers > 1:
+            proxy = WorkerPool(workers, bus, host=host, port=port, **proxy_opts)
+        else:
+            proxy = ProxyServer(host=host, port=port, bus=bus, **proxy_opts)
+        bus.proxy = proxy
 
-    # Agende o servidor no loop do qasync
-    loop.create_task(proxy.serve())
+        # Agende o servidor no loop do qasync
+        loop.create_task(proxy.serve())
+    else:
+        address = attach or ipc or default_address()
+        token = ipc_token
+        if attach is None:
+            if token is None and is_tcp(address):
+                # segredo do transporte TCP: o core filho o recebe pelo spawn, não pela linha de comando
+                token = secrets.token_urlsafe(24)
+            stop_core = _start_core(core, address, token, bus, dict(host=host, port=port, **proxy_opts))
+        client = CoreClient(address, token=token)
+        loop.run_until_complete(client.connect())
+        bus = RemoteBus(client)
 
     win = HuginApp(bus=bus)
     win.show()
 
-    with loop:
-        loop.run_forever()
+    try:
+        with loop:
+            loop.run_forever()
+    finally:
+        stop_core()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,84 @@
+import time
+import asyncio
+import inspect
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QLabel, QListWidget, QListWidgetItem
+from PySide6.QtCore import Qt, Signal, QTimer
+from ..core.search import SearchIndex
+
+
+class SearchPanel(QWidget):
+    """Busca textual nos headers e corpos; clicar num resultado emite o id.
+
+    index é o SearchIndex do proxy ou, com o core em outro processo, o RemoteSearch, cujo
+    search() é uma corrotina.
+    """
+    flow_selected = Signal(int)
+
+    def __init__(self, index: SearchIndex, flows=None, limit: int = 200):
+        super().__init__()
+        self.index = index
+        self.flows = flows
+        self.limit = limit
+        self.input = QLineEdit()
+        self.input.setPlaceholderText("Buscar em headers e corpos (todas as palavras)")
+        self.status = QLabel("")
+        self.results = QListWidget()
+
+        top = QHBoxLayout()
+        top.addWidget(self.input, 1)
+        top.addWidget(self.status)
+        v = QVBoxLayout(self)
+        v.setContentsMargins(0, 0, 0, 0)
+        v.addLayout(top)
+        v.addWidget(self.results)
+
+        # Consulta só depois de uma pausa na digitação
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(200)
+        self._timer.timeout.connect(self.run_search)
+        self.input.textChanged.connect(lambda _: self._timer.start())
+        self.input.returnPressed.connect(self.run_search)
+        self.results.itemActivated.connect(self._activated)
+        self.results.itemClicked.connect(self._activated)
+
+    def run_search(self):
+        self._timer.stop()
+        self.results.clear()
+        query = self.input.text().strip()
+        if not query:
+            self.status.setText("")
+            return
+        t0 = time.perf_counter()
+        hits = self.index.search(query, limit=self.limit)
+        if inspect.isawaitable(hits):
+            asyncio.get_running_loop().create_task(self._show_async(query, hits, t0))
+        else:
+            self._show(hits, t0)
+
+    async def _show_async(self, query: str, hits, t0: float):
+        try:
+            hits = await hits
+        except Exception as e:
+            self.status.setText(f"Erro na busca: {e}")
+            return
+        # descarta a resposta de uma consulta que já foi substituída
+        if query == self.input.text().strip():
+            self._show(hits, t0)
+
+    def _show(self, hits, t0: float):
+        elapsed = (time.perf_counter() - t0) * 1000
+        for fid, score in hits:
+            item = QListWidgetItem(self._label(fid, score))
+            item.setData(Qt.UserRole, fid)
+            self.results.addItem(item)
+        self.status.setText(f"{len(hits)} resultado(s) em {elapsed:.1f} ms")
+
+    def _label(self, fid: int, score: float) -> str:
+        flow = self.flows.get(fid) if self.flows is not None else None
+        if flow is None:
+            return f"#{fid}  ({score:.2f})"
+        return f"#{fid}  {flow.method} {flow.host}{flow.path}  [{flow.status_code or '-'}]  ({score:.2f})"
+
+    def _activated(self, item: QListWidgetItem):
+        self.flow_selected.emit(int(item.data(Qt.UserRole)))
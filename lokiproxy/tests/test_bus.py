@@ -0,0 +1,56 @@
+import asyncio
+from lokiproxy.core.bus import EventBus, FLOW_CREATED, FLOW_UPDATED, FLOW_FINISHED, FLOW_BATCH, FLOW_PAUSED, LOG_MESSAGE
+
+
+def test_flow_events_are_coalesced_per_frame():
+    async def run():
+        bus = EventBus(batch_interval=0.02)
+        for fid in (1, 2, 3):
+            await bus.publish_core(FLOW_CREATED, {"id": fid})
+            await bus.publish_core(FLOW_UPDATED, {"id": fid})
+            await bus.publish_core(FLOW_UPDATED, {"id": fid})
+        await bus.publish_core(FLOW_FINISHED, {"id": 2})
+        events = bus.subscribe_gui()
+        ev = await asyncio.wait_for(events.__anext__(), 1)
+        return bus, ev
+
+    bus, ev = asyncio.run(run())
+    assert ev.type == FLOW_BATCH
+    assert ev.data == {"created": [1, 2, 3], "updated": [1, 2, 3], "finished": [2]}
+    assert bus.stats.batches == 1 and bus.stats.coalesced == 7
+
+
+def test_pending_batch_precedes_paused_and_logs_drop_when_full():
+    async def run():
+        bus = EventBus(batch_interval=10, max_queue=3)
+        await bus.publish_core(FLOW_CREATED, {"id": 7})
+        await bus.publish_core(FLOW_PAUSED, {"id": 7, "where": "request"})
+        for i in range(5):
+            await bus.publish_core(LOG_MESSAGE, {"msg": str(i)})
+        events = bus.subscribe_gui()
+        return bus, [await events.__anext__() for _ in range(3)]
+
+    bus, evs = asyncio.run(run())
+    assert [e.type for e in evs] == [FLOW_BATCH, FLOW_PAUSED, LOG_MESSAGE]
+    assert bus.stats.dropped == 4 and bus.stats.max_depth == 3
+
+
+def test_publish_never_waits_for_the_gui():
+    async def run():
+        bus = EventBus(batch_interval=0, max_queue=2)
+        # sem consumidor: nada disto pode bloquear o core
+        for fid in (1, 2, 3):
+            await asyncio.wait_for(bus.publish_core(FLOW_CREATED, {"id": fid}), 1)
+            await asyncio.wait_for(bus.publish_core(FLOW_PAUSED, {"id": fid, "where": "request"}), 1)
+        await asyncio.wait_for(bus.publish_core(FLOW_FINISHED, {"id": 3}), 1)
+        assert bus.depth == 2 and bus.stats.overflowed == 4
+        events = bus.subscribe_gui()
+        return bus, [await asyncio.wait_for(events.__anext__(), 1) for _ in range(7)]
+
+    bus, evs = asyncio.run(run())
+    # a ordem se mantém: cada FLOW_PAUSED vem depois do FLOW_CREATED do seu flow
+    assert [(e.type, e.data.get("id")) for e in evs] == [
+        (FLOW_CREATED, 1), (FLOW_PAUSED, 1), (FLOW_BATCH, None), (FLOW_PAUSED, 2),
+        (FLOW_BATCH, None), (FLOW_PAUSED, 3), (FLOW_BATCH, None)]
+    assert evs[2].data["created"] == [2] and evs[6].data == {"created": [], "updated": [], "finished": [3]}
+    assert bus.stats.dropped == 0 and bus.depth == 0
@@ -1,7 +1,96 @@
+import ssl
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cryptography import x509
 from lokiproxy.core.ca import ensure_ca, issue_cert_for_host
+from lokiproxy.core.certs import CertCache, wildcard_parent
 
 def test_ca_issue():
     cert, key = ensure_ca()
     cert_pem, key_pem = issue_cert_for_host("example.com", cert, key)
     assert b"BEGIN CERTIFICATE" in cert_pem
     assert b"BEGIN RSA PRIVATE KEY" in key_pem
+
+def _san(leaf):
+    cert = x509.load_pem_x509_certificate(leaf.cert_pem)
+    return cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+
+def test_wildcard_parent():
+    assert wildcard_parent("a.example.com") == "example.com"
+    assert wildcard_parent("example.com") is None
+    assert wildcard_parent("shop.co.uk") is None
+    assert wildcard_parent("10.0.0.1") is None
+
+def test_cert_cache_reuses_wildcard_and_disk(tmp_path):
+    cert, key = ensure_ca()
+    cache = CertCache(cert, key, directory=str(tmp_path), key_type="ecdsa")
+    a = cache.get("a.example.com")
+    b = cache.get("B.example.com")
+    assert a is b and cache.issued == 1
+    assert _san(a) == ["*.example.com", "example.com"]
+    assert b"BEGIN EC PRIVATE KEY" in a.key_pem
+    cache.close()
+
+    again = CertCache(cert, key, directory=str(tmp_path), key_type="ecdsa")
+    c = again.get("c.example.com")
+    assert again.issued == 0 and again.disk_hits == 1
+    assert c.cert_pem == a.cert_pem and c.key_pem == a.key_pem
+    again.close()
+
+def test_cert_cache_dedups_concurrent_issuance():
+    cert, key = ensure_ca()
+    cache = CertCache(cert, key, persist=False)
+
+    async def run():
+        return await asyncio.gather(*(cache.aget("example.org") for _ in range(5)))
+    leaves = asyncio.run(run())
+    assert cache.issued == 1
+    assert all(leaf is leaves[0] for leaf in leaves)
+    # a chave compartilhada é usada também por hosts diferentes
+    assert cache.get("other.test").key_pem == leaves[0].key_pem
+    cache.close()
+
+def _handshake(server_ctx, client_ctx, server_name):
+    """Handshake TLS em memória; devolve os SANs DNS do certificado recebido pelo cliente"""
+    c_in, c_out, s_in, s_out = (ssl.MemoryBIO() for _ in range(4))
+    client = client_ctx.wrap_bio(c_in, c_out, server_hostname=server_name)
+    server = server_ctx.wrap_bio(s_in, s_out, server_side=True)
+    done = [False, False]
+    while not all(done):
+        for i, (obj, out, peer_in) in enumerate(((client, c_out, s_in), (server, s_out, c_in))):
+            try:
+                obj.do_handshake()
+                done[i] = True
+            except ssl.SSLWantReadError:
+                pass
+            peer_in.write(out.read())
+    cert = x509.load_der_x509_certificate(client.getpeercert(binary_form=True))
+    return cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+
+def test_sni_issues_off_the_loop():
+    cert, key = ensure_ca()
+    executor = ThreadPoolExecutor(max_workers=1)
+    cache = CertCache(cert, key, persist=False, key_type="ecdsa", executor=executor)
+    client_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    client_ctx.check_hostname = False
+    client_ctx.verify_mode = ssl.CERT_NONE
+
+    async def run():
+        ctx = cache.context(await cache.aget("127.0.0.1"))
+        # segura o executor para a emissão do SNI ficar pendente
+        gate = threading.Event()
+        executor.submit(gate.wait)
+        try:
+            # o SNI ainda sem certificado: segue o do alvo e a emissão vai para o executor
+            first = _handshake(ctx, client_ctx, "sni.test")
+            assert cache.issued == 1 and "sni.test" in cache._inflight
+        finally:
+            gate.set()
+        await cache._inflight["sni.test"]
+        return first, _handshake(ctx, client_ctx, "sni.test")
+
+    first, second = asyncio.run(run())
+    assert first == [] and second == ["sni.test"] and cache.issued == 2
+    cache.close()
+    executor.shutdown()
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+from lokiproxy.core.bodystore import BodyStore
+from lokiproxy.core.capture import MAGIC, CaptureReader, CaptureWriter, _scan_records
+from lokiproxy.core.flows import LRUFlows
+
+
+def _flows(n):
+    store = LRUFlows()
+    out = []
+    for i in range(n):
+        f = store.new_flow()
+        f.method, f.host, f.path, f.status_code = "GET", f"h{i % 2}.test", f"/{i}", 200 + i
+        f.request.headers = [("Host", f.host)]
+        f.response.body = b"body-%d" % i
+        f.finished_at = f.started_at + 0.5
+        out.append(f)
+    return out
+
+
+def _write(path, flows, compression="gzip"):
+    async def run():
+        w = CaptureWriter(path, compression)
+        w.start()
+        for f in flows:
+            w.submit(f)
+        await w.close()
+    asyncio.run(run())
+
+
+def test_roundtrip_and_filter(tmp_path):
+    path = str(tmp_path / "c.loki")
+    _write(path, _flows(5))
+    r = CaptureReader(path)
+    assert len(r) == 5
+    assert [e.id for e in r.filter(host="h1")] == [2, 4]
+    assert [e.id for e in r.filter(status=202)] == [3]
+    f = r.load(4)
+    assert f.response.body == b"body-3" and f.request.headers == [("Host", "h1.test")]
+    assert r.entry(4).duration_ms == 500
+    r.close()
+
+
+def test_index_rebuilt_and_truncated_tail_ignored(tmp_path):
+    path = str(tmp_path / "c.loki")
+    _write(path, _flows(3), compression="none")
+    os.remove(path + ".idx")
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00\x10\x00\x00partial")
+    r = CaptureReader(path)
+    assert [e.id for e in r.entries] == [1, 2, 3]
+    r.close()
+    assert os.path.exists(path + ".idx")
+    # o writer descarta o registro incompleto antes de anexar
+    _write(path, _flows(1), compression="none")
+    r = CaptureReader(path)
+    assert len(r) == 4 and r.load(1).response.body == b"body-0"
+    r.close()
+
+
+def test_writer_reopen_keeps_index_offsets_exact(tmp_path):
+    path = str(tmp_path / "c.loki")
+    _write(path, _flows(2), compression="none")
+    size = os.path.getsize(path)
+    # registro final incompleto, com a linha do índice já gravada
+    with open(path, "ab") as f:
+        f.write(b"\x00\x00\x10\x00\x00partial")
+    with open(path + ".idx", "a") as f:
+        f.write('[9,%d,4101,"GET","h","/",200,0,0,0]\n' % size)
+    _write(path, _flows(1), compression="none")
+    with open(path + ".idx") as f:
+        lines = [json.loads(line) for line in f]
+    with open(path, "rb") as f:
+        scanned = [list(e) for e in _scan_records(f, len(MAGIC))]
+    assert lines == scanned and [e[0] for e in lines] == [1, 2, 1] and lines[2][1] == size
+
+
+def test_submit_keeps_bodies_taken_before_offload(tmp_path):
+    path = str(tmp_path / "c.loki")
+    flows = _flows(2)
+
+    async def run():
+        store = BodyStore(str(tmp_path / "bodies"))
+        w = CaptureWriter(path, "none")
+        w.start()
+        for f in flows:
+            w.submit(f)
+            # a serialização acontece na thread do writer, depois do offload e do close do store
+            f.response.offload(store)
+        store.close()
+        await w.close()
+    asyncio.run(run())
+    r = CaptureReader(path)
+    assert [r.load(f.id).response.body for f in flows] == [b"body-0", b"body-1"]
+    r.close()
@@ -0,0 +1,124 @@
+import json
+import asyncio
+from lokiproxy.core.bus import EventBus, FLOW_PAUSED
+from lokiproxy.core.control import ControlServer
+from lokiproxy.core.proxy import ProxyServer
+from lokiproxy.tests.test_proxy import _origin
+
+
+async def _call(port: int, method: str, path: str, body: bytes = b"", ctype: str = "application/json",
+                extra: bytes = b"", host: bytes = b"127.0.0.1"):
+    r, w = await asyncio.open_connection("127.0.0.1", port)
+    w.write(b"%s %s HTTP/1.1\r\nHost: %s:%d\r\nContent-Type: %s\r\nContent-Length: %d\r\n%s\r\n%s"
+            % (method.encode(), path.encode(), host, port, ctype.encode(), len(body), extra, body))
+    data = await asyncio.wait_for(r.read(), 5)
+    w.close()
+    head, _, payload = data.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+async def _events(port: int):
+    """Lê /events e devolve (writer, fila de eventos decodificados)"""
+    r, w = await asyncio.open_connection("127.0.0.1", port)
+    w.write(b"GET /events HTTP/1.1\r\nHost: localhost:%d\r\n\r\n" % port)
+    await r.readuntil(b"\r\n\r\n")
+    q: asyncio.Queue = asyncio.Queue()
+
+    async def read():
+        while True:
+            size = int((await r.readline()).strip(), 16)
+            if not size:
+                return
+            q.put_nowait(json.loads(await r.readexactly(size)))
+            await r.readline()
+    asyncio.create_task(read())
+    return w, q
+
+
+def test_control_api_drives_intercept_and_lists_flows():
+    async def main():
+        origin = await asyncio.start_server(_origin, "127.0.0.1", 0)
+        oport = origin.sockets[0].getsockname()[1]
+        proxy = ProxyServer(port=0, bus=EventBus(batch_interval=0.01))
+        server = await proxy.start()
+        control = ControlServer(proxy, port=0)
+        await control.start()
+        cport = control.port
+        try:
+            assert await _call(cport, "POST", "/intercept", b'{"on": true}') == (202, {"intercept": True})
+            ew, events = await _events(cport)
+            await asyncio.sleep(0.05)
+
+            r, w = await asyncio.open_connection("127.0.0.1", proxy.port)
+            w.write(b"GET http://127.0.0.1:%d/held HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n" % oport)
+            paused = []
+            # intercept pausa na requisição e de novo na resposta
+            while len(paused) < 2:
+                ev = await asyncio.wait_for(events.get(), 5)
+                if ev["type"] == FLOW_PAUSED:
+                    paused.append(ev["data"]["where"])
+                    fid = ev["data"]["id"]
+                    assert ev["flows"][0]["id"] == fid and ev["flows"][0]["method"] == "GET"
+                    assert (await _call(cport, "POST", f"/flows/{fid}/forward"))[0] == 202
+            assert paused == ["request", "response"]
+            assert b"path=/held" in await asyncio.wait_for(r.read(), 5)
+            w.close()
+            ew.close()
+
+            status, flows = await _call(cport, "GET", "/flows?q=status:200")
+            assert status == 200 and [f["id"] for f in flows] == [fid]
+            assert (await _call(cport, "GET", "/flows?q=status:500"))[1] == []
+            status, full = await _call(cport, "GET", f"/flows/{fid}")
+            assert full["entry"]["response"]["content"]["text"] == "path=/held;got="
+            proxy.search.wait_idle(5)
+            assert (await _call(cport, "GET", "/search?q=held"))[1][0]["id"] == fid
+
+            rules = b"rules:\n  - name: x\n    on: request\n    match: {method: GET}\n    action: {}\n"
+            assert await _call(cport, "POST", "/rules", rules, "application/yaml") == (202, {"rules": 1})
+            assert (await _call(cport, "POST", "/rules", b'{"rules": 3}'))[0] == 400
+            assert (await _call(cport, "GET", "/flows/999"))[0] == 404
+            assert (await _call(cport, "GET", "/flows?q=status:abc"))[0] == 400
+            assert (await _call(cport, "DELETE", "/flows"))[0] == 405
+            assert (await _call(cport, "POST", "/intercept", b'{"on": true, "default_action": "x"}'))[0] == 400
+            assert await _call(cport, "POST", "/intercept/drop", b'{"filter": "path:/x"}') == (
+                202, {"action": "drop", "filter": "path:/x"})
+            assert (await _call(cport, "POST", "/intercept/forward?filter=status:abc"))[0] == 400
+            status, stats = await _call(cport, "GET", "/stats")
+            assert stats["intercept"] is True and stats["flows"] == 1
+            status, metrics = await _call(cport, "GET", "/metrics?format=json")
+            assert metrics["counters"]["requests"] == 1 and "intercept" in metrics["phases"]
+        finally:
+            await control.close()
+            server.close()
+            await proxy.close()
+            origin.close()
+
+    asyncio.run(main())
+
+
+def test_control_api_rejects_cross_site_and_unauthenticated_calls():
+    async def main():
+        proxy = ProxyServer(port=0, bus=EventBus())
+        control = ControlServer(proxy, port=0, token="s3cret")
+        await control.start()
+        port = control.port
+        auth = b"Authorization: Bearer s3cret\r\n"
+        try:
+            assert (await _call(port, "GET", "/stats"))[0] == 401
+            assert (await _call(port, "GET", "/stats", extra=b"Authorization: Bearer nope\r\n"))[0] == 401
+            assert (await _call(port, "GET", "/stats", extra=auth))[0] == 200
+            # POST "simples" de outra página (text/plain, form) não passa nem com o token
+            for ctype in ("text/plain", "application/x-www-form-urlencoded"):
+                assert (await _call(port, "POST", "/rules", b'{"rules": []}', ctype, auth))[0] == 415
+            assert (await _call(port, "POST", "/intercept", b'{"on": true}', extra=auth))[0] == 202
+            assert (await _call(port, "POST", "/intercept", b'{"on": true}',
+                                extra=auth + b"Origin: http://evil.test\r\n"))[0] == 403
+            # DNS rebinding: o nome é de outro site mesmo resolvendo para 127.0.0.1
+            assert (await _call(port, "GET", "/stats", extra=auth, host=b"evil.test"))[0] == 403
+            assert (await _call(port, "GET", "/stats", extra=auth + b"Origin: http://localhost:%d\r\n" % port,
+                                host=b"[::1]"))[0] == 200
+        finally:
+            await control.close()
+            await proxy.close()
+
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import pytest
+from lokiproxy.core.bodystore import BodyStore
+from lokiproxy.core.filters import FlowFilter, FlowIndex
+from lokiproxy.core.flows import LRUFlows
+
+
+def _flows():
+    store = LRUFlows()
+    specs = [
+        ("GET", "api.example.com", "/users", 200, 0.05, b'{"token": "abc123"}'),
+        ("POST", "api.example.com", "/login", 500, 1.5, b"internal error"),
+        ("GET", "cdn.example.com", "/app.js", 304, 0.002, b""),
+        ("PUT", "other.test", "/items/1", 503, 3.0, b"retry later"),
+    ]
+    for method, host, path, status, secs, body in specs:
+        f = store.new_flow()
+        f.method, f.host, f.path, f.status_code = method, host, path, status
+        f.response.body = body
+        f.size = len(body)
+        f.finished_at = f.started_at + secs
+    inflight = store.new_flow()
+    inflight.method, inflight.host, inflight.path = "GET", "api.example.com", "/slow"
+    return store
+
+
+@pytest.mark.parametrize("query,expected", [
+    ("host:api.* status:>=500 method:POST", [2]),
+    ("status:5xx", [2, 4]),
+    ("host:example -method:GET", [2]),
+    ("duration:>1000", [2, 4]),
+    ("duration:<10", [3]),
+    ("status:200-304 size:<1k", [1, 3]),
+    ('body:abc123', [1]),
+    ('body~"retry|internal"', [2, 4]),
+    ("path~^/items/\\d+$", [4]),
+    ("slow", [5]),
+    ('url:"https://" ', []),
+    ("", [1, 2, 3, 4, 5]),
+])
+def test_index_query_matches_full_scan(query, expected):
+    store = _flows()
+    flt = FlowFilter(query)
+    for body_index in (False, True):
+        index = FlowIndex(body_index=body_index)
+        for f in store:
+            index.update(f)
+        assert sorted(index.query(flt)) == expected
+    assert [f.id for f in store if flt.matches(f)] == expected
+
+
+def test_index_tracks_updates_and_removals():
+    store = _flows()
+    index = FlowIndex(body_index=True)
+    for f in store:
+        index.update(f)
+    slow = store.get(5)
+    slow.status_code = 502
+    slow.finished_at = slow.started_at + 2
+    index.update(slow)
+    index.remove(1)
+    assert sorted(index.query(FlowFilter("status:5xx duration:>1000"))) == [2, 4, 5]
+    assert index.query(FlowFilter("body:abc123")) == set()
+
+
+def test_body_index_reads_only_the_prefix_of_offloaded_bodies(tmp_path):
+    store = _flows()
+    bodies = BodyStore(str(tmp_path))
+    flow = store.get(4)
+    flow.response.body = b"retry later " + b"x" * 100 + b" tail"
+    flow.response.offload(bodies)
+    reads = []
+    read = bodies.read
+    bodies.read = lambda ref, start=0, length=None: reads.append(length) or read(ref, start, length)
+    index = FlowIndex(body_index=True, body_index_limit=64)
+    for f in store:
+        index.update(f)
+    assert reads == [64]
+    assert index.query(FlowFilter("body:retry")) == {4}
+    assert index.query(FlowFilter("body:tail")) == set()
+    bodies.close()
+
+
+def test_invalid_queries():
+    for query in ("status:lots", "colour:red", "path~(", "body:a"):
+        with pytest.raises(ValueError):
+            FlowFilter(query)
@@ -0,0 +1,60 @@
+import io
+import json
+import pytest
+from lokiproxy.core.flows import LRUFlows
+from lokiproxy.core.har import READ_SIZE, export_har, import_har, iter_har_entries
+
+
+def _store():
+    store = LRUFlows()
+    for i in range(3):
+        f = store.new_flow()
+        f.method, f.host, f.port, f.path, f.status_code = "POST", "api.test", 8080, f"/x?i={i}", 201
+        f.request.headers = [("Host", "api.test:8080"), ("Content-Type", "application/json")]
+        f.request.body = b'{"i": %d}' % i
+        f.response.headers = [("Content-Type", "application/octet-stream")]
+        f.response.body = bytes([0xff, i])
+        f.finished_at = f.started_at + 0.25
+    return store
+
+
+def test_export_is_valid_har_and_roundtrips():
+    out = io.StringIO()
+    assert export_har(_store().all(), out) == 3
+    har = json.loads(out.getvalue())
+    entry = har["log"]["entries"][1]
+    assert har["log"]["version"] == "1.2"
+    assert entry["request"]["url"] == "http://api.test:8080/x?i=1"
+    assert entry["request"]["queryString"] == [{"name": "i", "value": "1"}]
+    assert entry["response"]["content"]["encoding"] == "base64"
+
+    store = LRUFlows()
+    assert import_har(io.StringIO(out.getvalue()), store) == 3
+    f = store.all()[2]
+    assert (f.method, f.host, f.port, f.path, f.status_code) == ("POST", "api.test", 8080, "/x?i=2", 201)
+    assert f.request.body == b'{"i": 2}' and f.response.body == bytes([0xff, 2])
+    assert f.duration_ms == 250
+
+
+def test_iterative_parser_handles_small_reads():
+    har = {"log": {"version": "1.2", "pages": [{"title": 'say "entries" here'}],
+                   "entries": [{"request": {"url": "http://a/%d" % i}} for i in range(20)]}}
+    text = json.dumps(har, indent=2)
+    urls = [e["request"]["url"] for e in iter_har_entries(io.StringIO(text), read_size=7)]
+    assert urls == ["http://a/%d" % i for i in range(20)]
+
+
+def test_parser_only_takes_entries_under_log():
+    entries = json.dumps([{"request": {"url": "http://a/%d" % i}} for i in range(3)])
+    decoys = ('{"meta": {"entries": [{"request": {"url": "http://decoy/"}}]}, "log": {'
+              '"creator": {"name": "entries", "entries": []}, "_custom": {"entries": [1]}, '
+              '"comment": "a \\"entries\\": [ inside", ')
+    # a chave também pode vir escapada
+    for key in ('"entries"', '"entr\\u0069es"'):
+        text = decoys + key + ": " + entries + "}}"
+        for read_size in (3, READ_SIZE):
+            urls = [e["request"]["url"] for e in iter_har_entries(io.StringIO(text), read_size=read_size)]
+            assert urls == ["http://a/%d" % i for i in range(3)]
+    for har in ({"log": {"creator": {"entries": []}}}, {"log": {"entries": {}}}):
+        with pytest.raises(ValueError):
+            list(iter_har_entries(io.StringIO(json.dumps(har))))
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from lokiproxy.core.http1 import MAX_HEADERS, BadRequest, parse_request_head, read_request_head
+from lokiproxy.tests.test_proxy import _exchange
+
+
+def test_parse_builds_index_and_framing():
+    head = parse_request_head(b"\r\nPOST http://a/x HTTP/1.1\r\nHost: a:81\r\nConnection: keep-alive\r\n"
+                              b"Proxy-Connection: close\r\ncontent-length:  3 \r\nX-Dup: 1\r\nX-Dup: 2\r\n\r\n")
+    assert (head.method, head.target, head.version) == ("POST", "http://a/x", "HTTP/1.1")
+    assert head.headers[3] == ("content-length", "3") and len(head.headers) == 6
+    assert head.get("host") == "a:81" and head.get("x-dup") == "1" and head.get("cookie") is None
+    assert head.framing() == (False, 3) and not head.keep_alive
+    assert head.raw.startswith(b"Host: a:81\r\n") and head.raw.endswith(b"X-Dup: 2\r\n")
+    head = parse_request_head(b"GET / HTTP/1.0\r\nConnection: Keep-Alive\r\nTransfer-Encoding: chunked\r\n"
+                              b"Content-Length: 9\r\n\r\n")
+    assert head.keep_alive and head.framing() == (True, None)
+    assert not parse_request_head(b"GET /\r\n\r\n").keep_alive
+
+
+@pytest.mark.parametrize("raw,status", [
+    (b"GET / HTTP/1.1\r\nHost: a\r\n folded\r\n\r\n", 400),
+    (b"GET / HTTP/1.1\r\nBad Header: a\r\n\r\n", 400),
+    (b"GET / HTTP/1.1\r\nContent-Length: 1\r\nContent-Length: 2\r\n\r\n", 400),
+    (b"GET/ HTTP/1.1 x\r\n\r\n", 400),
+    (b"GET / HTTP/2.0\r\n\r\n", 505),
+    (b"GET / HTTP/1.1\r\n" + b"X: 1\r\n" * (MAX_HEADERS + 1) + b"\r\n", 431),
+])
+def test_parse_rejects(raw, status):
+    with pytest.raises(BadRequest) as e:
+        parse_request_head(raw)
+    assert e.value.status == status
+
+
+@pytest.mark.parametrize("header", [
+    "Content-Length: \xb2",
+    "Content-Length: -1",
+    "Transfer-Encoding: gzip",
+    "Transfer-Encoding: chunked, gzip",
+    "Transfer-Encoding: xchunked",
+])
+def test_framing_rejects(header):
+    head = parse_request_head(b"POST / HTTP/1.1\r\n%s\r\n\r\n" % header.encode("iso-8859-1"))
+    with pytest.raises(BadRequest) as e:
+        head.framing()
+    assert e.value.status == 400
+
+
+def test_read_request_head_limits_and_eof():
+    async def main():
+        reader = asyncio.StreamReader(limit=64)
+        reader.feed_data(b"\r\n\r\nGET /a HTTP/1.1\r\n\r\nGET /" + b"x" * 100)
+        assert (await read_request_head(reader)).target == "/a"
+        with pytest.raises(BadRequest) as e:
+            await read_request_head(reader)
+        assert e.value.status == 431
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"GET / HTTP/1.1\r\nHost")
+        reader.feed_eof()
+        assert await read_request_head(reader) is None
+    asyncio.run(main())
+
+
+def test_proxy_rejects_oversized_and_malformed_heads():
+    data = asyncio.run(_exchange(b"GET http://ORIGIN/ HTTP/1.1\r\nX-Big: " + b"a" * 70000 + b"\r\n\r\n"))
+    assert data.startswith(b"HTTP/1.1 431 ")
+    data = asyncio.run(_exchange(b"GET http://ORIGIN/ HTTP/1.1\r\nHost: ORIGIN\r\nContent-Length: x\r\n\r\n"))
+    assert data.startswith(b"HTTP/1.1 400 ") and b"Connection: close" in data
+    # dígito não ASCII e Transfer-Encoding sem chunked no fim: 400, não conexão derrubada
+    for header in (b"Content-Length: \xb2", b"Transfer-Encoding: gzip"):
+        data = asyncio.run(_exchange(b"POST http://ORIGIN/ HTTP/1.1\r\nHost: ORIGIN\r\n%s\r\n\r\n" % header))
+        assert data.startswith(b"HTTP/1.1 400 ")
@@ -0,0 +1,147 @@
+import asyncio
+import pytest
+from lokiproxy.core.bus import (EventBus, FLOW_PAUSED, FORWARD_FLOW, DROP_FLOW, REPEAT_FLOW, INTERCEPT_BULK,
+                                SET_INTERCEPT)
+from lokiproxy.core.filters import FlowFilter
+from lokiproxy.core.flows import Flow
+from lokiproxy.core.intercept import InterceptScheduler
+from lokiproxy.core.proxy import ProxyServer
+from lokiproxy.tests.test_proxy import _origin
+
+
+def _flow(fid: int, path: str) -> Flow:
+    flow = Flow(id=fid)
+    flow.method, flow.host, flow.path = "GET", "example.com", path
+    return flow
+
+
+def test_scheduler_cap_bulk_and_timeout():
+    async def run():
+        sched = InterceptScheduler(filter="path:/api", max_paused=1)
+        sched.configure(on=True)
+        assert not sched.wants(_flow(9, "/static/app.js")) and sched.stats.passed == 1
+        published = []
+
+        async def publish(type, data):
+            published.append(data["id"])
+
+        tasks = [asyncio.create_task(sched.pause(_flow(i, f"/api/{i}"), "request", publish)) for i in (1, 2, 3)]
+        await asyncio.sleep(0.01)
+        # só um pausado por vez; os outros aguardam vaga sem aparecer como pausados
+        assert published == [1] and sched.stats.paused == 1 and sched.stats.queued == 2
+        assert not sched.decide(1, REPEAT_FLOW)
+        assert sched.decide(1, FORWARD_FLOW)
+        await asyncio.sleep(0.01)
+        assert published == [1, 2]
+        # em lote vale também para quem ainda aguarda vaga
+        assert sched.decide_matching(FlowFilter("path:/api/3"), DROP_FLOW) == [3]
+        assert await tasks[2] == (DROP_FLOW, False)
+        assert sched.decide_matching(FlowFilter(""), FORWARD_FLOW) == [2]
+        assert [await t for t in tasks[:2]] == [(FORWARD_FLOW, False)] * 2
+        assert sched.stats.paused == sched.stats.queued == 0
+
+        sched.configure(timeout=0.05, default_action="drop")
+        assert await sched.pause(_flow(4, "/api/4"), "request", publish) == (DROP_FLOW, True)
+        assert sched.stats.timed_out == 1 and sched.stats.dropped == 2
+        # desligar o intercept libera os pausados
+        sched.configure(timeout=None)
+        task = asyncio.create_task(sched.pause(_flow(5, "/api/5"), "response", publish))
+        await asyncio.sleep(0.01)
+        sched.configure(on=False)
+        assert await task == (FORWARD_FLOW, False)
+        with pytest.raises(ValueError):
+            sched.configure(max_paused=0)
+
+    asyncio.run(run())
+
+
+def test_scheduler_reads_body_after_slot_and_throttles_admission():
+    async def run():
+        sched = InterceptScheduler(max_paused=1, max_queued=2)
+        sched.configure(on=True)
+        prepared = []
+
+        async def publish(type, data):
+            pass
+
+        def prepare(fid):
+            async def read():
+                prepared.append(fid)
+            return read
+
+        tasks = [asyncio.create_task(sched.pause(_flow(i, "/"), "request", publish, prepare(i)))
+                 for i in (1, 2, 3)]
+        await asyncio.sleep(0.01)
+        # só quem tem vaga teve o corpo lido; a fila cheia segura requisições novas
+        assert prepared == [1] and sched.stats.queued == 2
+        admit = asyncio.create_task(sched.admit())
+        await asyncio.sleep(0.01)
+        assert not admit.done() and sched.stats.throttled == 1
+        assert sched.decide(1, FORWARD_FLOW)
+        await asyncio.sleep(0.01)
+        assert prepared == [1, 2] and admit.done()
+        # decidido ainda na fila: segue sem prepare (o chamador lê o corpo)
+        assert sched.decide(3, DROP_FLOW) and await tasks[2] == (DROP_FLOW, False)
+        assert prepared == [1, 2]
+        sched.configure(on=False)
+        await asyncio.gather(*tasks[:2])
+        with pytest.raises(ValueError):
+            sched.configure(max_queued=0)
+
+    asyncio.run(run())
+
+
+def test_proxy_intercepts_only_matching_flows():
+    async def run():
+        origin = await asyncio.start_server(_origin, "127.0.0.1", 0)
+        oport = origin.sockets[0].getsockname()[1]
+        bus = EventBus(batch_interval=0.01)
+        proxy = ProxyServer(port=0, bus=bus, intercept_filter="path:/held")
+        server = await proxy.start()
+        paused = []
+
+        async def watch():
+            async for ev in bus.subscribe_gui():
+                if ev.type == FLOW_PAUSED:
+                    paused.append((ev.data["id"], ev.data["where"]))
+
+        watcher = asyncio.create_task(watch())
+
+        async def get(path: bytes) -> bytes:
+            r, w = await asyncio.open_connection("127.0.0.1", proxy.port)
+            w.write(b"GET http://127.0.0.1:%d%s HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"
+                    % (oport, path))
+            try:
+                return await r.read()
+            finally:
+                w.close()
+
+        try:
+            await bus.send_gui_cmd(SET_INTERCEPT, {"on": True, "timeout": 0.5, "default_action": "drop"})
+            await asyncio.sleep(0.02)
+            held = [asyncio.create_task(get(b"/held/%d" % i)) for i in range(3)]
+            # o que não casa com o filtro segue sem esperar
+            assert b"path=/free" in await asyncio.wait_for(get(b"/free"), 2)
+            while len(paused) < 3:
+                await asyncio.sleep(0.01)
+            ids = {proxy.flows.get(fid).path.rsplit("/", 1)[-1]: fid for fid, _ in paused}
+            await bus.send_gui_cmd(INTERCEPT_BULK, {"action": "forward", "filter": "path:/held/0"})
+            await bus.send_gui_cmd(DROP_FLOW, {"flow_id": ids["2"]})
+            # /held/0 pausa de novo na resposta; /held/1 fica sem decisão até o timeout
+            while len(paused) < 4:
+                await asyncio.sleep(0.01)
+            assert paused[3] == (ids["0"], "response")
+            await bus.send_gui_cmd(INTERCEPT_BULK, {"action": "forward", "filter": "path:/held/0"})
+            results = await asyncio.wait_for(asyncio.gather(*held), 5)
+            assert b"path=/held/0" in results[0] and results[1] == results[2] == b""
+            assert proxy.flows.get(ids["1"]).error == "Dropped by intercept timeout at request"
+            assert proxy.flows.get(ids["2"]).error == "Dropped by user at request"
+            stats = proxy.stats()["intercept_queue"]
+            assert stats["passed"] == 1 and stats["timed_out"] == 1 and stats["intercepted"] == 4
+        finally:
+            watcher.cancel()
+            server.close()
+            await proxy.close()
+            origin.close()
+
+    asyncio.run(run())
@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from lokiproxy.core.bus import EventBus, FLOW_BATCH, SET_INTERCEPT
+from lokiproxy.core.ipc import CoreClient, CoreServer, RemoteBus
+from lokiproxy.core.proxy import ProxyServer
+from lokiproxy.tests.test_proxy import _origin
+
+
+async def _get(proxy_port: int, origin_port: int, path: str) -> bytes:
+    r, w = await asyncio.open_connection("127.0.0.1", proxy_port)
+    w.write(b"GET http://127.0.0.1:%d%s HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n" % (origin_port, path.encode()))
+    data = await asyncio.wait_for(r.read(), 5)
+    w.close()
+    return data
+
+
+async def _next_finished(bus: RemoteBus, fid: int):
+    async for ev in bus.subscribe_gui():
+        if ev.type == FLOW_BATCH and fid in ev.data["finished"]:
+            return ev
+
+
+def test_gui_side_sees_summaries_and_fetches_bodies(tmp_path):
+    async def main():
+        origin = await asyncio.start_server(_origin, "127.0.0.1", 0)
+        oport = origin.sockets[0].getsockname()[1]
+        proxy = ProxyServer(port=0, bus=EventBus(batch_interval=0.01), max_flows=2)
+        server = await proxy.start()
+        core = CoreServer(proxy, str(tmp_path / "core.sock"))
+        await core.start()
+        client = CoreClient(core.address)
+        try:
+            assert b"path=/first" in await _get(proxy.port, oport, "/first")
+            await client.connect(timeout=2)
+            bus = RemoteBus(client)
+            # flows anteriores à conexão chegam no snapshot
+            assert [(f.id, f.path.endswith("/first"), f.status_code) for f in client.flows] == [(1, True, 200)]
+            evicted = []
+            client.flows.on_evict(lambda f: evicted.append(f.id))
+
+            for n, path in ((2, "/second"), (3, "/third")):
+                await _get(proxy.port, oport, path)
+                await asyncio.wait_for(_next_finished(bus, n), 5)
+            assert [f.id for f in client.flows.all()] == [2, 3]
+            assert evicted == [1]
+            summary = client.flows.get(3)
+            assert summary.path.endswith("/third") and summary.response.body == b""
+
+            full = await client.flows.fetch(3)
+            assert full.response.body == b"path=/third;got="
+            assert ("Host", "x") in full.request.headers
+            assert await client.flows.fetch(1) is None
+
+            proxy.search.wait_idle(5)
+            assert [fid for fid, _ in await client.search.search("third")] == [3]
+
+            await bus.send_gui_cmd(SET_INTERCEPT, {"on": True})
+            for _ in range(100):
+                if proxy.intercept:
+                    break
+                await asyncio.sleep(0.01)
+            assert proxy.intercept
+        finally:
+            await client.close()
+            await core.close()
+            server.close()
+            await proxy.close()
+            origin.close()
+        assert not (tmp_path / "core.sock").exists()
+
+    asyncio.run(main())
+
+
+def test_tcp_transport_requires_token_and_keeps_har_files_client_side(tmp_path):
+    async def main():
+        origin = await asyncio.start_server(_origin, "127.0.0.1", 0)
+        oport = origin.sockets[0].getsockname()[1]
+        proxy = ProxyServer(port=0, bus=EventBus(batch_interval=0.01))
+        server = await proxy.start()
+        core = CoreServer(proxy, "tcp://127.0.0.1:0", token="s3cret")
+        await core.start()
+        intruder = CoreClient(core.address, token="wrong")
+        client = CoreClient(core.address, token="s3cret")
+        try:
+            # sem o token o core fecha a conexão antes de responder qualquer chamada
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(intruder.connect(timeout=2), 5)
+            await client.connect(timeout=2)
+            # nenhuma chamada recebe caminhos do sistema de arquivos
+            with pytest.raises(RuntimeError, match="unknown IPC method"):
+                await client.call("export_har", path=str(tmp_path / "x.har"))
+
+            await _get(proxy.port, oport, "/har")
+            for _ in range(500):
+                if client.flows.all():
+                    break
+                await asyncio.sleep(0.01)
+            har = tmp_path / "out.har"
+            assert await client.export_har(str(har)) == 1
+            assert "/har" in har.read_text()
+            assert await client.import_har(str(har)) == 1
+            assert len(proxy.flows.all()) == 2
+        finally:
+            await intruder.close()
+            await client.close()
+            await core.close()
+            server.close()
+            await proxy.close()
+            origin.close()
+
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+import asyncio
+from lokiproxy.core.capture import encode_flow, decode_flow
+from lokiproxy.core.har import flow_to_entry
+from lokiproxy.core.metrics import PHASES, merge_metrics, phase_spans, prometheus_text
+from lokiproxy.tests.test_proxy import _exchange
+
+RULES = {"rules": [{"name": "tag", "on": "response", "match": {}, "action": {"set_headers": {"X-Tag": "1"}}}]}
+
+
+def test_flow_phases_and_metrics():
+    proxies = []
+    raw = (b"POST http://ORIGIN/a HTTP/1.1\r\nHost: ORIGIN\r\nContent-Length: 3\r\n\r\nabc"
+           b"GET http://ORIGIN/b HTTP/1.1\r\nHost: ORIGIN\r\nConnection: close\r\n\r\n")
+    data = asyncio.run(_exchange(raw, proxies, RULES, stream_bodies=False))
+    assert data.count(b"X-Tag: 1") == 2
+    proxy = proxies[0]
+    first, second = proxy.flows.all()
+
+    # conexão nova na primeira requisição, reaproveitada na segunda
+    assert [p for p, _, _ in phase_spans(first.timings)] == [
+        "request_head", "request_body", "rules", "dns_connect", "request_send", "ttfb",
+        "response_body", "client_write"]
+    assert "dns_connect" not in second.timings and "request_body" not in second.timings
+    ends = [first.timings[p] for p in PHASES if p in first.timings]
+    assert ends == sorted(ends)
+
+    m = proxy.metrics.as_dict()
+    assert m["counters"]["requests"] == 2 and m["counters"]["connections"] == 1
+    assert m["counters"]["bytes_in"] == 3 and m["rule_hits"] == {"tag": 2}
+    assert m["active_connections"] == 0 and m["total"]["count"] == 2
+    assert m["phases"]["dns_connect"]["count"] == 1 and m["phases"]["ttfb"]["count"] == 2
+
+    # os tempos atravessam a captura/IPC e viram timings do HAR
+    assert decode_flow(encode_flow(first)).timings == first.timings
+    har = flow_to_entry(first)["timings"]
+    assert har["connect"] >= 0 and har["dns"] == -1 and har["ssl"] == -1
+    assert abs(sum(v for v in har.values() if v > 0) - first.timings["client_write"]) < 0.01
+
+
+def test_merge_and_prometheus_text():
+    snap = {"active_connections": 1, "counters": {"requests": 2, "errors": 1}, "rule_hits": {'a"b': 1},
+            "buckets_ms": [1, 10], "total": {"counts": [1, 1, 0], "sum": 12.0, "count": 2},
+            "phases": {"ttfb": {"counts": [0, 2, 0], "sum": 8.0, "count": 2}}}
+    merged = merge_metrics([snap, None, snap])
+    assert merged["counters"]["requests"] == 4 and merged["phases"]["ttfb"]["count"] == 4
+    text = prometheus_text(dict(snap, buckets_ms=[1, 10]))
+    assert "lokiproxy_requests_total 2" in text
+    assert 'lokiproxy_rule_hits_by_rule_total{rule="a\\"b"} 1' in text
+    assert 'lokiproxy_phase_duration_seconds_bucket{phase="ttfb",le="0.01"} 2' in text
+    assert 'lokiproxy_flow_duration_seconds_bucket{le="+Inf"} 2' in text
+    assert "lokiproxy_flow_duration_seconds_sum 0.012" in text
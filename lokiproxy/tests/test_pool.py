@@ -0,0 +1,41 @@
+import asyncio
+from lokiproxy.core.pool import UpstreamPool, strip_hop_by_hop
+
+
+async def _origin(reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+        await writer.drain()
+    writer.close()
+
+
+def test_pool_reuses_connection():
+    async def run():
+        server = await asyncio.start_server(_origin, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = UpstreamPool(max_per_host=2, idle_timeout=30.0)
+        try:
+            for _ in range(3):
+                status, headers, body = await pool.request(
+                    "GET", f"http://127.0.0.1:{port}/", [("Host", f"127.0.0.1:{port}")], b"")
+                assert status == 200 and body == b"ok"
+                assert not any(k.lower() == "connection" for k, _ in headers)
+            assert pool.stats.new_connections == 1
+            assert pool.stats.hits == 2
+            pool.idle_timeout = 0.0
+            assert await pool.evict_idle() == 1
+            assert pool.stats.origins == 0
+        finally:
+            await pool.aclose()
+            server.close()
+    asyncio.run(run())
+
+
+def test_strip_hop_by_hop():
+    hdrs = [("Connection", "close, X-Foo"), ("X-Foo", "1"), ("Accept", "*/*"), ("Proxy-Connection", "keep-alive")]
+    assert strip_hop_by_hop(hdrs) == [("Accept", "*/*")]
@@ -0,0 +1,47 @@
+import json
+from lokiproxy.core.bodystore import BodyStore
+from lokiproxy.core.flows import Message
+from lokiproxy.core.preview import BodySource, hex_dump, hex_line, render_body
+
+
+def test_hex_lines_match_full_dump():
+    data = bytes(range(256)) * 3 + b"tail"
+    lines = hex_dump(data).split("\n")
+    assert lines[1].startswith("00000010  10 11 12")
+    assert lines[-1] == "00000300  74 61 69 6c" + " " * (48 - 11) + "  tail"
+    src = BodySource(Message(body=data))
+    assert src.rows() == len(lines)
+    assert [src.hex_line(i) for i in range(src.rows())] == lines
+    assert hex_line(b"A\x00~\x7f", 0x20).endswith("  A.~.")
+
+
+def test_offloaded_source_reads_pages(tmp_path):
+    store = BodyStore(str(tmp_path))
+    data = bytes(i % 251 for i in range(300_000))
+    msg = Message(body=data)
+    msg.offload(store)
+    src = BodySource(msg, page_size=4096, cache_pages=2)
+    assert len(src) == len(data) == msg.body_length
+    for start, n in ((0, 16), (4090, 20), (299_990, 64), (123_456, 9000)):
+        assert bytes(src.read(start, n)) == data[start:start + n]
+    assert len(src._pages) == 2
+    assert msg.read_body(10, 5) == data[10:15]
+    store.close()
+
+
+def test_render_body_pretty_prints_json_and_previews_large_bodies():
+    doc = {"user": "alice", "ids": [1, 2]}
+    msg = Message(headers=[("Content-Type", "application/json; charset=utf-8")],
+                  body=json.dumps(doc, separators=(",", ":")).encode())
+    text, truncated = render_body(msg)
+    assert text == json.dumps(doc, indent=2) and not truncated
+
+    latin = Message(headers=[("Content-Type", "text/plain; charset=iso-8859-1")], body="ação".encode("latin-1"))
+    assert render_body(latin)[0] == "ação"
+
+    big = Message(headers=[("Content-Type", "application/json")], body=b"[" + b"1," * 1000 + b"1]",
+                  body_size=5000)
+    text, truncated = render_body(big, limit=100)
+    assert truncated and text.startswith("[1,1,")
+    assert "[prévia: primeiros 100 de 2003 bytes]" in text
+    assert "2997 bytes não capturados" in text
@@ -0,0 +1,239 @@
+import os
+import ssl
+import asyncio
+import pytest
+from cryptography.hazmat.primitives.serialization import Encoding
+from lokiproxy.core.ca import ensure_ca
+from lokiproxy.core.certs import CertCache
+from lokiproxy.core.proxy import ProxyServer
+from lokiproxy.core.bus import EventBus
+from lokiproxy.core.rules import Ruleset
+from lokiproxy.core.streaming import iter_chunked, iter_fixed
+
+
+async def _origin(reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        cl, chunked = 0, False
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b""):
+                break
+            if h.lower().startswith(b"content-length:"):
+                cl = int(h.split(b":", 1)[1])
+            if h.lower().startswith(b"transfer-encoding:"):
+                chunked = True
+        chunks = iter_chunked(reader) if chunked else iter_fixed(reader, cl)
+        received = b"".join([c async for c in chunks])
+        path = line.split()[1]
+        if path.endswith(b"/chunked"):
+            writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+            for _ in range(4):
+                writer.write(b"1000\r\n" + b"x" * 4096 + b"\r\n")
+            writer.write(b"0\r\n\r\n")
+        else:
+            body = b"path=%s;got=%s" % (path, received)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+    writer.close()
+
+
+async def _exchange(raw: bytes, proxy_out: list = None, ruleset: dict = None, **opts) -> bytes:
+    origin = await asyncio.start_server(_origin, "127.0.0.1", 0)
+    oport = origin.sockets[0].getsockname()[1]
+    proxy = ProxyServer(port=0, bus=EventBus(), **opts)
+    if ruleset is not None:
+        proxy.ruleset = Ruleset(**ruleset).compile()
+    server = await proxy.start()
+    if proxy_out is not None:
+        proxy_out.append(proxy)
+    try:
+        r, w = await asyncio.open_connection("127.0.0.1", proxy.port)
+        w.write(raw.replace(b"ORIGIN", b"127.0.0.1:%d" % oport))
+        await w.drain()
+        data = await asyncio.wait_for(r.read(), 5)
+        w.close()
+        return data
+    finally:
+        server.close()
+        await proxy.close()
+        origin.close()
+
+
+def test_keep_alive_pipelined():
+    raw = (b"GET http://ORIGIN/a HTTP/1.1\r\nHost: ORIGIN\r\n\r\n"
+           b"POST http://ORIGIN/b HTTP/1.1\r\nHost: ORIGIN\r\nContent-Length: 3\r\n\r\nabc"
+           b"GET http://ORIGIN/c HTTP/1.1\r\nHost: ORIGIN\r\nConnection: close\r\n\r\n")
+    proxies = []
+    data = asyncio.run(_exchange(raw, proxies))
+    assert data.count(b"HTTP/1.1 200 OK") == 3
+    # o flow guarda o bloco bruto e só o converte em tuplas quando os headers são lidos
+    flow = proxies[0].flows.all()[1]
+    assert flow.request._raw_headers.endswith(b"Content-Length: 3\r\n")
+    assert flow.request.headers[1] == ("Content-Length", "3") and flow.request._raw_headers is None
+    assert data.index(b"path=/a") < data.index(b"path=/b") < data.index(b"path=/c")
+    assert b"path=/b;got=abc" in data
+    assert data.endswith(b"path=/c;got=")
+
+
+def test_http10_closes_by_default():
+    raw = (b"GET http://ORIGIN/a HTTP/1.0\r\nHost: ORIGIN\r\n\r\n"
+           b"GET http://ORIGIN/b HTTP/1.0\r\nHost: ORIGIN\r\n\r\n")
+    data = asyncio.run(_exchange(raw))
+    assert data.count(b"HTTP/1.1 200 OK") == 1
+    assert b"Connection: close" in data
+
+
+def test_max_requests_per_conn():
+    raw = b"GET http://ORIGIN/a HTTP/1.1\r\nHost: ORIGIN\r\n\r\n" * 3
+    data = asyncio.run(_exchange(raw, max_requests_per_conn=2))
+    assert data.count(b"HTTP/1.1 200 OK") == 2
+
+
+def test_chunked_request_and_response_streaming():
+    raw = (b"POST http://ORIGIN/up HTTP/1.1\r\nHost: ORIGIN\r\nTransfer-Encoding: chunked\r\n\r\n"
+           b"3\r\nabc\r\n2;ext=1\r\nde\r\n0\r\n\r\n"
+           b"GET http://ORIGIN/chunked HTTP/1.1\r\nHost: ORIGIN\r\nConnection: close\r\n\r\n")
+    out = []
+    data = asyncio.run(_exchange(raw, out, capture_limit=100))
+    assert b"path=/up;got=abcde" in data
+    assert data.count(b"Transfer-Encoding: chunked") == 1
+    assert data.endswith(b"0\r\n\r\n")
+    flows = out[0].flows.all()
+    assert flows[0].request.body == b"abcde"
+    assert flows[1].response.body_size == 4 * 4096
+    assert flows[1].response.body == b"x" * 100
+
+
+def test_capture_spills_remainder(tmp_path):
+    raw = b"GET http://ORIGIN/chunked HTTP/1.1\r\nHost: ORIGIN\r\nConnection: close\r\n\r\n"
+    out = []
+    asyncio.run(_exchange(raw, out, capture_limit=10, spill_dir=str(tmp_path)))
+    resp = out[0].flows.all()[0].response
+    with open(resp.spill_path, "rb") as f:
+        assert len(resp.body) + len(f.read()) == resp.body_size
+
+
+def test_buffered_rule_recomputes_content_length():
+    rules = {"rules": [{"name": "swap", "on": "response", "buffer_body": True,
+                        "match": {"url_regex": "/a$"},
+                        "action": {"set_response_body": "replaced"}}]}
+    raw = b"GET http://ORIGIN/a HTTP/1.1\r\nHost: ORIGIN\r\nConnection: close\r\n\r\n"
+    data = asyncio.run(_exchange(raw, ruleset=rules))
+    assert b"Content-Length: 8\r\n" in data and data.endswith(b"replaced")
+
+
+def test_mitm_connect_goes_through_rules_and_flows(tmp_path):
+    ca_cert, ca_key = ensure_ca()
+    origin_certs = CertCache(ca_cert, ca_key, persist=False)
+
+    async def run():
+        origin = await asyncio.start_server(_origin, "127.0.0.1", 0,
+                                            ssl=origin_certs.context(origin_certs.get("localhost")))
+        oport = origin.sockets[0].getsockname()[1]
+        proxy = ProxyServer(port=0, bus=EventBus(), mitm=True, cert_dir=str(tmp_path),
+                            leaf_key_type="ecdsa", upstream_verify=False)
+        proxy.ruleset = Ruleset(rules=[{"name": "tag", "on": "response", "match": {"url_regex": "/secret"},
+                                        "action": {"set_headers": {"X-Mitm": "1"}}}]).compile()
+        server = await proxy.start()
+        try:
+            r, w = await asyncio.open_connection("127.0.0.1", proxy.port)
+            w.write(b"CONNECT localhost:%d HTTP/1.1\r\nHost: localhost:%d\r\n\r\n" % (oport, oport))
+            assert (await r.readuntil(b"\r\n\r\n")).startswith(b"HTTP/1.1 200")
+            client_ctx = ssl.create_default_context(cadata=ca_cert.public_bytes(Encoding.PEM).decode())
+            # a CA local pode ter sido gerada antes de ganhar Subject Key Identifier
+            client_ctx.verify_flags &= ~ssl.VERIFY_X509_STRICT
+            client_ctx.set_alpn_protocols(["h2", "http/1.1"])
+            await w.start_tls(client_ctx, server_hostname="localhost")
+            assert w.get_extra_info("ssl_object").selected_alpn_protocol() == "http/1.1"
+            w.write(b"POST /secret HTTP/1.1\r\nHost: localhost:%d\r\nContent-Length: 2\r\n\r\nhi"
+                    b"GET /b HTTP/1.1\r\nHost: localhost:%d\r\nConnection: close\r\n\r\n" % (oport, oport))
+            data = await asyncio.wait_for(r.read(), 5)
+            w.close()
+        finally:
+            server.close()
+            await proxy.close()
+            origin.close()
+            origin_certs.close()
+        return data, proxy.flows.all()
+
+    data, flows = asyncio.run(run())
+    assert b"X-Mitm: 1" in data and b"path=/secret;got=hi" in data and data.endswith(b"path=/b;got=")
+    inner = [f for f in flows if f.method != "CONNECT"]
+    assert [(f.scheme, f.path, f.status_code) for f in inner] == [("https", "/secret", 200), ("https", "/b", 200)]
+    assert inner[0].request.body == b"hi"
+
+
+@pytest.mark.parametrize("upfront", [100, 1 << 20])
+def test_connect_tunnel_half_close_and_byte_counts(upfront):
+    async def echo(reader, writer):
+        # responde só depois do EOF do cliente: exercita o meio-fechamento pelo túnel
+        data = await reader.read()
+        writer.write(data[::-1])
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        origin = await asyncio.start_server(echo, "127.0.0.1", 0)
+        oport = origin.sockets[0].getsockname()[1]
+        proxy = ProxyServer(port=0, bus=EventBus())
+        server = await proxy.start()
+        try:
+            r, w = await asyncio.open_connection("127.0.0.1", proxy.port)
+            payload = bytes(range(256)) * 4096
+            # com 1 MB junto do CONNECT o buffer do reader enche e a leitura do cliente é pausada
+            w.write(b"CONNECT 127.0.0.1:%d HTTP/1.1\r\n\r\n" % oport + payload[:upfront])
+            assert (await r.readuntil(b"\r\n\r\n")).startswith(b"HTTP/1.1 200")
+            w.write(payload[upfront:])
+            w.write_eof()
+            data = await asyncio.wait_for(r.read(), 5)
+            w.close()
+            for _ in range(50):
+                if proxy.flows.all()[0].finished_at:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            server.close()
+            await proxy.close()
+            origin.close()
+        return data, payload, proxy.flows.all()[0]
+
+    data, payload, flow = asyncio.run(run())
+    assert data == payload[::-1]
+    assert (flow.request.body_size, flow.response.body_size) == (len(payload), len(payload))
+    assert flow.size == 2 * len(payload) and flow.status_code == 200
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_flow_evicted_in_flight_stays_out_of_the_store(tmp_path):
+    async def run():
+        proxy = ProxyServer(port=0, bus=EventBus(), max_flows=1, body_store_threshold=4,
+                            body_store_dir=str(tmp_path / "bodies"), spill_dir=str(tmp_path),
+                            capture_limit=16)
+        proxy.search.start()
+        try:
+            long_running = proxy.flows.new_flow()
+            long_running.host, long_running.path = "tunnel.example", "/"
+            proxy.flows.new_flow()  # expulsa o flow ainda em andamento
+            # o corpo termina de chegar (com spill) depois da expulsão
+            capture = proxy._capture(long_running, "response")
+            async for _ in capture.tee(_chunks(b"evicted words", b"x" * 64)):
+                pass
+            proxy._record_body(long_running.response, capture)
+            spill = long_running.response.spill_path
+            assert os.path.exists(spill)
+            await proxy._finish(long_running)
+            assert proxy.search.wait_idle(5)
+            assert proxy.search.search("evicted") == [] and proxy.search.stats.indexed == 0
+            assert not long_running.response.offloaded and not os.path.exists(spill)
+            assert not any(p.name.startswith("seg-") for p in (tmp_path / "bodies").iterdir())
+        finally:
+            await proxy.close()
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import socket
+import asyncio
+import pytest
+from lokiproxy.core.resolver import Resolver, interleave, staggered_connect
+from lokiproxy.core.bus import EventBus
+from lokiproxy.core.proxy import ProxyServer
+from lokiproxy.tests.test_proxy import _origin
+
+V4, V6 = socket.AF_INET, socket.AF_INET6
+
+
+def test_cache_negative_and_coalescing(monkeypatch):
+    calls = []
+
+    async def getaddrinfo(self, host, port, **kw):
+        calls.append(host)
+        await asyncio.sleep(0.01)
+        if host == "missing.test":
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(V6, socket.SOCK_STREAM, 6, "", ("::1", 0, 0, 0)),
+                (V6, socket.SOCK_STREAM, 6, "", ("::2", 0, 0, 0)),
+                (V4, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 0))]
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+
+    async def run():
+        r = Resolver(ttl=60, negative_ttl=60, hosts={"Local.Test": ["10.0.0.1"]})
+        many = await asyncio.gather(*[r.resolve("example.test") for _ in range(5)])
+        assert calls == ["example.test"] and r.stats.coalesced == 4
+        # famílias intercaladas, começando pela primeira devolvida
+        assert [a[1][0] for a in many[0]] == ["::1", "127.0.0.1", "::2"]
+        assert await r.resolve("EXAMPLE.test.") == many[0] and r.stats.hits == 1
+        for _ in range(2):
+            with pytest.raises(socket.gaierror):
+                await r.resolve("missing.test")
+        assert calls.count("missing.test") == 1 and r.stats.negative_hits == 1
+        # hosts estáticos e IPs literais não passam pelo DNS
+        assert await r.resolve("local.test") == [(V4, ("10.0.0.1", 0))]
+        assert (await r.resolve("::1"))[0][0] == V6
+        assert len(calls) == 2
+        r.ttl = 0
+        r.clear()
+        await r.resolve("example.test")
+        await r.resolve("example.test")
+        assert calls.count("example.test") == 3
+
+    asyncio.run(run())
+
+
+def test_staggered_connect():
+    closed = []
+
+    async def attempt(addr):
+        ip = addr[1][0]
+        if ip == "hang":
+            await asyncio.sleep(10)
+        if ip == "refused":
+            raise ConnectionRefusedError("refused")
+        if ip == "late":
+            await asyncio.sleep(0.05)
+        return ip
+
+    async def discard(conn):
+        closed.append(conn)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        # a tentativa travada é cancelada; a falha libera a próxima sem esperar o atraso
+        addrs = [(V6, ("hang",)), (V4, ("refused",)), (V6, ("ok",))]
+        assert await staggered_connect(addrs, attempt, discard, delay=0.05) == "ok"
+        assert loop.time() - t0 < 1
+        assert await staggered_connect([(V4, ("late",)), (V4, ("ok",))], attempt, discard,
+                                       delay=0.01) == "ok"
+        with pytest.raises(ConnectionRefusedError):
+            await staggered_connect([(V4, ("refused",))], attempt, discard)
+
+    asyncio.run(run())
+    assert interleave([(V6, 1), (V6, 2), (V4, 3), (V4, 4)]) == [(V6, 1), (V4, 3), (V6, 2), (V4, 4)]
+
+
+def test_proxy_and_tunnel_use_static_hosts():
+    async def run():
+        origin = await asyncio.start_server(_origin, "127.0.0.1", 0)
+        oport = origin.sockets[0].getsockname()[1]
+        proxy = ProxyServer(port=0, bus=EventBus(), dns_hosts={"origin.test": ["127.0.0.1"]})
+        server = await proxy.start()
+        try:
+            r, w = await asyncio.open_connection("127.0.0.1", proxy.port)
+            w.write(b"GET http://origin.test:%d/a HTTP/1.1\r\nHost: origin.test\r\n"
+                    b"Connection: close\r\n\r\n" % oport)
+            http = await asyncio.wait_for(r.read(), 5)
+            w.close()
+            r, w = await asyncio.open_connection("127.0.0.1", proxy.port)
+            w.write(b"CONNECT origin.test:%d HTTP/1.1\r\n\r\n"
+                    b"GET /t HTTP/1.1\r\nHost: origin.test\r\n\r\n" % oport)
+            tunneled = await asyncio.wait_for(r.readuntil(b"path=/t;got="), 5)
+            w.close()
+            return http, tunneled, proxy.stats()["dns"]
+        finally:
+            server.close()
+            await proxy.close()
+            origin.close()
+
+    http, tunneled, dns = asyncio.run(run())
+    assert http.startswith(b"HTTP/1.1 200 OK") and http.endswith(b"path=/a;got=")
+    assert tunneled.startswith(b"HTTP/1.1 200 Connection Established")
+    assert dns["lookups"] == 0
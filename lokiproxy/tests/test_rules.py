@@ -10,3 +10,54 @@ def test_mock_response():
     }])
     url, hdrs, body, mocked = apply_rules("request", "http://example.com", "GET", None, [], b"", rs)
     assert mocked and mocked["status"] == 200
+
+
+def _names(matches):
+    return [m.rule.name for m in matches]
+
+
+RULES = Ruleset(rules=[
+    {"name": "any-api", "on": "request", "match": {"url_regex": "/api/"}, "action": {}},
+    {"name": "host-get", "on": "request", "match": {"url_regex": "^https?://example\\.com/", "method": "GET"},
+     "action": {"set_headers": {"X-A": "1"}}},
+    {"name": "post-only", "on": "request", "match": {"method": "post"}, "action": {}},
+    {"name": "other-host", "on": "request", "match": {"url_regex": "^http://other\\.org:"}, "action": {}},
+    {"name": "disabled", "on": "request", "match": {}, "action": {}, "enabled": False},
+    {"name": "resp-500", "on": "response", "match": {"status": 500}, "action": {}},
+])
+
+
+def test_compiled_partitions_keep_rule_order():
+    for merge in (False, True):
+        c = RULES.compile(merge_regexes=merge)
+        assert _names(c.matching("request", "http://example.com/api/x", "GET", None)) == ["any-api", "host-get"]
+        assert _names(c.matching("request", "http://example.com/api/x", "POST", None)) == ["any-api", "post-only"]
+        assert _names(c.matching("request", "http://example.com.evil/api/", "GET", None)) == ["any-api"]
+        assert _names(c.matching("request", "http://other.org:81/", "PUT", None)) == ["other-host"]
+        assert _names(c.matching("response", "http://x/", "GET", 500)) == ["resp-500"]
+        assert c.matching("response", "http://x/", "GET", 200) == []
+
+
+def test_headers_untouched_without_header_actions():
+    hdrs = [("set-cookie", "a=1"), ("Set-Cookie", "b=2")]
+    _, out, _, _ = apply_rules("request", "http://x/api/", "GET", None, hdrs, b"", RULES.compile())
+    assert out == hdrs
+    _, out, _, _ = apply_rules("request", "http://example.com/", "GET", None, hdrs + [("x-a", "0")], b"", RULES)
+    assert out == hdrs + [("X-A", "1")]
+
+
+def test_not_host_anchored_patterns_stay_generic():
+    patterns = ["^https?://a\\.com/|/admin", "^https?://example\\.com/?", "^http://x\\.org/*y",
+                "^https?://(a\\.com/|b\\.com/)"]
+    rs = Ruleset(rules=[{"name": p, "on": "request", "match": {"url_regex": p}, "action": {}}
+                        for p in patterns])
+    for merge in (False, True):
+        c = rs.compile(merge_regexes=merge)
+        assert c._tables["request"].hosts == {}
+        assert _names(c.matching("request", "http://b.com/admin", "GET", None)) == [patterns[0], patterns[3]]
+        assert _names(c.matching("request", "http://example.community/", "GET", None)) == [patterns[1]]
+        assert _names(c.matching("request", "http://x.orgy", "GET", None)) == [patterns[2]]
+    # alternância dentro de grupo ou classe não impede o índice por host
+    c = Ruleset(rules=[{"name": "h", "on": "request", "match": {"url_regex": "^https://a\\.com/(x|y)[|]"},
+                        "action": {}}]).compile()
+    assert list(c._tables["request"].hosts) == ["a.com"]
@@ -0,0 +1,51 @@
+from lokiproxy.core.flows import LRUFlows
+from lokiproxy.core.search import SearchIndex
+
+
+def _index(store=None):
+    store = LRUFlows() if store is None else store
+    index = SearchIndex()
+    index.start()
+    specs = [
+        ("api.example.com", "/users", [("Authorization", "Bearer tok_live_42")], b'{"user": "alice"}'),
+        ("api.example.com", "/orders", [], b'{"user": "bob", "note": "alice alice alice"}'),
+        ("cdn.example.com", "/alice.png", [], b""),
+    ]
+    for host, path, headers, body in specs:
+        f = store.new_flow()
+        f.method, f.host, f.path = "GET", host, path
+        f.request.headers = headers
+        f.response.body = body
+        index.submit(f)
+    assert index.wait_idle(5)
+    return index, store
+
+
+def test_search_ranks_and_requires_all_terms():
+    index, _ = _index()
+    try:
+        ids = [fid for fid, _ in index.search("alice")]
+        # URL pesa mais que corpo; o termo repetido no corpo fica à frente da ocorrência única
+        assert ids == [3, 2, 1]
+        assert [fid for fid, _ in index.search("alice user")] == [2, 1]
+        assert [fid for fid, _ in index.search("tok_live_42")] == [1]
+        assert index.search("BEARER api.example.com") == index.search("bearer api.example.com")
+        assert index.search("alice missing") == []
+        assert index.search("  ") == []
+    finally:
+        index.close()
+
+
+def test_removed_and_evicted_flows_leave_the_index():
+    store = LRUFlows(capacity=3)
+    index, store = _index(store)
+    store.on_evict(lambda flow: index.remove(flow.id))
+    try:
+        index.remove(2)
+        store.new_flow()  # expulsa o flow 1
+        assert index.wait_idle(5)
+        assert [fid for fid, _ in index.search("alice")] == [3]
+        assert index.stats.indexed == 1
+        assert index.search("bob") == []
+    finally:
+        index.close()
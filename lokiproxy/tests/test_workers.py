@@ -0,0 +1,52 @@
+import asyncio
+from lokiproxy.core.bus import EventBus, APPLY_RULES, FLOW_BATCH, LOG_MESSAGE
+from lokiproxy.core.workers import WorkerPool
+
+MOCK = {"rules": [{"name": "mock", "on": "request", "match": {},
+                   "action": {"mock_response": {"status": 200, "headers": {"X-Test": "1"}, "body": "ok"}}}]}
+
+
+def test_worker_pool_shares_port_and_merges_flows():
+    async def main():
+        bus = EventBus(batch_interval=0.01)
+        pool = WorkerPool(2, bus, port=0, search_index=False)
+        bus.proxy = pool
+        await pool.start()
+        events = bus.subscribe_gui()
+        try:
+            # as regras chegam a todos os workers
+            await bus.send_gui_cmd(APPLY_RULES, {"ruleset": MOCK})
+            applied = 0
+            while applied < 2:
+                ev = await asyncio.wait_for(events.__anext__(), 10)
+                applied += ev.type == LOG_MESSAGE and "Applied 1 rule" in ev.data["msg"]
+
+            for i in range(12):
+                r, w = await asyncio.open_connection("127.0.0.1", pool.port)
+                w.write(b"GET http://example.invalid/%d HTTP/1.1\r\nHost: example.invalid\r\n"
+                        b"Connection: close\r\n\r\n" % i)
+                assert (await asyncio.wait_for(r.read(), 5)).endswith(b"\r\n\r\nok")
+                w.close()
+
+            finished = set()
+            while len(finished) < 12:
+                ev = await asyncio.wait_for(events.__anext__(), 10)
+                if ev.type == FLOW_BATCH:
+                    finished.update(ev.data["finished"])
+            ids = [f.id for f in pool.flows]
+            assert len(ids) == len(set(ids)) == len(pool.flows) == 12
+            assert ids == sorted(ids) and set(ids) == finished
+            flow = await pool.flows.fetch(ids[-1])
+            assert flow.response.body == b"ok" and flow.method == "GET"
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+
+def test_worker_opts_split_per_worker_paths():
+    pool = WorkerPool(2, EventBus(), port=0, capture_path="c.loki", body_store_dir="bodies")
+    opts = [pool._worker_opts(i) for i in range(2)]
+    assert [o["capture_path"] for o in opts] == ["c.loki.0", "c.loki.1"]
+    assert [o["body_store_dir"] for o in opts] == ["bodies.0", "bodies.1"]
+    assert [o["flow_id_start"] for o in opts] == [1, 2]